@@ -0,0 +1 @@
+"""Provides benchmarks for the extraction"""
@@ -0,0 +1,198 @@
+"""
+Benchmarks the extraction stages on the sample config files, as standard workloads against a
+(synthetic) MIMIC-IV database. For every config, the cohort, case attributes, events, event
+attributes and the xes export are timed, reporting wall-clock time, rows, rows/s and the peak
+resident memory of every stage.
+
+    python -m benchmarks.synthetic_mimic --db_name mimic_bench --patients 1000 --replace
+    python -m benchmarks.extraction_stages --db_name mimic_bench --report output/bench.json
+"""
+import argparse
+from functools import partial
+import glob
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import pandas as pd
+import yaml
+from psycopg2.extensions import cursor
+
+import extract_log
+from extractor.cli_helper import create_db_connection, parse_or_ask_case_attributes,\
+    parse_or_ask_case_notion, parse_or_ask_cohorts, parse_or_ask_event_type,\
+    parse_or_ask_low_level_tables
+from extractor.cohort import extract_cohort
+from extractor.constants import OTHER_EVENT_TYPE
+from extractor.event_attributes import extract_event_attribute_specs
+from extractor.pipeline import ExtractionSettings, build_extraction_stages, get_case_id_key
+from extractor.tables import ask_activity_and_time
+from extractor.xes_writer import XesWriter
+
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def get_rss_bytes() -> int:
+    """Provides the current resident memory of the process"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # peak of the whole process, where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemorySampler:
+    """Samples the resident memory in a background thread, to determine the peak of a stage"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self) -> None:
+        """Samples until stopped"""
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, get_rss_bytes())
+            self.stopped.wait(self.interval)
+
+    def __enter__(self) -> "PeakMemorySampler":
+        self.peak = get_rss_bytes()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, get_rss_bytes())
+
+
+def run_stage(results: List[dict], workload: str, stage: str,
+              function: Callable[[], Any]) -> Any:
+    """Runs a stage, appends its measurements to the results and returns its result"""
+    with PeakMemorySampler() as sampler:
+        start = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - start
+    rows = len(result) if isinstance(result, pd.DataFrame) else None
+    results.append({"workload": workload, "stage": stage, "seconds": seconds, "rows": rows,
+                    "rows_per_second": rows / seconds if rows is not None and seconds > 0
+                                       else None,
+                    "peak_rss_mb": sampler.peak / 2**20})
+    return result
+
+
+def get_workload_settings(db_cursor: cursor, config: dict,
+                          db_settings) -> ExtractionSettings:
+    """Provides the extraction settings of a config, like extract_log does without prompts"""
+    args = extract_log.parser.parse_args([])
+    case_notion = parse_or_ask_case_notion(args, config)
+    event_type = parse_or_ask_event_type(args, config)
+    tables_to_extract = None
+    tables_activities = None
+    tables_timestamps = None
+    if event_type == OTHER_EVENT_TYPE:
+        tables_to_extract = parse_or_ask_low_level_tables(args, config)
+        tables_activities = config.get("low_level_activities")
+        tables_timestamps = config.get("low_level_timestamps")
+        if tables_activities is None and tables_timestamps is None:
+            chosen_activity_time = ask_activity_and_time(db_cursor, tables_to_extract,
+                                                         None, None)
+            tables_activities = [chosen_activity_time[table][0] for table in tables_to_extract]
+            tables_timestamps = [chosen_activity_time[table][1] for table in tables_to_extract]
+    return ExtractionSettings(
+        db_settings=db_settings, case_notion=case_notion,
+        case_attribute_list=parse_or_ask_case_attributes(args, case_notion, config),
+        event_type=event_type, include_medications=bool(config.get("include_medications")),
+        tables_to_extract=tables_to_extract, tables_activities=tables_activities,
+        tables_timestamps=tables_timestamps,
+        additional_attributes=config.get("additional_event_attributes") or [])
+
+
+def run_workload(db_cursor: cursor, workload: str, config: dict, db_settings) -> List[dict]:
+    """Runs the extraction of a config stage by stage"""
+    results: List[dict] = []
+    args = extract_log.parser.parse_args([])
+    cohort_parameters = parse_or_ask_cohorts(args, config)[:7]
+    settings = get_workload_settings(db_cursor, config, db_settings)
+
+    cohort = run_stage(results, workload, "extract_cohort",
+                       lambda: extract_cohort(db_cursor, *cohort_parameters, False))
+    stage_results = {}
+    for stage_name, stage in build_extraction_stages(cohort, settings).items():
+        stage_label = "extract_" + settings.event_type.lower() + "_events" \
+            if stage_name == "events" else "extract_" + str(stage_name)
+        stage_results[stage_name] = run_stage(results, workload, stage_label,
+                                              partial(stage, db_cursor))
+    events = run_stage(results, workload, "extract_event_attributes",
+                       lambda: extract_event_attribute_specs(
+                           db_cursor, stage_results["events"],
+                           settings.additional_attributes))  # type: ignore
+
+    case_id_key = get_case_id_key(settings.case_notion)
+    if settings.case_attribute_list is not None:
+        events = events.merge(stage_results["case_attributes"], on=case_id_key, how="left")
+        events = events.rename(columns={column: "case:" + column for column in
+                                        settings.case_attribute_list + [case_id_key]})
+        case_id_key = "case:" + case_id_key
+
+    def export_xes() -> pd.DataFrame:
+        with tempfile.TemporaryDirectory() as xes_dir:
+            with XesWriter(os.path.join(xes_dir, "event_log.xes")) as writer:
+                writer.write_events(events, case_id_key)
+        return events
+    run_stage(results, workload, "export_xes", export_xes)
+    return results
+
+
+def print_results(results: List[dict]) -> None:
+    """Prints the measurements of all workloads as table"""
+    print("%-28s %-32s %10s %10s %12s %10s" % ("workload", "stage", "seconds", "rows",
+                                               "rows/s", "peak MB"))
+    for result in results:
+        print("%-28s %-32s %10.3f %10s %12s %10.1f" % (
+            result["workload"], result["stage"], result["seconds"],
+            "" if result["rows"] is None else result["rows"],
+            "" if result["rows_per_second"] is None else "%.0f" % result["rows_per_second"],
+            result["peak_rss_mb"]))
+
+
+def main():
+    """Runs the extraction stages of the sample configs against a database"""
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the extraction stages on the sample config files.')
+    parser.add_argument('--db_name', type=str, required=True)
+    parser.add_argument('--db_host', type=str, default='localhost')
+    parser.add_argument('--db_user', type=str, default='postgres')
+    parser.add_argument('--db_pw', type=str, default='')
+    parser.add_argument('--configs', type=str, nargs='+',
+                        default=sorted(glob.glob("sample_config_files/*.yml")),
+                        help="Config files to run as workloads (default: all sample configs)")
+    parser.add_argument('--report', type=str, help="Path of a json report of all measurements")
+    args = parser.parse_args()
+
+    db_settings = (args.db_name, args.db_host, args.db_user, args.db_pw)
+    db_connection = create_db_connection(*db_settings)
+    results: List[dict] = []
+    for config_path in args.configs:
+        with open(config_path, 'r', encoding='utf-8') as file:
+            config: Optional[Dict[str, Any]] = yaml.safe_load(file)
+        workload = os.path.splitext(os.path.basename(config_path))[0]
+        with db_connection.cursor() as db_cursor:
+            results += run_workload(db_cursor, workload, config or {}, db_settings)
+        db_connection.rollback()
+    db_connection.close()
+
+    print_results(results)
+    if args.report is not None:
+        with open(args.report, 'w', encoding='utf-8') as report:
+            json.dump(results, report, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmarks the vectorized interval join of event attributes against the SQLite based join.
+
+    python -m benchmarks.interval_join --cases 500 --events_per_case 10 --attributes_per_case 200
+"""
+import argparse
+import time
+from typing import Callable, Tuple
+import numpy as np
+import pandas as pd
+
+from extractor.extraction_helper import (join_event_attributes_with_log_events,
+                                         join_event_attributes_with_log_events_sqlite)
+
+
+def generate_data(cases: int, events_per_case: int, attributes_per_case: int,
+                  seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Generates a transfer-like log and labevents-like event attributes"""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2150-01-01")
+    hadm_ids = np.repeat(np.arange(cases) + 20000000, events_per_case)
+    intimes = start + pd.to_timedelta(rng.integers(0, 60 * 24 * 30, len(hadm_ids)),  # type: ignore
+                                      unit="m")
+    outtimes = intimes + pd.to_timedelta(rng.integers(0, 60 * 24 * 3,  # type: ignore
+                                                      len(hadm_ids)), unit="m")
+    log = pd.DataFrame({"hadm_id": hadm_ids, "subject_id": hadm_ids - 10000000,
+                        "concept:name": rng.choice(["ICU", "Ward", "ED"], len(hadm_ids)),
+                        "time:timestamp": intimes.floor("s"), "outtime": outtimes.floor("s")})
+
+    attribute_ids = np.repeat(np.arange(cases) + 20000000, attributes_per_case)
+    charttimes = start + pd.to_timedelta(rng.integers(0, 60 * 24 * 33,  # type: ignore
+                                                      len(attribute_ids)), unit="m")
+    event_attributes = pd.DataFrame({"hadm_id": attribute_ids,
+                                     "subject_id": attribute_ids - 10000000,
+                                     "charttime": charttimes.floor("s"),
+                                     "label": rng.choice(["Glucose", "Sodium"],
+                                                         len(attribute_ids)),
+                                     "valuenum": rng.normal(100, 10, len(attribute_ids))})
+    event_attributes = event_attributes.sort_values(["hadm_id", "charttime"])
+    return log, event_attributes
+
+
+def time_join(join: Callable, log: pd.DataFrame,
+              event_attributes: pd.DataFrame) -> Tuple[float, pd.DataFrame]:
+    """Runs a join implementation and measures its wall-clock time"""
+    start = time.perf_counter()
+    joined_df = join(log, event_attributes, "hadm_id", "charttime", "time:timestamp", "outtime")
+    return time.perf_counter() - start, joined_df
+
+
+def normalize(joined_df: pd.DataFrame) -> pd.DataFrame:
+    """Brings a join result into a comparable form"""
+    joined_df = joined_df.copy()
+    for col in ["charttime", "time:timestamp", "outtime"]:
+        joined_df[col] = pd.to_datetime(joined_df[col])
+    joined_df = joined_df[sorted(joined_df.columns)]
+    joined_df = joined_df.sort_values(list(joined_df.columns)).reset_index(drop=True)
+    return joined_df
+
+
+def main():
+    """Runs the interval join benchmark"""
+    parser = argparse.ArgumentParser(description='Benchmark of the event attribute join.')
+    parser.add_argument('--cases', type=int, default=500)
+    parser.add_argument('--events_per_case', type=int, default=10)
+    parser.add_argument('--attributes_per_case', type=int, default=200)
+    args = parser.parse_args()
+
+    log, event_attributes = generate_data(args.cases, args.events_per_case,
+                                          args.attributes_per_case)
+    vectorized_time, vectorized_df = time_join(join_event_attributes_with_log_events,
+                                               log, event_attributes)
+    sqlite_time, sqlite_df = time_join(join_event_attributes_with_log_events_sqlite,
+                                       log, event_attributes)
+    pd.testing.assert_frame_equal(normalize(vectorized_df), normalize(sqlite_df),
+                                  check_dtype=False)
+
+    print("log events: %d, event attributes: %d, joined rows: %d" %
+          (len(log), len(event_attributes), len(vectorized_df)))
+    print("sqlite join:     %.3fs" % sqlite_time)
+    print("vectorized join: %.3fs" % vectorized_time)
+    print("speedup:         %.1fx" % (sqlite_time / vectorized_time))
+
+
+if __name__ == '__main__':
+    main()
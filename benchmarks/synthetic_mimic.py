@@ -0,0 +1,687 @@
+"""
+Generates a synthetic, MIMIC-IV shaped database for benchmarking the extraction, without
+access to MIMIC. Fills the mimic_core, mimic_hosp, mimic_icu and mimic_ed tables read by the
+extractor with random data, whose codes, labels and medications match the sample configs.
+
+    python -m benchmarks.synthetic_mimic --db_name mimic_bench --db_host localhost \
+        --db_user postgres --db_pw postgres --patients 1000 --replace
+"""
+import argparse
+import io
+import time
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import cursor
+
+from extractor.cli_helper import create_db_connection
+
+
+schemas = ["mimic_core", "mimic_hosp", "mimic_icu", "mimic_ed"]
+
+table_definitions = {
+    "mimic_core.patients": """subject_id integer not null, gender varchar(1),
+        anchor_age smallint, anchor_year smallint, anchor_year_group varchar(20), dod date""",
+    "mimic_core.admissions": """subject_id integer not null, hadm_id integer not null,
+        admittime timestamp, dischtime timestamp, deathtime timestamp,
+        admission_type varchar(40), admission_location varchar(60),
+        discharge_location varchar(60), insurance varchar(255), language varchar(10),
+        marital_status varchar(30), ethnicity varchar(80), edregtime timestamp,
+        edouttime timestamp, hospital_expire_flag smallint""",
+    "mimic_core.transfers": """subject_id integer not null, hadm_id integer,
+        transfer_id integer not null, eventtype varchar(10), careunit varchar(255),
+        intime timestamp, outtime timestamp""",
+    "mimic_hosp.d_icd_diagnoses": """icd_code char(7), icd_version smallint,
+        long_title varchar(255)""",
+    "mimic_hosp.d_icd_procedures": """icd_code char(7), icd_version smallint,
+        long_title varchar(222)""",
+    "mimic_hosp.d_labitems": """itemid integer, label varchar(50), fluid varchar(50),
+        category varchar(50), loinc_code varchar(50)""",
+    "mimic_hosp.d_hcpcs": """code char(5), category smallint, long_description text,
+        short_description varchar(180)""",
+    "mimic_hosp.diagnoses_icd": """subject_id integer, hadm_id integer, seq_num integer,
+        icd_code char(7), icd_version smallint""",
+    "mimic_hosp.procedures_icd": """subject_id integer, hadm_id integer, seq_num integer,
+        chartdate date, icd_code char(7), icd_version smallint""",
+    "mimic_hosp.drgcodes": """subject_id integer, hadm_id integer, drg_type varchar(4),
+        drg_code varchar(10), description varchar(195), drg_severity smallint,
+        drg_mortality smallint""",
+    "mimic_hosp.hcpcsevents": """subject_id integer, hadm_id integer, chartdate date,
+        hcpcs_cd char(5), seq_num integer, short_description varchar(180)""",
+    "mimic_hosp.services": """subject_id integer, hadm_id integer, transfertime timestamp,
+        prev_service varchar(10), curr_service varchar(10)""",
+    "mimic_hosp.labevents": """labevent_id integer, subject_id integer, hadm_id integer,
+        specimen_id integer, itemid integer, charttime timestamp, storetime timestamp,
+        value varchar(200), valuenum double precision, valueuom varchar(20),
+        ref_range_lower double precision, ref_range_upper double precision,
+        flag varchar(10), priority varchar(7), comments text""",
+    "mimic_hosp.microbiologyevents": """microevent_id integer, subject_id integer,
+        hadm_id integer, micro_specimen_id integer, chartdate timestamp, charttime timestamp,
+        spec_itemid integer, spec_type_desc varchar(100), test_seq integer,
+        storedate timestamp, storetime timestamp, test_itemid integer,
+        test_name varchar(100), org_itemid integer, org_name varchar(100),
+        interpretation varchar(5), comments text""",
+    "mimic_hosp.poe": """poe_id varchar(25), poe_seq integer, subject_id integer,
+        hadm_id integer, ordertime timestamp, order_type varchar(25),
+        order_subtype varchar(50), transaction_type varchar(15),
+        discontinue_of_poe_id varchar(25), discontinued_by_poe_id varchar(25),
+        order_status varchar(15)""",
+    "mimic_hosp.poe_detail": """poe_id varchar(25), poe_seq integer, subject_id integer,
+        field_name varchar(255), field_value text""",
+    "mimic_hosp.pharmacy": """subject_id integer, hadm_id integer, pharmacy_id integer,
+        poe_id varchar(25), starttime timestamp, stoptime timestamp, medication text,
+        proc_type varchar(50), status varchar(50), entertime timestamp,
+        verifiedtime timestamp, route varchar(50), frequency varchar(50),
+        disp_sched varchar(255), infusion_type varchar(15), duration real,
+        duration_interval varchar(50), dispensation varchar(50), fill_quantity varchar(50)""",
+    "mimic_hosp.prescriptions": """subject_id integer, hadm_id integer, pharmacy_id integer,
+        starttime timestamp, stoptime timestamp, drug_type varchar(20), drug varchar(255),
+        gsn varchar(255), ndc varchar(25), prod_strength varchar(255), form_rx varchar(25),
+        dose_val_rx varchar(100), dose_unit_rx varchar(50), form_val_disp varchar(50),
+        form_unit_disp varchar(50), doses_per_24_hrs real, route varchar(50)""",
+    "mimic_hosp.emar": """subject_id integer, hadm_id integer, emar_id varchar(25),
+        emar_seq integer, poe_id varchar(25), pharmacy_id integer, charttime timestamp,
+        medication text, event_txt varchar(100), scheduletime timestamp,
+        storetime timestamp""",
+    "mimic_hosp.emar_detail": """subject_id integer, emar_id varchar(25), emar_seq integer,
+        parent_field_ordinal varchar(10), administration_type varchar(50),
+        pharmacy_id integer, dose_due varchar(50), dose_given varchar(255),
+        dose_given_unit varchar(50), product_description varchar(255),
+        route varchar(10)""",
+    "mimic_icu.d_items": """itemid integer, label varchar(100), abbreviation varchar(50),
+        linksto varchar(50), category varchar(50), unitname varchar(100),
+        param_type varchar(30), lownormalvalue double precision,
+        highnormalvalue double precision""",
+    "mimic_icu.icustays": """subject_id integer, hadm_id integer, stay_id integer,
+        first_careunit varchar(255), last_careunit varchar(255), intime timestamp,
+        outtime timestamp, los double precision""",
+    "mimic_icu.chartevents": """subject_id integer, hadm_id integer, stay_id integer,
+        charttime timestamp, storetime timestamp, itemid integer, value varchar(200),
+        valuenum double precision, valueuom varchar(20), warning smallint""",
+    "mimic_icu.datetimeevents": """subject_id integer, hadm_id integer, stay_id integer,
+        charttime timestamp, storetime timestamp, itemid integer, value timestamp,
+        valueuom varchar(20), warning smallint""",
+    "mimic_icu.inputevents": """subject_id integer, hadm_id integer, stay_id integer,
+        starttime timestamp, endtime timestamp, storetime timestamp, itemid integer,
+        amount double precision, amountuom varchar(30), rate double precision,
+        rateuom varchar(30), orderid integer, linkorderid integer,
+        ordercategoryname varchar(100), secondaryordercategoryname varchar(100),
+        ordercomponenttypedescription varchar(200), ordercategorydescription varchar(50),
+        patientweight double precision, totalamount double precision,
+        totalamountuom varchar(50), isopenbag smallint, continueinnextdept smallint,
+        cancelreason smallint, statusdescription varchar(20),
+        originalamount double precision, originalrate double precision""",
+    "mimic_icu.outputevents": """subject_id integer, hadm_id integer, stay_id integer,
+        charttime timestamp, storetime timestamp, itemid integer, value double precision,
+        valueuom varchar(30)""",
+    "mimic_icu.procedureevents": """subject_id integer, hadm_id integer, stay_id integer,
+        starttime timestamp, endtime timestamp, storetime timestamp, itemid integer,
+        value double precision, valueuom varchar(30), location varchar(30),
+        locationcategory varchar(30), orderid integer, linkorderid integer,
+        ordercategoryname varchar(100), secondaryordercategoryname varchar(100),
+        ordercategorydescription varchar(50), patientweight double precision,
+        totalamount double precision, totalamountuom varchar(50), isopenbag smallint,
+        continueinnextdept smallint, cancelreason smallint, statusdescription varchar(20),
+        originalamount double precision, originalrate double precision""",
+    "mimic_ed.edstays": """subject_id integer, hadm_id integer, stay_id integer,
+        intime timestamp, outtime timestamp, gender varchar(1), race varchar(60),
+        arrival_transport varchar(50), disposition varchar(255)""",
+    "mimic_ed.triage": """subject_id integer, stay_id integer, temperature numeric,
+        heartrate numeric, resprate numeric, o2sat numeric, sbp numeric, dbp numeric,
+        pain text, acuity numeric, chiefcomplaint varchar(255)""",
+    "mimic_ed.vitalsign": """subject_id integer, stay_id integer, charttime timestamp,
+        temperature numeric, heartrate numeric, resprate numeric, o2sat numeric,
+        sbp integer, dbp integer, rhythm text, pain text""",
+    "mimic_ed.diagnosis": """subject_id integer, stay_id integer, seq_num integer,
+        icd_code varchar(8), icd_version integer, icd_title text""",
+}
+
+# Codes and labels of the sample configs, which are drawn more often than others
+icd9_codes = ["42821", "42823", "42831", "42833", "42841", "42843", "1539", "1629", "1749",
+              "1850", "2000", "2049", "2119", "2330", "2382", "2396", "4019", "25000",
+              "5849", "2724", "41401", "5990", "2859", "53081"]
+icd10_codes = ["I5021", "I5023", "I5031", "I5033", "I5041", "I5042", "I5043", "I5811",
+               "I5813", "E119", "E1122", "E1165", "E1140", "E1151", "E11319", "E1142",
+               "E1121", "E11649", "I10", "N179", "E785", "J449", "C3490", "Z7901"]
+procedure_codes = ["3995", "9904", "3893", "0040", "5491", "02HV33Z", "5A1955Z", "0BH17EZ"]
+drg_codes = ["194", "190", "720", "140", "460", "201", "383"]
+lab_labels = ["Glucose", "Potassium", "Sodium", "Chloride", "Creatinine", "Urea Nitrogen",
+              "Bicarbonate", "Anion Gap", "Magnesium", "Phosphate", "Calcium, Total",
+              "Hematocrit", "Hemoglobin", "Platelet Count", "White Blood Cells", "MCV",
+              "MCHC", "MCH", "Red Blood Cells", "RDW", "PTT", "INR(PT)", "PT", "pH",
+              "RDW-SD", "pO2"]
+chart_labels = ["Non Invasive Blood Pressure diastolic", "Non Invasive Blood Pressure systolic",
+                "Heart Rate", "Temperature Fahrenheit", "O2 saturation pulseoxymetry",
+                "Respiratory Rate", "GCS - Eye Opening", "GCS - Verbal Response",
+                "GCS - Motor Response"]
+datetime_labels = ["Last dialysis", "INV Line Insertion Date", "Cath Lab Date"]
+output_labels = ["Foley", "Void", "Chest Tube #1", "Stool"]
+input_labels = ["NaCl 0.9%", "Dextrose 5%", "Propofol", "Norepinephrine", "Heparin Sodium"]
+procedure_labels = ["Chest X-Ray", "EKG", "Arterial Line", "Intubation", "Ultrasound"]
+item_categories = ["Routine Vital Signs", "Labs", "Fluids/Intake", "Medications",
+                   "Procedures", "Output"]
+order_categories = ["Continuous Med", "Drug Push", "Ventilation", "Imaging", "Invasive Lines"]
+medications = ["Furosemide", "Metoprolol Tartrate", "Heparin", "Insulin", "Lisinopril",
+               "Aspirin", "Atorvastatin", "Potassium Chloride", "Acetaminophen",
+               "Sodium Chloride 0.9%  Flush"]
+careunits = ["Emergency Department", "Medicine", "Cardiac Vascular Intensive Care Unit (CVICU)",
+             "Medical Intensive Care Unit (MICU)", "Med/Surg", "Coronary Care Unit (CCU)",
+             "Surgical Intensive Care Unit (SICU)", "Vascular"]
+icu_careunits = careunits[2:4] + careunits[5:7]
+microbiology_tests = ["Blood Culture, Routine", "URINE CULTURE", "MRSA SCREEN",
+                      "GRAM STAIN", "C. difficile PCR"]
+poe_types = {"Medications": ["Medications"], "Lab": ["Lab"], "General Care": ["Vitals/Monitoring",
+             "Activity", "Nutrition"], "Radiology": ["Chest X-ray", "CT scan"],
+             "ADT orders": ["Admit", "Transfer", "Discharge"], "Cardiology": ["ECG"]}
+services = ["MED", "CMED", "SURG", "CSURG", "NMED", "ORTHO"]
+
+# Mean number of rows per admission of event tables
+rows_per_admission = {"transfers": 4, "diagnoses_icd": 10, "procedures_icd": 3,
+                      "hcpcsevents": 2, "services": 1.5, "labevents": 150,
+                      "microbiologyevents": 5, "poe": 60, "pharmacy": 15, "emar": 40,
+                      "chartevents": 400, "datetimeevents": 10, "inputevents": 30,
+                      "outputevents": 20, "procedureevents": 5, "vitalsign": 6}
+
+
+class TableGenerator:
+    """Generates the tables of a synthetic MIMIC-IV database"""
+
+    def __init__(self, patients: int, density: float, seed: int):
+        self.patients = patients
+        self.density = density
+        self.rng = np.random.default_rng(seed)
+        self.tables: Dict[str, pd.DataFrame] = {}
+
+    def choice(self, values: List, size: int, skew: float = 1.0) -> np.ndarray:
+        """Draws values, the first ones more often the larger skew is"""
+        weights = np.arange(len(values), 0, -1, dtype=float) ** skew
+        return self.rng.choice(np.array(values, dtype=object), size, p=weights / weights.sum())
+
+    def sample_rows(self, parents: pd.DataFrame, table: str) -> pd.DataFrame:
+        """Repeats every parent row a Poisson distributed number of times"""
+        counts = self.rng.poisson(rows_per_admission[table] * self.density, len(parents))
+        return parents.loc[parents.index.repeat(counts)].reset_index(drop=True)  # type: ignore
+
+    def sample_times(self, starts: pd.Series, ends: pd.Series) -> pd.Series:
+        """Draws times uniformly between the start and end times, rounded to minutes"""
+        durations = (ends - starts).to_numpy(  # type: ignore
+            dtype="timedelta64[s]").astype(np.int64)
+        offsets = (self.rng.random(len(starts)) *  # type: ignore
+                   np.maximum(durations, 1)).astype(np.int64)
+        return (starts + pd.to_timedelta(offsets, unit="s")).dt.floor("min")
+
+    def add_minutes(self, times: pd.Series, maximum: int) -> pd.Series:
+        """Adds a random number of minutes up to maximum"""
+        minutes = self.rng.integers(1, maximum, len(times))  # type: ignore
+        return times + pd.to_timedelta(minutes, unit="min")
+
+    def generate(self) -> Dict[str, pd.DataFrame]:
+        """Generates all tables"""
+        self.generate_core()
+        self.generate_dictionaries()
+        self.generate_hosp()
+        self.generate_poe_and_medications()
+        self.generate_icu()
+        self.generate_ed()
+        return self.tables
+
+    def generate_core(self) -> None:
+        """Generates patients, admissions and transfers"""
+        rng = self.rng
+        subject_ids = np.arange(self.patients) + 10000000
+        anchor_years = rng.integers(2110, 2190, self.patients)  # type: ignore
+        self.tables["mimic_core.patients"] = pd.DataFrame({
+            "subject_id": subject_ids, "gender": rng.choice(["F", "M"], self.patients),
+            "anchor_age": rng.integers(18, 91, self.patients),  # type: ignore
+            "anchor_year": anchor_years,
+            "anchor_year_group": self.choice(["2008 - 2010", "2011 - 2013", "2014 - 2016",
+                                              "2017 - 2019"], self.patients, 0),
+            "dod": pd.NaT})
+
+        admission_counts = rng.integers(1, 4, self.patients)  # type: ignore
+        admission_subjects = np.repeat(subject_ids, admission_counts)
+        count = len(admission_subjects)
+        admittimes = pd.Series(pd.to_datetime(np.repeat(anchor_years, admission_counts)
+                                              .astype(str), format="%Y")) + \
+            pd.to_timedelta(rng.integers(0, 3 * 365 * 24 * 60, count), unit="min")  # type: ignore
+        dischtimes = self.add_minutes(admittimes, 14 * 24 * 60)
+        died = rng.random(count) < 0.05  # type: ignore
+        ed_visit = rng.random(count) < 0.6  # type: ignore
+        edregtimes = admittimes - pd.to_timedelta(rng.integers(60, 600, count),  # type: ignore
+                                                  unit="min")
+        admissions = pd.DataFrame({
+            "subject_id": admission_subjects, "hadm_id": np.arange(count) + 20000000,
+            "admittime": admittimes, "dischtime": dischtimes,
+            "deathtime": dischtimes.where(died),
+            "admission_type": self.choice(["EW EMER.", "URGENT", "ELECTIVE", "OBSERVATION ADMIT",
+                                           "DIRECT EMER."], count),
+            "admission_location": self.choice(["EMERGENCY ROOM", "PHYSICIAN REFERRAL",
+                                               "TRANSFER FROM HOSPITAL", "WALK-IN/SELF REFERRAL"],
+                                              count),
+            "discharge_location": self.choice(["HOME", "HOME HEALTH CARE",
+                                               "SKILLED NURSING FACILITY", "REHAB", "DIED"],
+                                              count),
+            "insurance": self.choice(["Other", "Medicare", "Medicaid"], count),
+            "language": self.choice(["ENGLISH", "?"], count, 3),
+            "marital_status": self.choice(["MARRIED", "SINGLE", "WIDOWED", "DIVORCED"], count),
+            "ethnicity": self.choice(["WHITE", "BLACK/AFRICAN AMERICAN", "HISPANIC/LATINO",
+                                      "ASIAN", "OTHER", "UNKNOWN"], count, 2),
+            "edregtime": edregtimes.where(ed_visit),
+            "edouttime": admittimes.where(ed_visit),
+            "hospital_expire_flag": died.astype(int)})
+        self.tables["mimic_core.admissions"] = admissions
+
+        transfers = self.sample_rows(admissions, "transfers")
+        transfers["intime"] = self.sample_times(transfers["admittime"], transfers["dischtime"])
+        transfers = transfers.sort_values(["hadm_id", "intime"], ignore_index=True)  # type: ignore
+        next_intime = transfers.groupby("hadm_id")["intime"].shift(-1)  # type: ignore
+        transfers["outtime"] = next_intime.fillna(transfers["dischtime"])
+        transfers["eventtype"] = "transfer"
+        first = ~transfers["hadm_id"].duplicated()
+        transfers.loc[first, "eventtype"] = "admit"  # type: ignore
+        transfers["careunit"] = self.choice(careunits, len(transfers))
+        discharges = admissions.assign(eventtype="discharge", careunit=None,
+                                       intime=admissions["dischtime"], outtime=pd.NaT)
+        transfers = pd.concat([transfers, discharges], ignore_index=True)
+        transfers = transfers.sort_values(["hadm_id", "intime"], ignore_index=True)  # type: ignore
+        transfers["transfer_id"] = np.arange(len(transfers)) + 30000000
+        self.tables["mimic_core.transfers"] = transfers[
+            ["subject_id", "hadm_id", "transfer_id", "eventtype", "careunit", "intime",
+             "outtime"]]
+
+    def generate_dictionaries(self) -> None:
+        """Generates the dictionary tables"""
+        self.tables["mimic_hosp.d_icd_diagnoses"] = pd.DataFrame(
+            {"icd_code": icd9_codes + icd10_codes,
+             "icd_version": [9] * len(icd9_codes) + [10] * len(icd10_codes),
+             "long_title": ["Diagnosis " + code for code in icd9_codes + icd10_codes]})
+        self.tables["mimic_hosp.d_icd_procedures"] = pd.DataFrame(
+            {"icd_code": procedure_codes,
+             "icd_version": [9 if len(code) == 4 else 10 for code in procedure_codes],
+             "long_title": ["Procedure " + code for code in procedure_codes]})
+        self.tables["mimic_hosp.d_labitems"] = pd.DataFrame(
+            {"itemid": np.arange(len(lab_labels)) + 50800, "label": lab_labels,
+             "fluid": "Blood", "category": "Chemistry", "loinc_code": None})  # type: ignore
+        self.tables["mimic_hosp.d_hcpcs"] = pd.DataFrame(
+            {"code": ["99223", "99232", "93010", "71045"], "category": 1,  # type: ignore
+             "long_description": None,  # type: ignore
+             "short_description": ["Initial hospital care", "Subsequent hospital care",
+                                   "Electrocardiogram report", "X-ray exam chest"]})
+        item_groups = [("chartevents", chart_labels, 220000), ("datetimeevents", datetime_labels,
+                                                                 224000),
+                       ("inputevents", input_labels, 225000),
+                       ("outputevents", output_labels, 226000),
+                       ("procedureevents", procedure_labels, 227000)]
+        self.tables["mimic_icu.d_items"] = pd.concat([pd.DataFrame(  # type: ignore
+            {"itemid": np.arange(len(labels)) + first_itemid, "label": labels,
+             "abbreviation": labels, "linksto": linksto,
+             "category": self.choice(item_categories, len(labels)),
+             "unitname": None, "param_type": "Numeric",  # type: ignore
+             "lownormalvalue": None, "highnormalvalue": None})  # type: ignore
+            for linksto, labels, first_itemid in item_groups], ignore_index=True)
+
+    def generate_hosp(self) -> None:
+        """Generates the diagnoses, procedures, drg codes, services, labs and microbiology"""
+        rng = self.rng
+        admissions = self.tables["mimic_core.admissions"]
+        diagnoses = self.sample_rows(admissions, "diagnoses_icd")
+        diagnoses["seq_num"] = diagnoses.groupby("hadm_id").cumcount() + 1  # type: ignore
+        version_10 = (diagnoses["hadm_id"] % 2 == 0).to_numpy()
+        diagnoses["icd_version"] = np.where(version_10, 10, 9)
+        diagnoses["icd_code"] = np.where(version_10, self.choice(icd10_codes, len(diagnoses)),
+                                         self.choice(icd9_codes, len(diagnoses)))
+        self.tables["mimic_hosp.diagnoses_icd"] = diagnoses[
+            ["subject_id", "hadm_id", "seq_num", "icd_code", "icd_version"]]
+
+        procedures = self.sample_rows(admissions, "procedures_icd")
+        procedures["seq_num"] = procedures.groupby("hadm_id").cumcount() + 1  # type: ignore
+        procedures["chartdate"] = self.sample_times(procedures["admittime"],  # type: ignore
+                                                    procedures["dischtime"]).dt.date
+        procedures["icd_code"] = self.choice(procedure_codes, len(procedures))
+        procedures["icd_version"] = [9 if len(code) == 4 else 10
+                                     for code in procedures["icd_code"]]
+        self.tables["mimic_hosp.procedures_icd"] = procedures[
+            ["subject_id", "hadm_id", "seq_num", "chartdate", "icd_code", "icd_version"]]
+
+        drgs = pd.concat([admissions.assign(drg_type="APR"), admissions.assign(drg_type="HCFA")],
+                         ignore_index=True)
+        drgs["drg_code"] = self.choice(drg_codes, len(drgs))
+        drgs["description"] = "DRG " + drgs["drg_code"]
+        apr_drgs = drgs["drg_type"] == "APR"
+        drgs["drg_severity"] = pd.Series(  # type: ignore
+            rng.integers(1, 5, len(drgs))).where(apr_drgs).astype("Int64")  # type: ignore
+        drgs["drg_mortality"] = pd.Series(  # type: ignore
+            rng.integers(1, 5, len(drgs))).where(apr_drgs).astype("Int64")  # type: ignore
+        self.tables["mimic_hosp.drgcodes"] = drgs[
+            ["subject_id", "hadm_id", "drg_type", "drg_code", "description", "drg_severity",
+             "drg_mortality"]]
+
+        hcpcs = self.sample_rows(admissions, "hcpcsevents")
+        hcpcs_dictionary = self.tables["mimic_hosp.d_hcpcs"]
+        codes = rng.integers(0, len(hcpcs_dictionary), len(hcpcs))  # type: ignore
+        hcpcs["chartdate"] = self.sample_times(  # type: ignore
+            hcpcs["admittime"], hcpcs["dischtime"]).dt.date
+        hcpcs["hcpcs_cd"] = hcpcs_dictionary["code"].to_numpy()[codes]
+        hcpcs["seq_num"] = hcpcs.groupby("hadm_id").cumcount() + 1  # type: ignore
+        hcpcs["short_description"] = hcpcs_dictionary["short_description"].to_numpy()[codes]
+        self.tables["mimic_hosp.hcpcsevents"] = hcpcs[
+            ["subject_id", "hadm_id", "chartdate", "hcpcs_cd", "seq_num", "short_description"]]
+
+        service_rows = self.sample_rows(admissions, "services")
+        service_rows["transfertime"] = self.sample_times(service_rows["admittime"],
+                                                         service_rows["dischtime"])
+        service_rows["prev_service"] = None
+        service_rows["curr_service"] = self.choice(services, len(service_rows))
+        self.tables["mimic_hosp.services"] = service_rows[
+            ["subject_id", "hadm_id", "transfertime", "prev_service", "curr_service"]]
+
+        labs = self.sample_rows(admissions, "labevents")
+        labs["labevent_id"] = np.arange(len(labs)) + 1
+        labs["specimen_id"] = rng.integers(1, 10**8, len(labs))  # type: ignore
+        labs["itemid"] = self.choice(list(self.tables["mimic_hosp.d_labitems"]["itemid"]),
+                                     len(labs), 0.5).astype(int)
+        labs["charttime"] = self.sample_times(labs["admittime"], labs["dischtime"])
+        labs["storetime"] = self.add_minutes(labs["charttime"], 120)
+        labs["valuenum"] = rng.normal(100, 25, len(labs)).round(1)
+        labs["value"] = labs["valuenum"].astype(str)
+        labs["valueuom"] = "mg/dL"
+        labs["ref_range_lower"] = 70.0
+        labs["ref_range_upper"] = 130.0
+        labs["flag"] = pd.Series("abnormal", index=labs.index).where(  # type: ignore
+            labs["valuenum"] > 130)
+        labs["priority"] = self.choice(["ROUTINE", "STAT"], len(labs))
+        labs["comments"] = None
+        self.tables["mimic_hosp.labevents"] = labs[
+            ["labevent_id", "subject_id", "hadm_id", "specimen_id", "itemid", "charttime",
+             "storetime", "value", "valuenum", "valueuom", "ref_range_lower", "ref_range_upper",
+             "flag", "priority", "comments"]]
+
+        micro = self.sample_rows(admissions, "microbiologyevents")
+        micro["microevent_id"] = np.arange(len(micro)) + 1
+        micro["micro_specimen_id"] = rng.integers(1, 10**7, len(micro))  # type: ignore
+        micro["charttime"] = self.sample_times(micro["admittime"], micro["dischtime"])
+        micro["chartdate"] = micro["charttime"].dt.floor("D")  # type: ignore
+        micro["spec_itemid"] = 70012
+        micro["spec_type_desc"] = self.choice(["BLOOD CULTURE", "URINE", "SWAB"], len(micro))
+        micro["test_seq"] = 1
+        micro["storetime"] = self.add_minutes(micro["charttime"], 3 * 24 * 60)
+        micro["storedate"] = micro["storetime"].dt.floor("D")  # type: ignore
+        micro["test_itemid"] = 90000 + rng.integers(  # type: ignore
+            0, len(microbiology_tests), len(micro))
+        micro["test_name"] = np.array(microbiology_tests, dtype=object)[  # type: ignore
+            micro["test_itemid"] - 90000]
+        micro["org_itemid"] = None
+        micro["org_name"] = None
+        micro["interpretation"] = None
+        micro["comments"] = None
+        self.tables["mimic_hosp.microbiologyevents"] = micro[
+            ["microevent_id", "subject_id", "hadm_id", "micro_specimen_id", "chartdate",
+             "charttime", "spec_itemid", "spec_type_desc", "test_seq", "storedate", "storetime",
+             "test_itemid", "test_name", "org_itemid", "org_name", "interpretation",
+             "comments"]]
+
+    def generate_poe_and_medications(self) -> None:
+        """Generates provider orders with their details, pharmacy orders and administrations"""
+        rng = self.rng
+        admissions = self.tables["mimic_core.admissions"]
+        poe = self.sample_rows(admissions, "poe")
+        poe = poe.sort_values(["subject_id", "hadm_id"], ignore_index=True)  # type: ignore
+        poe["poe_seq"] = poe.groupby("subject_id").cumcount() + 1  # type: ignore
+        poe["poe_id"] = (poe["subject_id"].astype(str) + "-" +  # type: ignore
+                         poe["poe_seq"].astype(str))
+        poe["ordertime"] = self.sample_times(poe["admittime"], poe["dischtime"])
+        poe["order_type"] = self.choice(list(poe_types), len(poe), 0.5)
+        subtype_indices = rng.integers(0, 3, len(poe))  # type: ignore
+        poe["order_subtype"] = [poe_types[order_type][index % len(poe_types[order_type])]
+                                for index, order_type in zip(subtype_indices,
+                                                             poe["order_type"])]
+        poe["transaction_type"] = "New"
+        poe["discontinue_of_poe_id"] = None
+        poe["discontinued_by_poe_id"] = None
+        poe["order_status"] = "Inactive"
+        self.tables["mimic_hosp.poe"] = poe[
+            ["poe_id", "poe_seq", "subject_id", "hadm_id", "ordertime", "order_type",
+             "order_subtype", "transaction_type", "discontinue_of_poe_id",
+             "discontinued_by_poe_id", "order_status"]]
+
+        details = poe[rng.random(len(poe)) < 0.3]  # type: ignore
+        self.tables["mimic_hosp.poe_detail"] = pd.DataFrame(
+            {"poe_id": details["poe_id"], "poe_seq": details["poe_seq"],
+             "subject_id": details["subject_id"],
+             "field_name": self.choice(["Admit to", "Discharge Planning", "Level of Urgency"],
+                                       len(details)),
+             "field_value": self.choice(["Medicine", "Routine", "Finalized"], len(details))})
+
+        medication_orders = poe[poe["order_type"] == "Medications"]
+        pharmacy = medication_orders.sample(frac=min(rows_per_admission["pharmacy"] /
+                                                     rows_per_admission["poe"] * 4, 1.0),
+                                            random_state=0).reset_index(drop=True)
+        pharmacy["pharmacy_id"] = np.arange(len(pharmacy)) + 1
+        pharmacy["starttime"] = self.add_minutes(pharmacy["ordertime"], 120)
+        pharmacy["stoptime"] = self.add_minutes(pharmacy["starttime"], 5 * 24 * 60)
+        pharmacy["medication"] = self.choice(medications, len(pharmacy))
+        pharmacy["proc_type"] = "Unit Dose"
+        pharmacy["status"] = "Discontinued"
+        pharmacy["entertime"] = pharmacy["ordertime"]
+        pharmacy["verifiedtime"] = self.add_minutes(pharmacy["ordertime"], 60)
+        pharmacy["route"] = self.choice(["PO", "IV", "SC"], len(pharmacy))
+        pharmacy["frequency"] = self.choice(["Q8H", "DAILY", "BID"], len(pharmacy))
+        pharmacy["disp_sched"] = None
+        pharmacy["infusion_type"] = None
+        pharmacy["duration"] = None
+        pharmacy["duration_interval"] = "Ongoing"
+        pharmacy["dispensation"] = "Omnicell"
+        pharmacy["fill_quantity"] = None
+        self.tables["mimic_hosp.pharmacy"] = pharmacy[
+            ["subject_id", "hadm_id", "pharmacy_id", "poe_id", "starttime", "stoptime",
+             "medication", "proc_type", "status", "entertime", "verifiedtime", "route",
+             "frequency", "disp_sched", "infusion_type", "duration", "duration_interval",
+             "dispensation", "fill_quantity"]]
+
+        self.tables["mimic_hosp.prescriptions"] = pd.DataFrame(
+            {"subject_id": pharmacy["subject_id"], "hadm_id": pharmacy["hadm_id"],
+             "pharmacy_id": pharmacy["pharmacy_id"], "starttime": pharmacy["starttime"],
+             "stoptime": pharmacy["stoptime"], "drug_type": "MAIN",
+             "drug": pharmacy["medication"], "gsn": None, "ndc": "0",  # type: ignore
+             "prod_strength": "1 Tab", "form_rx": None, "dose_val_rx": "1",  # type: ignore
+             "dose_unit_rx": "TAB", "form_val_disp": "1", "form_unit_disp": "TAB",
+             "doses_per_24_hrs": 1.0, "route": pharmacy["route"]})  # type: ignore
+
+        emar = pharmacy.loc[pharmacy.index.repeat(rng.poisson(  # type: ignore
+            rows_per_admission["emar"] / rows_per_admission["pharmacy"], len(pharmacy)))]
+        emar = emar.reset_index(drop=True)
+        emar["emar_seq"] = emar.groupby("subject_id").cumcount() + 1  # type: ignore
+        emar["emar_id"] = (emar["subject_id"].astype(str) + "-" +  # type: ignore
+                           emar["emar_seq"].astype(str))
+        emar["charttime"] = self.sample_times(emar["starttime"], emar["stoptime"])
+        emar["event_txt"] = self.choice(["Administered", "Not Given", "Flushed"], len(emar))
+        emar["scheduletime"] = emar["charttime"]
+        emar["storetime"] = self.add_minutes(emar["charttime"], 30)
+        self.tables["mimic_hosp.emar"] = emar[
+            ["subject_id", "hadm_id", "emar_id", "emar_seq", "poe_id", "pharmacy_id",
+             "charttime", "medication", "event_txt", "scheduletime", "storetime"]]
+        self.tables["mimic_hosp.emar_detail"] = pd.DataFrame(
+            {"subject_id": emar["subject_id"], "emar_id": emar["emar_id"],
+             "emar_seq": emar["emar_seq"], "parent_field_ordinal": None,  # type: ignore
+             "administration_type": "Standard Dose", "pharmacy_id": emar["pharmacy_id"],
+             "dose_due": "1", "dose_given": "1", "dose_given_unit": "TAB",
+             "product_description": emar["medication"], "route": emar["route"]})
+
+    def generate_icu(self) -> None:
+        """Generates icu stays and icu event tables"""
+        rng = self.rng
+        admissions = self.tables["mimic_core.admissions"]
+        is_icu_admission = rng.random(len(admissions)) < 0.4  # type: ignore
+        icu_admissions = admissions[is_icu_admission].reset_index(drop=True)
+        stays = icu_admissions.copy()
+        stays["stay_id"] = np.arange(len(stays)) + 30000000  # type: ignore
+        stays["first_careunit"] = self.choice(icu_careunits, len(stays))  # type: ignore
+        stays["last_careunit"] = stays["first_careunit"]  # type: ignore
+        stays["intime"] = self.sample_times(stays["admittime"], stays["dischtime"])  # type: ignore
+        stays["outtime"] = self.sample_times(stays["intime"], stays["dischtime"])  # type: ignore
+        stays["los"] = (stays["outtime"] - stays["intime"]).dt.total_seconds() / 86400
+        self.tables["mimic_icu.icustays"] = stays[  # type: ignore
+            ["subject_id", "hadm_id", "stay_id", "first_careunit", "last_careunit", "intime",
+             "outtime", "los"]]
+
+        d_items = self.tables["mimic_icu.d_items"]
+        for table in ["chartevents", "datetimeevents", "inputevents", "outputevents",
+                      "procedureevents"]:
+            rows = self.sample_rows(stays, table)  # type: ignore
+            items = d_items[d_items["linksto"] == table]
+            rows["itemid"] = self.choice(list(items["itemid"]), len(rows), 0.5).astype(int)
+            time_column = "starttime" if table in ("inputevents", "procedureevents") \
+                else "charttime"
+            rows[time_column] = self.sample_times(rows["intime"], rows["outtime"])
+            rows["storetime"] = self.add_minutes(rows[time_column], 60)
+            if table == "chartevents":
+                rows["valuenum"] = rng.normal(80, 20, len(rows)).round(1)
+                rows["value"] = rows["valuenum"].astype(str)
+                rows["valueuom"] = None
+                rows["warning"] = 0
+            elif table == "datetimeevents":
+                rows["value"] = rows["charttime"]
+                rows["valueuom"] = "Date"
+                rows["warning"] = 0
+            elif table == "outputevents":
+                rows["value"] = rng.integers(10, 500, len(rows)).astype(float)  # type: ignore
+                rows["valueuom"] = "ml"
+            else:
+                rows["endtime"] = self.add_minutes(rows["starttime"], 240)
+                rows["orderid"] = rng.integers(1, 10**7, len(rows))  # type: ignore
+                rows["linkorderid"] = rows["orderid"]
+                rows["ordercategoryname"] = self.choice(order_categories, len(rows))
+                rows["secondaryordercategoryname"] = None
+                rows["ordercategorydescription"] = self.choice(["Continuous IV", "Task", "Bolus"],
+                                                               len(rows))
+                rows["patientweight"] = rng.normal(80, 15, len(rows)).round(1)
+                rows["totalamount"] = None
+                rows["totalamountuom"] = None
+                rows["isopenbag"] = 0
+                rows["continueinnextdept"] = 0
+                rows["cancelreason"] = 0
+                rows["statusdescription"] = "FinishedRunning"
+                rows["originalamount"] = rng.random(len(rows)) * 100  # type: ignore
+                rows["originalrate"] = rng.random(len(rows)) * 10  # type: ignore
+                if table == "inputevents":
+                    rows["amount"] = rows["originalamount"]
+                    rows["amountuom"] = "ml"
+                    rows["rate"] = rows["originalrate"]
+                    rows["rateuom"] = "mL/hour"
+                    rows["ordercomponenttypedescription"] = "Main order parameter"
+                else:
+                    rows["value"] = rng.integers(1, 120, len(rows)).astype(float)  # type: ignore
+                    rows["valueuom"] = "min"
+                    rows["location"] = None
+                    rows["locationcategory"] = None
+            columns = [column.split()[0] for column in
+                       table_definitions["mimic_icu." + table].split(",")]
+            self.tables["mimic_icu." + table] = rows[columns]
+
+    def generate_ed(self) -> None:
+        """Generates emergency department stays and their tables"""
+        rng = self.rng
+        admissions = self.tables["mimic_core.admissions"]
+        ed_admissions = admissions[~admissions["edregtime"].isna()].reset_index(drop=True)
+        patients = self.tables["mimic_core.patients"].set_index("subject_id")
+        edstays = pd.DataFrame(
+            {"subject_id": ed_admissions["subject_id"], "hadm_id": ed_admissions["hadm_id"],
+             "stay_id": np.arange(len(ed_admissions)) + 40000000,
+             "intime": ed_admissions["edregtime"], "outtime": ed_admissions["edouttime"],
+             "gender": patients.loc[ed_admissions["subject_id"], "gender"].to_numpy(),
+             "race": ed_admissions["ethnicity"],
+             "arrival_transport": self.choice(["WALK IN", "AMBULANCE", "UNKNOWN"],
+                                              len(ed_admissions)),
+             "disposition": "ADMITTED"})
+        self.tables["mimic_ed.edstays"] = edstays
+        self.tables["mimic_ed.triage"] = pd.DataFrame(
+            {"subject_id": edstays["subject_id"], "stay_id": edstays["stay_id"],
+             "temperature": rng.normal(98, 1, len(edstays)).round(1),
+             "heartrate": rng.integers(50, 130, len(edstays)),  # type: ignore
+             "resprate": rng.integers(12, 30, len(edstays)),  # type: ignore
+             "o2sat": rng.integers(88, 101, len(edstays)),  # type: ignore
+             "sbp": rng.integers(90, 180, len(edstays)),  # type: ignore
+             "dbp": rng.integers(50, 110, len(edstays)), "pain": "0",  # type: ignore
+             "acuity": rng.integers(1, 6, len(edstays)),  # type: ignore
+             "chiefcomplaint": self.choice(["Dyspnea", "Chest pain", "Abd pain", "Fever"],
+                                           len(edstays))})
+        vitals = self.sample_rows(edstays, "vitalsign")
+        self.tables["mimic_ed.vitalsign"] = pd.DataFrame(
+            {"subject_id": vitals["subject_id"], "stay_id": vitals["stay_id"],
+             "charttime": self.sample_times(vitals["intime"], vitals["outtime"]),
+             "temperature": rng.normal(98, 1, len(vitals)).round(1),
+             "heartrate": rng.integers(50, 130, len(vitals)),  # type: ignore
+             "resprate": rng.integers(12, 30, len(vitals)),  # type: ignore
+             "o2sat": rng.integers(88, 101, len(vitals)),  # type: ignore
+             "sbp": rng.integers(90, 180, len(vitals)),  # type: ignore
+             "dbp": rng.integers(50, 110, len(vitals)),  # type: ignore
+             "rhythm": None, "pain": "0"})  # type: ignore
+        self.tables["mimic_ed.diagnosis"] = pd.DataFrame(
+            {"subject_id": edstays["subject_id"], "stay_id": edstays["stay_id"],
+             "seq_num": 1,  # type: ignore
+             "icd_code": self.choice(icd10_codes, len(edstays)), "icd_version": 10,  # type: ignore
+             "icd_title": None})  # type: ignore
+
+
+def create_tables(db_cursor: cursor, replace: bool) -> None:
+    """Creates the MIMIC schemas and tables, dropping existing ones if replace is set"""
+    db_cursor.execute("select schema_name from information_schema.schemata "
+                      "where schema_name = any(%s)", (schemas,))
+    existing_schemas = [row[0] for row in db_cursor.fetchall()]
+    if existing_schemas and not replace:
+        raise SystemExit("Schemas " + ", ".join(existing_schemas) + " exist already, "
+                         "use --replace to drop them")
+    for schema in schemas:
+        db_cursor.execute("drop schema if exists " + schema + " cascade")
+        db_cursor.execute("create schema " + schema)
+    for table, definition in table_definitions.items():
+        db_cursor.execute("create table " + table + " (" + definition + ")")
+
+
+def load_table(db_cursor: cursor, table: str, content: pd.DataFrame) -> None:
+    """Loads a data frame into a table via COPY"""
+    buffer = io.StringIO()
+    content.to_csv(buffer, index=False, header=False,  # type: ignore
+                   date_format="%Y-%m-%d %H:%M:%S")
+    buffer.seek(0)
+    db_cursor.copy_expert("copy " + table + " (" + ", ".join(content.columns) +
+                          ") from stdin with (format csv)", buffer)
+
+
+def main():
+    """Generates and loads a synthetic MIMIC-IV database"""
+    parser = argparse.ArgumentParser(description='Generates a synthetic MIMIC-IV database.')
+    parser.add_argument('--db_name', type=str, required=True)
+    parser.add_argument('--db_host', type=str, default='localhost')
+    parser.add_argument('--db_user', type=str, default='postgres')
+    parser.add_argument('--db_pw', type=str, default='')
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--density', type=float, default=1.0,
+                        help="Factor for the number of event rows per admission")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replace', action='store_true',
+                        help="Drop existing mimic_core, mimic_hosp, mimic_icu and mimic_ed "
+                        "schemas")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tables = TableGenerator(args.patients, args.density, args.seed).generate()
+    print("generated %d rows in %.1fs" % (sum(len(table) for table in tables.values()),
+                                          time.perf_counter() - start))
+
+    db_connection = create_db_connection(args.db_name, args.db_host, args.db_user, args.db_pw)
+    with db_connection.cursor() as db_cursor:
+        create_tables(db_cursor, args.replace)
+        for table, content in tables.items():
+            load_table(db_cursor, table, content)
+            print("%-30s %10d rows" % (table, len(content)))
+        db_connection.commit()
+    db_connection.autocommit = True
+    with db_connection.cursor() as db_cursor:
+        db_cursor.execute("analyze")
+    db_connection.close()
+    print("loaded in %.1fs" % (time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,27 +4,34 @@
 Provides the main CLI functionality for extracting configurable event logs out of a Mimic Database
 """
 import argparse
+from functools import partial
 import logging
-from typing import List, Optional
+import sys
+from typing import Optional
 import yaml
 
-from pm4py.objects.conversion.log import converter as log_converter  # type: ignore
-from pm4py.objects.log.exporter.xes import exporter as xes_exporter  # type: ignore
-
-from extractor.transfer import extract_transfer_events
-from extractor.tables import extract_table_events
-from extractor.poe import extract_poe_events
+from extractor.tables import ask_activity_and_time
+from extractor.checkpoints import configure_checkpoints, get_checkpoint_directory,\
+    get_checkpoint_key, run_checkpointed
+from extractor.columnar_writer import columnar_formats
+from extractor.copy_transport import configure_bulk_copy
+from extractor.dictionary_cache import clear_dictionary_cache
 from extractor.extraction_helper import get_filename_string
-from extractor.event_attributes import extract_event_attributes
-from extractor.admission import extract_admission_events
-from extractor.case_attributes import extract_case_attributes
-from extractor.cli_helper import ask_event_attributes, create_db_connection,\
+from extractor.index_advisor import advise_indexes, write_index_report
+from extractor.log_writer import OUTPUT_DIR, EventLogWriter
+from extractor.result_store import clear_result_store
+from extractor.profiling import configure_profiling, profile_capture_tools, run_profiled,\
+    write_profile_report
+from extractor.pipeline import ExtractionSettings, create_stage_pool, extract_cohort_log,\
+    get_case_id_key, get_extraction_tables
+from extractor.sharding import get_shard_size, split_cohort
+from extractor.shard_workers import extract_shards_in_processes, get_worker_shard_size
+from extractor.cli_helper import create_db_connection, create_db_pool,\
     parse_or_ask_case_attributes, parse_or_ask_case_notion, parse_or_ask_cohorts,\
     parse_or_ask_db_settings, parse_or_ask_event_type, parse_or_ask_low_level_tables
 from extractor.cohort import extract_cohort, extract_cohort_for_ids
-from extractor.constants import ADDITIONAL_ATTRIBUTES_QUESTION, ADMISSION_CASE_KEY,\
-    ADMISSION_CASE_NOTION, ADMISSION_EVENT_TYPE, INCLUDE_MEDICATION_QUESTION, OTHER_EVENT_TYPE,\
-    POE_EVENT_TYPE, SUBJECT_CASE_KEY, SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.constants import ADMISSION_CASE_KEY, INCLUDE_MEDICATION_QUESTION,\
+    OTHER_EVENT_TYPE, POE_EVENT_TYPE, SUBJECT_CASE_KEY
 
 formatter = logging.Formatter(
     fmt='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
@@ -88,6 +95,123 @@ parser.add_argument('--csv_log', action='store_true',
                     help="Store resulting log as a .csv file instead of as an .xes event log")
 parser.set_defaults(csv_log=False)
 
+# Arguments to store event log as columnar file instead of xes
+parser.add_argument('--columnar_log', type=str, choices=columnar_formats,
+                    help="""Store resulting log as a columnar .parquet or .arrow file instead of as
+                    an .xes event log""")
+parser.add_argument('--cases_per_partition', type=int,
+                    help="""Partition the columnar log into files of this many cases, ordered by
+                    case id""")
+
+# Argument to export the xes log with pm4py instead of the streaming writer
+parser.add_argument('--pm4py_xes', action='store_true',
+                    help="""Export the .xes event log via a pm4py EventLog instead of streaming it
+                    case by case""")
+parser.set_defaults(pm4py_xes=False)
+
+# Argument to compress the xes log
+parser.add_argument('--compress_log', action='store_true',
+                    help="Store the resulting .xes event log gzip compressed (.xes.gz)")
+parser.set_defaults(compress_log=False)
+
+# Argument to transfer query results via COPY instead of cursor fetches
+parser.add_argument('--bulk_copy', action='store_true',
+                    help="Transfer query results via COPY TO STDOUT instead of cursor fetches")
+parser.set_defaults(bulk_copy=False)
+
+# Argument to only extract needed columns of low level tables
+parser.add_argument('--project_columns', action='store_true',
+                    help="""Only extract the activity, timestamp and event attribute columns of
+                    low level tables instead of all columns""")
+parser.set_defaults(project_columns=False)
+
+# Argument to invalidate the local cache of dictionary tables
+parser.add_argument('--clear_dictionary_cache', action='store_true',
+                    help="Remove the locally cached dictionary tables (d_items, d_labitems, ...)")
+parser.set_defaults(clear_dictionary_cache=False)
+
+# Argument to aggregate additional event attributes inside the database
+parser.add_argument('--aggregate_in_database', action='store_true',
+                    help="""Aggregate additional event attributes over the log event intervals
+                    inside the database instead of in pandas""")
+parser.set_defaults(aggregate_in_database=False)
+
+# Argument to run independent extraction queries in parallel
+parser.add_argument('--parallel_connections', type=int,
+                    help="""Number of database connections used to extract low level tables
+                    and POE medication tables in parallel""")
+
+# Argument to run independent extraction stages concurrently
+parser.add_argument('--async_backend', action='store_true',
+                    help="""Extract case attributes, events and the source tables of configured
+                    event attributes concurrently, each on its own database connection""")
+parser.set_defaults(async_backend=False)
+
+# Argument to extract the cohort in shards fitting into a memory budget
+parser.add_argument('--memory_budget', type=int,
+                    help="""Memory budget in megabytes. The cohort is split into shards of cases
+                    estimated to fit into the budget, which are extracted one after another and
+                    appended to the event log""")
+
+# Arguments to extract only admissions which were not extracted by earlier runs
+parser.add_argument('--incremental', action='store_true',
+                    help="""Store the extracted log per admission and only extract admissions
+                    which are not stored for the same configuration yet""")
+parser.set_defaults(incremental=False)
+parser.add_argument('--clear_result_store', action='store_true',
+                    help="Remove the stored logs of incremental extractions")
+parser.set_defaults(clear_result_store=False)
+
+# Arguments to checkpoint extraction stages and resume them
+parser.add_argument('--checkpoint', action='store_true',
+                    help="""Store the result of every extraction stage as checkpoint, keyed by
+                    the configuration and the database""")
+parser.set_defaults(checkpoint=False)
+parser.add_argument('--resume', action='store_true',
+                    help="""Read extraction stages with a checkpoint of the same configuration
+                    from the checkpoint instead of extracting them again (implies
+                    --checkpoint)""")
+parser.set_defaults(resume=False)
+
+# Argument to extract shards of the cohort in parallel processes
+parser.add_argument('--workers', type=int,
+                    help="""Number of worker processes, each with its own database connection,
+                    which extract shards of the cohort in parallel""")
+
+# Arguments to profile the extraction stages and queries
+parser.add_argument('--profile', action='store_true',
+                    help="""Record wall time, rows, bytes and memory of every query and
+                    extraction stage, and write them as json report to the output
+                    directory""")
+parser.set_defaults(profile=False)
+parser.add_argument('--profile_capture', type=str, choices=profile_capture_tools,
+                    help="""Additionally profile the python code of the slowest stage with
+                    cProfile or pyinstrument (implies --profile)""")
+parser.add_argument('--profile_analyze', action='store_true',
+                    help="""Additionally run every profiled query a second time with EXPLAIN
+                    ANALYZE to record its server execution time, which doubles the work of
+                    the database (implies --profile)""")
+parser.set_defaults(profile_analyze=False)
+
+# Arguments to check (and create) the indexes used by the extraction queries
+parser.add_argument('--advise_indexes', action='store_true',
+                    help="""Instead of extracting a log, explain the queries of the configured
+                    extraction and report missing indexes on their id and time columns""")
+parser.set_defaults(advise_indexes=False)
+parser.add_argument('--create_indexes', action='store_true',
+                    help="""Create the missing indexes reported by --advise_indexes and report
+                    the query plans before and after (implies --advise_indexes)""")
+parser.set_defaults(create_indexes=False)
+
+# Options which do not change the result of extraction stages, so that a checkpointed
+# extraction can be resumed with different output or execution options
+runtime_options = ["config", "db_pw", "save_intermediate", "csv_log", "columnar_log",
+                   "cases_per_partition", "pm4py_xes", "compress_log", "bulk_copy",
+                   "clear_dictionary_cache", "parallel_connections", "async_backend",
+                   "memory_budget", "incremental", "clear_result_store", "workers",
+                   "checkpoint", "resume", "profile", "profile_capture",
+                   "profile_analyze", "advise_indexes", "create_indexes"]
+
 
 def main():
     """Main method for extracting event logs"""
@@ -112,13 +236,113 @@ def main():
     else:
         save_csv_log = args.csv_log
 
+    # Should resulting event log be saved as parquet or arrow file instead of as xes?
+    if config is not None and config.get("columnar_log") is not None:
+        columnar_log: Optional[str] = config.get('columnar_log')  # type: ignore
+    else:
+        columnar_log = args.columnar_log
+    if columnar_log is not None and columnar_log not in columnar_formats:
+        logger.error("Columnar log format must be one of %s", columnar_formats)
+        sys.exit("Illicit columnar log format provided.")
+    if config is not None and config.get("cases_per_partition") is not None:
+        cases_per_partition: Optional[int] = config.get(
+            'cases_per_partition')  # type: ignore
+    else:
+        cases_per_partition = args.cases_per_partition
+
+    # Should the xes log be exported with pm4py instead of the streaming writer?
+    if config is not None and config.get("pm4py_xes") is not None:
+        use_pm4py_xes: bool = config.get(
+            'pm4py_xes', False)  # type: ignore
+    else:
+        use_pm4py_xes = args.pm4py_xes
+
+    # Should the xes log be gzip compressed?
+    if config is not None and config.get("compress_log") is not None:
+        compress_log: bool = config.get(
+            'compress_log', False)  # type: ignore
+    else:
+        compress_log = args.compress_log
+
+    # Should query results be transferred via COPY?
+    if config is not None and config.get("bulk_copy") is not None:
+        use_bulk_copy: bool = config.get(
+            'bulk_copy', False)  # type: ignore
+    else:
+        use_bulk_copy = args.bulk_copy
+    configure_bulk_copy(use_bulk_copy)
+
+    # Should extraction stages and queries be profiled?
+    if config is not None and config.get("profile_capture") is not None:
+        profile_capture: Optional[str] = config.get('profile_capture')  # type: ignore
+    else:
+        profile_capture = args.profile_capture
+    if profile_capture is not None and profile_capture not in profile_capture_tools:
+        logger.error("Profile capture tool must be one of %s", profile_capture_tools)
+        sys.exit("Illicit profile capture tool provided.")
+    if config is not None and config.get("profile_analyze") is not None:
+        profile_analyze: bool = config.get('profile_analyze', False)  # type: ignore
+    else:
+        profile_analyze = args.profile_analyze
+    if config is not None and config.get("profile") is not None:
+        profile: bool = config.get('profile', False)  # type: ignore
+    else:
+        profile = args.profile
+    profile = profile or profile_capture is not None or profile_analyze
+    configure_profiling(profile, profile_capture, profile_analyze)
+
+    if args.clear_dictionary_cache:
+        clear_dictionary_cache()
+
+    if args.clear_result_store:
+        clear_result_store()
+
     # Create database connection
     db_name, db_host, db_user, db_pw = parse_or_ask_db_settings(args, config)
     db_connection = create_db_connection(db_name, db_host, db_user, db_pw)
     db_cursor = db_connection.cursor()
 
-    # Determine Cohort
-    if args.subject_ids is None and args.hadm_ids is None:
+    # Should extraction stages be checkpointed, and finished stages be resumed?
+    if config is not None and config.get("resume") is not None:
+        resume: bool = config.get('resume', False)  # type: ignore
+    else:
+        resume = args.resume
+    if config is not None and config.get("checkpoint") is not None:
+        checkpoint: bool = config.get('checkpoint', False)  # type: ignore
+    else:
+        checkpoint = args.checkpoint
+    if checkpoint or resume:
+        effective_configuration = {
+            "config": {key: value for key, value in (config or {}).items()
+                       if key not in runtime_options},
+            "args": {key: value for key, value in vars(args).items()
+                     if key not in runtime_options}}
+        configure_checkpoints(get_checkpoint_directory(db_cursor, effective_configuration),
+                              resume)
+
+    # Should independent tables be extracted in parallel?
+    if config is not None and config.get("parallel_connections") is not None:
+        parallel_connections: Optional[int] = config.get(
+            'parallel_connections')  # type: ignore
+    else:
+        parallel_connections = args.parallel_connections
+    db_pool = None
+    if parallel_connections is not None and parallel_connections > 1:
+        db_pool = create_db_pool(db_name, db_host, db_user, db_pw, parallel_connections)
+
+    # Should the indexes of the extraction queries be checked instead of extracting a log?
+    if config is not None and config.get("create_indexes") is not None:
+        create_indexes: bool = config.get('create_indexes', False)  # type: ignore
+    else:
+        create_indexes = args.create_indexes
+    if config is not None and config.get("advise_indexes") is not None:
+        advise_or_create_indexes: bool = config.get('advise_indexes', False)  # type: ignore
+    else:
+        advise_or_create_indexes = args.advise_indexes
+    advise_or_create_indexes = advise_or_create_indexes or create_indexes
+
+    # Determine Cohort, which is not needed for checking indexes
+    if args.subject_ids is None and args.hadm_ids is None and not advise_or_create_indexes:
         cohort_icd_codes, cohort_icd_version, cohort_icd_seq_num, cohort_drg_codes, \
             cohort_drg_type, cohort_age, \
             cohort_icd_codes_intersection, cohort_subject_ids, \
@@ -132,125 +356,189 @@ def main():
 
     event_type = parse_or_ask_event_type(args, config)
 
-    # build cohort
-    if args.subject_ids is None and args.hadm_ids is None \
-    and cohort_subject_ids is None and cohort_hadm_ids is None:
-        cohort = extract_cohort(db_cursor, cohort_icd_codes, cohort_icd_version,
-                                cohort_icd_seq_num, cohort_drg_codes, cohort_drg_type,
-                                cohort_age, cohort_icd_codes_intersection, save_intermediate)
-    else:
-        if cohort_subject_ids is not None or cohort_hadm_ids is not None:
-            if cohort_subject_ids is not None:
-                subject_input = ",".join(cohort_subject_ids)
-            else:
-                subject_input = cohort_subject_ids # type: ignore
-            if cohort_hadm_ids is not None:
-                hadm_input = ",".join(cohort_hadm_ids)
-            else:
-                hadm_input = cohort_hadm_ids # type: ignore
-            cohort = extract_cohort_for_ids(
-            db_cursor, subject_input, hadm_input, save_intermediate)
-        else:
-            cohort = extract_cohort_for_ids(
-                db_cursor, args.subject_ids, args.hadm_ids, save_intermediate)
-
-    # extract case attributes
-    if case_attribute_list is not None:
-        case_attributes = extract_case_attributes(
-            db_cursor, cohort, determined_case_notion, case_attribute_list, save_intermediate)
-
-    if event_type == ADMISSION_EVENT_TYPE:
-        events = extract_admission_events(db_cursor, cohort, save_intermediate)
-    elif event_type == TRANSFER_EVENT_TYPE:
-        events = extract_transfer_events(db_cursor, cohort, save_intermediate)
-    elif event_type == POE_EVENT_TYPE:
+    should_include_medications = False
+    tables_to_extract = None
+    tables_activities = None
+    tables_timestamps = None
+    required_columns = None
+    if event_type == POE_EVENT_TYPE:
         if config is not None and config.get("include_medications") is not None:
-            should_include_medications: bool = config.get(
+            should_include_medications = config.get(
                 'include_medications', False)
         else:
             include_medications = input(INCLUDE_MEDICATION_QUESTION).upper()
             should_include_medications = include_medications == "Y"
-
-        events = extract_poe_events(
-            db_cursor, cohort, should_include_medications, save_intermediate)
     elif event_type == OTHER_EVENT_TYPE:
         tables_to_extract = parse_or_ask_low_level_tables(args, config)
         if args.tables_activities is not None:
             tables_activities = args.tables_activities.split(',')
         elif config is not None and config.get("low_level_activities") is not None:
             tables_activities = config.get("low_level_activities")
-        else:
-            tables_activities = None
         if args.tables_timestamps is not None:
             tables_timestamps = args.tables_timestamps.split(',')
         elif config is not None and config.get("low_level_timestamps") is not None:
             tables_timestamps = config.get("low_level_timestamps")
+        if tables_activities is None and tables_timestamps is None \
+                and not advise_or_create_indexes:
+            # ask once, instead of for every shard
+            chosen_activity_time = ask_activity_and_time(db_cursor, tables_to_extract,
+                                                         tables_activities, tables_timestamps)
+            tables_activities = [chosen_activity_time[table][0] for table in tables_to_extract]
+            tables_timestamps = [chosen_activity_time[table][1] for table in tables_to_extract]
+        if config is not None and config.get("project_columns") is not None:
+            should_project_columns: bool = config.get(
+                'project_columns', False)  # type: ignore
+        else:
+            should_project_columns = args.project_columns
+        if should_project_columns:
+            required_columns = [ADMISSION_CASE_KEY, SUBJECT_CASE_KEY]
+            if config is not None and config.get("additional_event_attributes") is not None:
+                for attribute in config.get("additional_event_attributes", []):
+                    required_columns += [attribute['start_column'], attribute['end_column']]
+
+    if advise_or_create_indexes:
+        settings = ExtractionSettings(
+            db_settings=(db_name, db_host, db_user, db_pw), case_notion=determined_case_notion,
+            case_attribute_list=case_attribute_list, event_type=event_type,
+            include_medications=should_include_medications,
+            tables_to_extract=tables_to_extract,
+            additional_attributes=None if config is None
+            else config.get("additional_event_attributes"))
+        index_report = advise_indexes(db_cursor, settings, create_indexes)
+        db_connection.commit()
+        write_index_report(OUTPUT_DIR + get_filename_string("index_report", ".json"),
+                           index_report)
+        if db_pool is not None:
+            db_pool.closeall()
+        return
+
+    # build cohort
+    if args.subject_ids is None and args.hadm_ids is None \
+    and cohort_subject_ids is None and cohort_hadm_ids is None:
+        cohort_parameters = [cohort_icd_codes, cohort_icd_version, cohort_icd_seq_num,
+                             cohort_drg_codes, cohort_drg_type, cohort_age,
+                             cohort_icd_codes_intersection]
+        cohort = run_profiled("cohort", partial(
+            run_checkpointed, "cohort-" + get_checkpoint_key(cohort_parameters),
+            partial(extract_cohort, db_cursor, *cohort_parameters, save_intermediate)))
+    else:
+        if cohort_subject_ids is not None or cohort_hadm_ids is not None:
+            if cohort_subject_ids is not None:
+                subject_input = ",".join(cohort_subject_ids)
+            else:
+                subject_input = cohort_subject_ids # type: ignore
+            if cohort_hadm_ids is not None:
+                hadm_input = ",".join(cohort_hadm_ids)
+            else:
+                hadm_input = cohort_hadm_ids # type: ignore
+            cohort = run_profiled("cohort", partial(
+                run_checkpointed, "cohort-" + get_checkpoint_key([subject_input, hadm_input]),
+                partial(extract_cohort_for_ids, db_cursor, subject_input, hadm_input,
+                        save_intermediate)))
         else:
-            tables_timestamps = None
-        events = extract_table_events(db_cursor, cohort, tables_to_extract,
-                                      tables_activities, tables_timestamps, save_intermediate)
-
-    if config is not None and config.get("additional_event_attributes") is not None:
-        additional_attributes: List[dict] = config.get(
-            "additional_event_attributes", [])
-        for attribute in additional_attributes:
-            events = extract_event_attributes(db_cursor, events, attribute['start_column'],
-                                              attribute['end_column'], attribute['time_column'],
-                                              attribute['table_to_aggregate'],
-                                              attribute['column_to_aggregate'],
-                                              attribute['aggregation_method'],
-                                              attribute.get('filter_column'),
-                                              attribute.get('filter_values'))
+            cohort = run_profiled("cohort", partial(
+                run_checkpointed,
+                "cohort-" + get_checkpoint_key([args.subject_ids, args.hadm_ids]),
+                partial(extract_cohort_for_ids, db_cursor, args.subject_ids, args.hadm_ids,
+                        save_intermediate)))
+
+    # Should independent extraction stages run concurrently?
+    if config is not None and config.get("async_backend") is not None:
+        use_async_backend: bool = config.get(
+            'async_backend', False)  # type: ignore
+    else:
+        use_async_backend = args.async_backend
+
+    # Should event attributes be aggregated inside the database?
+    if config is not None and config.get("aggregate_in_database") is not None:
+        aggregate_in_database: bool = config.get(
+            'aggregate_in_database', False)  # type: ignore
+    else:
+        aggregate_in_database = args.aggregate_in_database
+
+    # Should admissions extracted by earlier runs be read from the result store?
+    if config is not None and config.get("incremental") is not None:
+        incremental: bool = config.get(
+            'incremental', False)  # type: ignore
+    else:
+        incremental = args.incremental
+
+    settings = ExtractionSettings(
+        db_settings=(db_name, db_host, db_user, db_pw), case_notion=determined_case_notion,
+        case_attribute_list=case_attribute_list, event_type=event_type,
+        include_medications=should_include_medications, tables_to_extract=tables_to_extract,
+        tables_activities=tables_activities, tables_timestamps=tables_timestamps,
+        required_columns=required_columns,
+        additional_attributes=None if config is None
+        else config.get("additional_event_attributes"),
+        aggregate_in_database=aggregate_in_database, use_async_backend=use_async_backend,
+        save_intermediate=save_intermediate, incremental=incremental)
+
+    # Should the cohort be extracted in shards fitting into a memory budget?
+    if config is not None and config.get("memory_budget") is not None:
+        memory_budget: Optional[int] = config.get('memory_budget')  # type: ignore
+    else:
+        memory_budget = args.memory_budget
+
+    # Should shards be extracted in parallel worker processes?
+    if config is not None and config.get("workers") is not None:
+        workers: int = config.get('workers', 1)  # type: ignore
     else:
-        event_attribute_decision = input(ADDITIONAL_ATTRIBUTES_QUESTION)
-        while event_attribute_decision.upper() == "Y":
-            start_column, end_column, time_column, table_to_aggregate, column_to_aggregate,\
-                aggregation_method, filter_column, filter_values = ask_event_attributes(db_cursor,
-                                                                                        events)
-            events = extract_event_attributes(db_cursor, events, start_column, end_column,
-                                              time_column, table_to_aggregate, column_to_aggregate,
-                                              aggregation_method, filter_column, filter_values)
-            event_attribute_decision = input(ADDITIONAL_ATTRIBUTES_QUESTION)
-
-    if save_intermediate:
-        csv_filename = get_filename_string(
-            "event_attribute_enhanced_log", ".csv")
-        events.to_csv("output/" + csv_filename)
-
-    # set case id key based on determined case notion
-    if determined_case_notion == SUBJECT_CASE_NOTION:
-        case_id_key = SUBJECT_CASE_KEY
-    elif determined_case_notion == ADMISSION_CASE_NOTION:
-        case_id_key = ADMISSION_CASE_KEY
-
-    # rename every case attribute to have case prefix
-    if case_attribute_list is not None and case_attributes is not None:
-        # join case attr to events
-        if determined_case_notion == SUBJECT_CASE_NOTION:
-            events = events.merge(
-                case_attributes, on=SUBJECT_CASE_KEY, how='left')
-        elif determined_case_notion == ADMISSION_CASE_NOTION:
-            events = events.merge(
-                case_attributes, on=ADMISSION_CASE_KEY, how='left')
-
-        # rename case id key, as this will be affected too
-        case_id_key = 'case:' + case_id_key
-        for case_attr in case_attribute_list:
-            events.rename(
-                columns={case_attr: "case:" + case_attr}, inplace=True)
+        workers = args.workers or 1
+
+    shards = [cohort]
+    if memory_budget is not None or workers > 1:
+        shard_size = get_worker_shard_size(cohort, workers) if workers > 1 \
+            else len(cohort)
+        if memory_budget is not None:
+            # every worker holds one shard at a time
+            shard_size = min(shard_size, get_shard_size(
+                db_cursor, get_extraction_tables(settings), memory_budget // workers))
+        shards = split_cohort(cohort, get_case_id_key(determined_case_notion), shard_size)
 
     if save_csv_log:
-        filename = get_filename_string("event_log", ".csv")
-        events.to_csv("output/" + filename)
+        log_format = "csv"
+    elif columnar_log is not None:
+        log_format = columnar_log
+    elif use_pm4py_xes:
+        log_format = "pm4py_xes"
     else:
-        parameters = {log_converter.Variants.TO_EVENT_LOG.value
-                      .Parameters.CASE_ID_KEY: case_id_key,
-                      log_converter.Variants.TO_EVENT_LOG.value
-                      .Parameters.CASE_ATTRIBUTE_PREFIX: 'case:'}
-        event_log_object = log_converter.apply(
-            events, parameters=parameters, variant=log_converter.Variants.TO_EVENT_LOG)
-        filename = get_filename_string("event_log", ".xes")
-        xes_exporter.apply(event_log_object, "output/" + filename)
+        log_format = "xes"
+    log_writer = EventLogWriter(log_format, compress_log, cases_per_partition, len(shards) > 1)
+    # the async backend runs the stages of all shards on the same pool
+    stage_pool = create_stage_pool(settings)
+    if workers > 1 and settings.additional_attributes is None and len(shards) > 1:
+        # workers can not ask for event attributes, so the first shard is extracted here
+        events, case_id_key, additional_attributes = extract_cohort_log(
+            db_cursor, shards[0], settings, db_pool, stage_pool)
+        settings = settings._replace(additional_attributes=additional_attributes)
+        run_profiled("write_log", partial(log_writer.write, events, case_id_key))
+        del events
+        shards = shards[1:]
+    if workers > 1 and len(shards) > 1:
+        # queries of the worker processes are not part of the profile report
+        run_profiled("worker_shards", partial(extract_shards_in_processes, shards, settings,
+                                              workers, log_writer, use_bulk_copy))
+        shards = []
+    for shard_number, shard in enumerate(shards):
+        if len(shards) > 1:
+            logger.info("Extracting shard %d of %d (%d admissions)", shard_number + 1,
+                        len(shards), len(shard))
+        events, case_id_key, additional_attributes = extract_cohort_log(
+            db_cursor, shard, settings, db_pool, stage_pool)
+        # interactively provided event attributes are reused for the following shards
+        settings = settings._replace(additional_attributes=additional_attributes)
+        run_profiled("write_log", partial(log_writer.write, events, case_id_key))
+        del events
+    run_profiled("write_log", log_writer.close)
+
+    if db_pool is not None:
+        db_pool.closeall()
+    if stage_pool is not None:
+        stage_pool.closeall()
+
+    if profile:
+        write_profile_report(OUTPUT_DIR + get_filename_string("profile", ".json"))
 
 if __name__ == '__main__':
     main()
@@ -3,11 +3,11 @@ from .cohort import extract_cohort, extract_cohort_for_ids
 from .admission import extract_admission_events
 from .transfer import extract_transfer_events
 from .case_attributes import extract_case_attributes
-from .poe import extract_poe_events, extract_table_for_subject_ids
+from .poe import extract_poe_events
 from .tables import extract_table_events
 from .extraction_helper import subject_case_attributes, hadm_case_attributes, illicit_tables, \
-    extract_table_columns, get_table_module, get_filename_string
-from .cli_helper import parse_or_ask_db_settings, create_db_connection, \
+    extract_table_columns, get_table_module, get_filename_string, extract_table_for_subject_ids
+from .cli_helper import parse_or_ask_db_settings, create_db_connection, create_db_pool, \
     parse_or_ask_cohorts, parse_or_ask_case_notion, parse_or_ask_case_attributes, \
     parse_or_ask_event_type, parse_or_ask_low_level_tables
 from .constants import *
@@ -29,6 +29,7 @@ __all__ = [
     'get_filename_string',
     'parse_or_ask_db_settings',
     'create_db_connection',
+    'create_db_pool',
     'parse_or_ask_cohorts',
     'parse_or_ask_case_notion',
     'parse_or_ask_case_attributes',
@@ -44,4 +45,16 @@ __all__ = [
     'TRANSFER_EVENT_TYPE',
     'POE_EVENT_TYPE',
     'OTHER_EVENT_TYPE',
+    'FETCH_BATCH_SIZE',
+    'ID_ARRAY_LIMIT',
+    'ID_BATCH_SIZE',
+    'COPY_SPOOL_SIZE',
+    'DICTIONARY_CACHE_DIR',
+    'XES_CHUNK_SIZE',
+    'CATEGORY_RATIO',
+    'SHARD_MEMORY_FACTOR',
+    'SHARDS_PER_WORKER',
+    'RESULT_STORE_DIR',
+    'CHECKPOINT_DIR',
+    'INDEX_ADVISOR_SAMPLE_SIZE',
 ]
@@ -2,8 +2,9 @@
 import logging
 import pandas as pd
 from psycopg2.extensions import cursor
+from extractor.id_sets import get_cohort_ids
 from .extraction_helper import (
-    get_filename_string, extract_admissions_for_admission_ids)
+    get_filename_string, extract_admissions_for_admission_ids, expand_lifecycle_events)
 
 
 logger = logging.getLogger('cli')
@@ -17,36 +18,16 @@ def extract_admission_events(db_cursor: cursor, cohort: pd.DataFrame,
 
     logger.info("Begin extracting admission events!")
 
-    hospital_admission_ids = list(cohort["hadm_id"].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
-    admission_ids = hospital_admission_ids
-
-    admissions = extract_admissions_for_admission_ids(db_cursor, admission_ids)
-
-    event_dict = {}
-    i = 0
-    for _, row in admissions.iterrows():
-        if pd.isnull(row["deathtime"]):
-            column_labels = ["admittime",
-                             "dischtime", "edregtime", "edouttime"]
-        else:
-            column_labels = ["admittime",
-                             "deathtime", "edregtime", "edouttime"]
-        for col in admissions.columns:
-            if col in column_labels:
-                if pd.isna(row[col]):
-                    continue
-                activity = col.replace('time', '')
-                new_row = {"hadm_id": row["hadm_id"], "subject_id": row["subject_id"],
-                           "activity": activity, "timestamp": row[col]}
-                event_dict[i] = new_row
-                i = i + 1
-
-    log = pd.DataFrame.from_dict(event_dict, "index")  # type: ignore
-    log = log.sort_values("timestamp")
-    log = log.reset_index().drop("index", axis=1)
-    log = log.rename({"activity": "concept:name",
-                     "timestamp": "time:timestamp"}, axis=1)
+    admission_ids = get_cohort_ids(cohort, "hadm_id")
+
+    admissions = extract_admissions_for_admission_ids(
+        db_cursor, admission_ids, ["subject_id", "hadm_id", "admittime", "dischtime",
+                                   "deathtime", "edregtime", "edouttime"])
+
+    lifecycle_columns = ["admittime", "dischtime", "deathtime", "edregtime", "edouttime"]
+    log = expand_lifecycle_events(admissions,
+                                  {col: col.replace('time', '') for col in lifecycle_columns},
+                                  ["hadm_id", "subject_id"], {"dischtime": "deathtime"})
 
     if save_intermediate:
         filename = get_filename_string("admission_log", ".csv")
@@ -0,0 +1,53 @@
+"""
+Provides an asyncio execution backend, which runs independent extraction stages concurrently,
+each on its own database connection
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+from typing import Any, Callable, Dict, Hashable
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from extractor.connection_pool import call_with_pooled_cursor
+
+
+logger = logging.getLogger('cli')
+
+
+async def gather_stages(db_pool: ThreadedConnectionPool,
+                        stages: Dict[Hashable, Callable[[cursor], Any]]) -> Dict[Hashable, Any]:
+    """
+    Awaits all stages concurrently. The blocking psycopg2 readers of every stage run in a
+    worker thread on a pooled connection, so at most as many stages as the pool has
+    connections run at the same time.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(min(len(stages), db_pool.maxconn), 1))
+    try:
+        loop = asyncio.get_running_loop()
+        stage_futures = [loop.run_in_executor(executor,
+                                              partial(call_with_pooled_cursor, db_pool, stage))
+                         for stage in stages.values()]
+        results = await asyncio.gather(*stage_futures)
+    finally:
+        executor.shutdown(wait=True)
+    return dict(zip(stages.keys(), results))
+
+
+def run_stages_concurrently(db_pool: ThreadedConnectionPool,
+                            stages: Dict[Hashable, Callable[[cursor], Any]]
+                            ) -> Dict[Hashable, Any]:
+    """
+    Runs independent extraction stages, given as functions of a database cursor,
+    concurrently on the connections of a pool and returns their results by stage name.
+    The pool is created once per run and shared by all shards of the cohort.
+    """
+    logger.info("Running %d extraction stages concurrently...", len(stages))
+    return asyncio.run(gather_stages(db_pool, stages))
+
+
+def run_stages_serially(db_cursor: cursor,
+                        stages: Dict[Hashable, Callable[[cursor], Any]]) -> Dict[Hashable, Any]:
+    """Runs extraction stages one after another on the given cursor"""
+    return {name: stage(db_cursor) for name, stage in stages.items()}
@@ -7,11 +7,16 @@ import pandas as pd
 from psycopg2.extensions import cursor
 
 from extractor.constants import ADMISSION_CASE_NOTION, SUBJECT_CASE_NOTION
-from .extraction_helper import (extract_admissions_for_admission_ids, extract_patients,
-                                get_filename_string, extract_table_for_admission_ids)
+from extractor.id_sets import get_cohort_ids
+from .extraction_helper import (extract_admissions_for_admission_ids,
+                                extract_table_for_subject_ids, get_filename_string,
+                                extract_table_for_admission_ids)
 
 logger = logging.getLogger('cli')
 
+# Case attributes of hospital admissions which are not taken from the admissions table
+cohort_case_attributes = ["age", "gender", "icd_code", "drg_code"]
+
 
 def extract_case_attributes(db_cursor: cursor, cohort: pd.DataFrame, case_notion: str,
                             case_attribute_list: List[str],
@@ -23,26 +28,29 @@ def extract_case_attributes(db_cursor: cursor, cohort: pd.DataFrame, case_notion
     logger.info("Begin extracting case attributes!")
     case_attributes = pd.DataFrame()
     if case_notion == SUBJECT_CASE_NOTION:
-        subject_df = extract_patients(db_cursor)
-        subject_ids = list(cohort["subject_id"].unique())
-        subject_df = subject_df.loc[subject_df["subject_id"].isin(subject_ids)]
+        subject_ids = get_cohort_ids(cohort, "subject_id")
         case_attribute_list.append("subject_id")
+        subject_df = extract_table_for_subject_ids(db_cursor, subject_ids, "mimic_core", "patients",
+                                                   list(dict.fromkeys(case_attribute_list)))
         case_attributes = subject_df[case_attribute_list]
         case_attributes = case_attributes.set_index("subject_id")
     elif case_notion == ADMISSION_CASE_NOTION:
-        hadm_ids = list(cohort["hadm_id"].unique())
-        hadm_ids = [float(i) for i in hadm_ids]
-        hadm_df = extract_admissions_for_admission_ids(db_cursor, hadm_ids)
+        hadm_ids = get_cohort_ids(cohort, "hadm_id")
+        admission_columns = [col for col in case_attribute_list
+                             if col not in cohort_case_attributes]
+        hadm_df = extract_admissions_for_admission_ids(
+            db_cursor, hadm_ids, list(dict.fromkeys(admission_columns + ["hadm_id"])))
         cohort_data = cohort[["hadm_id", "age", "gender"]]
         hadm_df = hadm_df.merge(cohort_data, on="hadm_id", how="inner")
         icd_codes = extract_table_for_admission_ids(db_cursor, hadm_ids,
-                                                    "mimic_hosp", "diagnoses_icd")
+                                                    "mimic_hosp", "diagnoses_icd",
+                                                    ["hadm_id", "seq_num", "icd_code"])
         icd_codes = icd_codes.sort_values(["hadm_id", "seq_num"])
         icd_codes = icd_codes[["hadm_id", "icd_code"]]
         icd_codes = icd_codes.groupby(
             "hadm_id")["icd_code"].apply(list)  # type: ignore
         drg_codes = extract_table_for_admission_ids(
-            db_cursor, hadm_ids, "mimic_hosp", "drgcodes")
+            db_cursor, hadm_ids, "mimic_hosp", "drgcodes", ["hadm_id", "drg_code"])
         drg_codes = drg_codes[["hadm_id", "drg_code"]]
         drg_codes = drg_codes.groupby(
             "hadm_id")["drg_code"].apply(list)  # type: ignore
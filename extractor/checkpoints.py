@@ -0,0 +1,73 @@
+"""
+Provides checkpoints of extraction stages, so that an interrupted extraction can be resumed
+without extracting the finished stages again
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+from typing import Any, Callable, Dict, Optional, TypeVar
+import numpy as np
+from psycopg2.extensions import cursor
+
+from extractor.constants import CHECKPOINT_DIR
+from extractor.dictionary_cache import get_database_identity
+
+
+logger = logging.getLogger('cli')
+
+Result = TypeVar("Result")
+
+checkpoint_options: Dict[str, Any] = {"directory": None, "resume": False}
+
+
+def get_checkpoint_key(values: Any) -> str:
+    """Provides a hash of json serializable values (other values are hashed by their string)"""
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str)
+                        .encode("utf-8")).hexdigest()[:16]
+
+
+def get_id_digest(ids: np.ndarray) -> str:
+    """Provides a hash of an id array"""
+    return hashlib.sha1(np.ascontiguousarray(ids, dtype=np.int64).tobytes()).hexdigest()[:16]
+
+
+def get_checkpoint_directory(db_cursor: cursor, configuration: dict) -> str:
+    """Provides the checkpoint directory of an effective configuration and the database"""
+    return os.path.join(CHECKPOINT_DIR, get_database_identity(db_cursor),
+                        get_checkpoint_key(configuration))
+
+
+def configure_checkpoints(directory: Optional[str], resume: bool) -> None:
+    """
+    Enables writing checkpoints to a directory (or disables checkpoints if it is None).
+    With resume set, stages with a checkpoint are read from it instead of being run.
+    """
+    checkpoint_options["directory"] = directory
+    checkpoint_options["resume"] = resume
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        logger.info("Writing checkpoints to %s", directory)
+
+
+def run_checkpointed(stage_name: str, stage: Callable[[], Result]) -> Result:
+    """
+    Runs an extraction stage and writes its result to a checkpoint, or reads the result
+    from the checkpoint when resuming
+    """
+    directory = checkpoint_options["directory"]
+    if directory is None:
+        return stage()
+    checkpoint_file = os.path.join(directory, stage_name + ".pkl")
+    if checkpoint_options["resume"] and os.path.exists(checkpoint_file):
+        logger.info("Resuming stage %s from checkpoint", stage_name)
+        with open(checkpoint_file, "rb") as checkpoint:
+            return pickle.load(checkpoint)
+
+    result = stage()
+    temporary_file = checkpoint_file + ".tmp"
+    with open(temporary_file, "wb") as checkpoint:
+        pickle.dump(result, checkpoint, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_file, checkpoint_file)
+    return result
@@ -12,9 +12,10 @@ import pandas as pd
 
 from psycopg2 import connect
 from psycopg2.extensions import connection, cursor
+from psycopg2.pool import ThreadedConnectionPool
 
-from extractor.constants import ADMISSION_CASE_NOTION, ADMISSION_EVENT_TYPE,\
-    OTHER_EVENT_TYPE, POE_EVENT_TYPE, SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.constants import ADDITIONAL_ATTRIBUTES_QUESTION, ADMISSION_CASE_NOTION,\
+    ADMISSION_EVENT_TYPE, OTHER_EVENT_TYPE, POE_EVENT_TYPE, SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
 from extractor.extraction_helper import (subject_case_attributes, hadm_case_attributes,
                                          extract_table_columns, illicit_tables,
                                          get_table_module)
@@ -52,6 +53,13 @@ def create_db_connection(name: str, host: str, user: str, password: str) -> conn
     return con
 
 
+def create_db_pool(name: str, host: str, user: str, password: str,
+                   max_connections: int) -> ThreadedConnectionPool:
+    """Create a pool of database connections with supplied parameters"""
+    return ThreadedConnectionPool(1, max_connections, dbname=name, host=host, user=user,
+                                  password=password, client_encoding='utf8')
+
+
 def parse_or_ask_cohorts(args: Namespace, config_object: Optional[dict]) -> Tuple[
         Optional[List[str]], Optional[int],
         Optional[int], Optional[List[str]],
@@ -283,3 +291,22 @@ procedures, ...): \n""")
 
     return start_col, end_col, time_col, table, column_to_agg_list, \
         agg_method, filter_col, filter_val
+
+
+def ask_additional_event_attributes(db_cursor: cursor, event_log: pd.DataFrame) -> List[dict]:
+    """Asks for additional event attributes until declined and provides their specifications"""
+    attribute_specs = []
+    event_attribute_decision = input(ADDITIONAL_ATTRIBUTES_QUESTION)
+    while event_attribute_decision.upper() == "Y":
+        start_column, end_column, time_column, table_to_aggregate, column_to_aggregate,\
+            aggregation_method, filter_column, filter_values = ask_event_attributes(db_cursor,
+                                                                                    event_log)
+        attribute_specs.append({"start_column": start_column, "end_column": end_column,
+                                "time_column": time_column,
+                                "table_to_aggregate": table_to_aggregate,
+                                "column_to_aggregate": column_to_aggregate,
+                                "aggregation_method": aggregation_method,
+                                "filter_column": filter_column,
+                                "filter_values": filter_values})
+        event_attribute_decision = input(ADDITIONAL_ATTRIBUTES_QUESTION)
+    return attribute_specs
@@ -2,11 +2,12 @@
 Provides functionality for extracting a cohort defined by ICD and DRG codes, as well as patient ages
 """
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import pandas as pd
 from psycopg2.extensions import cursor
 from .extraction_helper import (extract_drgs, extract_icds, filter_icd_df,
-                                filter_drg_df, get_filename_string,
+                                filter_drg_df, get_filename_string, expand_icd_filter_list,
+                                read_sql_dataframe,
                                 extract_admissions, extract_patients, filter_age_ranges)
 
 
@@ -18,26 +19,18 @@ def extract_cohort_for_ids(db_cursor: cursor, subjects: Optional[str], admission
     """Selects a cohort of patients filters by provided hospital admission and/or subject ids"""
 
     logger.info("Begin extracting cohort!")
-    cohort = extract_admissions(db_cursor)
+    subject_ids = None
+    hadm_ids = None
     if admissions is not None:
         admissions_list = admissions.split(',')
         hadm_ids = [int(hadm_id) for hadm_id in admissions_list]
-        cohort = cohort.loc[cohort["hadm_id"].isin(hadm_ids)]
     if subjects is not None:
         subject_list = subjects.split(',')
         subject_ids = [int(subject_id) for subject_id in subject_list]
-        cohort = cohort.loc[cohort["subject_id"].isin(subject_ids)]
 
-    cohort = cohort[["subject_id", "hadm_id", "admittime"]]
-    cohort["admityear"] = cohort["admittime"].dt.year  # type: ignore
-    patients = extract_patients(db_cursor)
-    patients = patients[["subject_id", "anchor_age", "anchor_year", "gender"]]
-    cohort = cohort.merge(patients, on="subject_id", how="inner")
-    cohort["age"] = cohort["anchor_age"] + cohort["admityear"]  # type: ignore
-    cohort["age"] = cohort["age"] - cohort["anchor_year"]  # type: ignore
-    cohort.drop(["admittime", "admityear", "anchor_age",
-                "anchor_year"], axis=1, inplace=True)
-    cohort = cohort.reset_index().drop("index", axis=1)
+    sql_query, params = build_cohort_query(None, None, None, None, None, None, None,
+                                           subject_ids=subject_ids, hadm_ids=hadm_ids)
+    cohort = extract_cohort_with_query(db_cursor, sql_query, params)
 
     if save_intermediate:
         filename = get_filename_string("cohort_full", ".csv")
@@ -47,6 +40,107 @@ def extract_cohort_for_ids(db_cursor: cursor, subjects: Optional[str], admission
     return cohort
 
 
+def build_like_prefix_patterns(prefixes: List[str]) -> List[str]:
+    """Turns a list of code prefixes into escaped patterns for a LIKE ANY condition"""
+    patterns = []
+    for prefix in prefixes:
+        escaped = str(prefix).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        patterns.append(escaped + "%")
+    return patterns
+
+
+def build_icd_cohort_query(icd_version: int, parameter_name: str, aggregate_codes: bool) -> str:
+    """Generates a query selecting the admissions with a matching ICD code"""
+    sql_query = 'select hadm_id'
+    if aggregate_codes:
+        sql_query += ", array_agg(replace(icd_code, ' ', '') order by seq_num) as icd_code"
+    sql_query += ' from mimic_hosp.diagnoses_icd where seq_num <= %(icd_seq_num)s'
+    if icd_version != 0:
+        sql_query += ' and icd_version = %(icd_version)s'
+    sql_query += " and replace(icd_code, ' ', '') like any(%(" + parameter_name + ")s)"
+    sql_query += ' group by hadm_id'
+    return sql_query
+
+
+def build_cohort_query(icd_codes: Optional[List[str]], icd_version: Optional[int],
+                       icd_seq_num: Optional[int], drg_codes: Optional[List[str]],
+                       drg_type: Optional[str], ages: Optional[List[str]],
+                       icd_codes_intersection: Optional[List[str]],
+                       subject_ids: Optional[List[int]] = None,
+                       hadm_ids: Optional[List[int]] = None) -> Tuple[str, dict]:
+    """
+    Compiles the cohort filters into a single parameterized query, which returns the same
+    rows as the in-memory filtering of extract_cohort_in_memory
+    """
+    params: dict = {}
+    ctes = []
+    age_column = '(patients.anchor_age + extract(year from admissions.admittime)::integer \
+- patients.anchor_year)'
+    select_columns = ['admissions.subject_id', 'admissions.hadm_id', 'patients.gender',
+                      age_column + ' as age']
+    joins = ['join mimic_core.patients as patients \
+on patients.subject_id = admissions.subject_id']
+    conditions = []
+
+    if subject_ids is not None:
+        conditions.append('admissions.subject_id = any(%(subject_ids)s::bigint[])')
+        params["subject_ids"] = [int(i) for i in subject_ids]
+    if hadm_ids is not None:
+        conditions.append('admissions.hadm_id = any(%(hadm_ids)s::bigint[])')
+        params["hadm_ids"] = [int(i) for i in hadm_ids]
+
+    if ages is not None and ages not in ([''], []):
+        age_conditions = []
+        for index, age_interval in enumerate(ages):
+            age_min = str(age_interval).split(":", 1)[0]
+            age_max = str(age_interval).split(":", 1)[1]
+            params["age_min_" + str(index)] = int(age_min)
+            params["age_max_" + str(index)] = int(age_max)
+            age_conditions.append('(' + age_column + ' >= %(age_min_' + str(index) + ')s and '
+                                  + age_column + ' <= %(age_max_' + str(index) + ')s)')
+        conditions.append('(' + ' or '.join(age_conditions) + ')')
+
+    if icd_codes is not None and icd_version is not None and icd_seq_num is not None:
+        params["icd_seq_num"] = icd_seq_num
+        params["icd_version"] = icd_version
+        params["icd_patterns"] = build_like_prefix_patterns(
+            expand_icd_filter_list(icd_codes))
+        ctes.append('icd_cohort as (' +
+                    build_icd_cohort_query(icd_version, "icd_patterns", True) + ')')
+        select_columns.append('icd_cohort.icd_code')
+        joins.append('join icd_cohort on icd_cohort.hadm_id = admissions.hadm_id')
+        if icd_codes_intersection is not None:
+            params["icd_intersection_patterns"] = build_like_prefix_patterns(
+                expand_icd_filter_list(icd_codes_intersection))
+            ctes.append('icd_intersection as (' +
+                        build_icd_cohort_query(icd_version, "icd_intersection_patterns", False)
+                        + ')')
+            joins.append('join icd_intersection on icd_intersection.hadm_id = admissions.hadm_id')
+
+    if drg_codes is not None and drg_type is not None:
+        params["drg_type"] = drg_type
+        params["drg_codes"] = [str(i) for i in drg_codes]
+        select_columns += ['drgcodes.drg_type', 'drgcodes.drg_code', 'drgcodes.description',
+                           'drgcodes.drg_severity', 'drgcodes.drg_mortality']
+        joins.append('join mimic_hosp.drgcodes as drgcodes \
+on drgcodes.subject_id = admissions.subject_id and drgcodes.hadm_id = admissions.hadm_id \
+and drgcodes.drg_type = %(drg_type)s and drgcodes.drg_code = any(%(drg_codes)s)')
+
+    sql_query = ''
+    if len(ctes) > 0:
+        sql_query += 'with ' + ', '.join(ctes) + ' '
+    sql_query += 'select ' + ', '.join(select_columns) + \
+        ' from mimic_core.admissions as admissions ' + ' '.join(joins)
+    if len(conditions) > 0:
+        sql_query += ' where ' + ' and '.join(conditions)
+    return sql_query, params
+
+
+def extract_cohort_with_query(db_cursor: cursor, sql_query: str, params: dict) -> pd.DataFrame:
+    """Runs a compiled cohort query and returns the resulting cohort"""
+    return read_sql_dataframe(db_cursor, sql_query, params)
+
+
 def extract_cohort(db_cursor: cursor, icd_codes: Optional[List[str]], icd_version: Optional[int],
                    icd_seq_num: Optional[int], drg_codes: Optional[List[str]],
                    drg_type: Optional[str], ages: Optional[List[str]],
@@ -54,7 +148,43 @@ def extract_cohort(db_cursor: cursor, icd_codes: Optional[List[str]], icd_versio
                    save_intermediate: bool) -> pd.DataFrame:
     """
     Selects a cohort of patient filtered by age,
-    as well as ICD and DRG codes.
+    as well as ICD and DRG codes. All filters are evaluated by the database.
+    """
+    logger.info("Begin extracting cohort!")
+
+    if icd_codes is None:
+        logger.info("Skipping ICD code filtering...")
+    else:
+        logger.info("Using supplied ICD codes for cohort...")
+
+    if drg_codes is None:
+        logger.info("Skipping DRG code filtering...")
+    else:
+        logger.info("Using supplied DRG codes for cohort...")
+
+    sql_query, params = build_cohort_query(icd_codes, icd_version, icd_seq_num, drg_codes,
+                                           drg_type, ages, icd_codes_intersection)
+    cohort = extract_cohort_with_query(db_cursor, sql_query, params)
+
+    if save_intermediate:
+        filename = get_filename_string("cohort_full", ".csv")
+        cohort.to_csv("output/" + filename)
+
+    logger.info("Done extracting cohort!")
+
+    return cohort
+
+
+def extract_cohort_in_memory(db_cursor: cursor, icd_codes: Optional[List[str]],
+                             icd_version: Optional[int], icd_seq_num: Optional[int],
+                             drg_codes: Optional[List[str]], drg_type: Optional[str],
+                             ages: Optional[List[str]],
+                             icd_codes_intersection: Optional[List[str]],
+                             save_intermediate: bool) -> pd.DataFrame:
+    """
+    Selects a cohort of patient filtered by age,
+    as well as ICD and DRG codes. Loads the full tables and filters them in memory,
+    serves as reference for the query compiled by build_cohort_query.
     """
     logger.info("Begin extracting cohort!")
 
@@ -0,0 +1,91 @@
+"""
+Provides the export of event logs as columnar Parquet or Arrow IPC files
+"""
+from datetime import datetime
+import logging
+import os
+from typing import Optional
+import numpy as np
+import pandas as pd
+import pyarrow as pa  # type: ignore
+from pyarrow import feather, parquet  # type: ignore
+
+from extractor.constants import CATEGORY_RATIO
+
+
+logger = logging.getLogger('cli')
+
+columnar_formats = ["parquet", "arrow"]
+
+
+def prepare_columnar_frame(events: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts object columns into columnar types: timestamps to datetime columns,
+    repetitive strings to categorical columns and columns of mixed types to strings
+    """
+    events = events.copy()
+    for column in events.columns:
+        if not (pd.api.types.is_object_dtype(events[column]) or
+                pd.api.types.is_string_dtype(events[column])):
+            continue
+        values = events[column].dropna()
+        value_types = set(map(type, values))
+        if len(values) > 0 and all(issubclass(value_type, datetime)
+                                   for value_type in value_types):
+            events[column] = pd.to_datetime(events[column])
+        elif value_types <= {str}:
+            if values.nunique() <= CATEGORY_RATIO * len(values):
+                events[column] = events[column].astype("category")
+        else:
+            events[column] = events[column].where(events[column].isna(),
+                                                  events[column].astype(str))
+    return events
+
+
+def format_case_id(case_id: object) -> str:
+    """Formats a case id for a file name, without a decimal part for integral float ids"""
+    if isinstance(case_id, (float, np.floating)) and float(case_id).is_integer():
+        return str(int(case_id))
+    return str(case_id)
+
+
+def write_columnar_file(events: pd.DataFrame, file_path: str, file_format: str) -> None:
+    """Writes a data frame to a Parquet or uncompressed (memory-mappable) Arrow IPC file"""
+    table = pa.Table.from_pandas(events, preserve_index=False)
+    if file_format == "parquet":
+        parquet.write_table(table, file_path)
+    else:
+        feather.write_feather(table, file_path, compression="uncompressed")
+
+
+def write_columnar_log(events: pd.DataFrame, case_id_key: str, file_path: str,
+                       file_format: str, cases_per_partition: Optional[int] = None,
+                       missing_cases_name: str = "cases-missing") -> None:
+    """
+    Writes an event log as a columnar file. If cases_per_partition is given, the log is
+    sorted by case id and written into a directory with one file per range of cases,
+    named by the first and last case id of the range. Events without case id are written
+    to a file named missing_cases_name.
+    """
+    events = prepare_columnar_frame(events)
+    if cases_per_partition is None:
+        logger.info("Writing event log to %s", file_path)
+        write_columnar_file(events, file_path, file_format)
+        return
+
+    logger.info("Writing event log partitioned by %d cases to %s", cases_per_partition,
+                file_path)
+    os.makedirs(file_path, exist_ok=True)
+    events = events.sort_values(case_id_key, kind="stable")  # type: ignore
+    case_codes, case_ids = pd.factorize(events[case_id_key], sort=True)
+    for first_case in range(0, len(case_ids), cases_per_partition):
+        last_case = min(first_case + cases_per_partition, len(case_ids)) - 1
+        partition = events[(case_codes >= first_case) & (case_codes <= last_case)]
+        partition_name = "cases-" + format_case_id(case_ids[first_case]) + "-" + \
+            format_case_id(case_ids[last_case]) + "." + file_format
+        write_columnar_file(partition, os.path.join(file_path, partition_name), file_format)
+    missing_cases = case_codes < 0
+    if np.any(missing_cases):
+        write_columnar_file(events[missing_cases],
+                            os.path.join(file_path, missing_cases_name + "." + file_format),
+                            file_format)
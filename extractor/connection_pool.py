@@ -0,0 +1,69 @@
+"""
+Provides the execution of independent extraction steps on pooled database connections
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
+from typing import Any, Callable, Iterator, List, Optional, Sequence, TypeVar
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
+
+
+logger = logging.getLogger('cli')
+
+Item = TypeVar("Item")
+Result = TypeVar("Result")
+
+
+@contextmanager
+def pooled_cursor(db_pool: ThreadedConnectionPool) -> Iterator[cursor]:
+    """Provides a cursor on a connection of the pool, returning the connection afterwards"""
+    db_connection = db_pool.getconn()
+    try:
+        with db_connection.cursor() as db_cursor:
+            yield db_cursor
+    finally:
+        db_pool.putconn(db_connection)
+
+
+def call_with_pooled_cursor(db_pool: ThreadedConnectionPool, function: Callable[..., Result],
+                            *args: Any) -> Result:
+    """Calls a function with a cursor on a pooled connection as first argument"""
+    with pooled_cursor(db_pool) as db_cursor:
+        return function(db_cursor, *args)
+
+
+@contextmanager
+def pooled_executor(db_cursor: cursor, db_pool: Optional[ThreadedConnectionPool])\
+        -> Iterator[Callable[..., Future]]:
+    """
+    Provides a submit function for extraction functions taking a cursor as first argument.
+    With a connection pool, submitted calls run concurrently, each on its own pooled
+    connection. Without a pool, they run immediately on the given cursor.
+    """
+    if db_pool is None:
+        def submit_serially(function: Callable[..., Result], *args: Any) -> Future:
+            future: Future = Future()
+            future.set_result(function(db_cursor, *args))
+            return future
+        yield submit_serially
+        return
+
+    with ThreadPoolExecutor(max_workers=db_pool.maxconn) as executor:
+        def submit_pooled(function: Callable[..., Result], *args: Any) -> Future:
+            return executor.submit(call_with_pooled_cursor, db_pool, function, *args)
+        yield submit_pooled
+
+
+def map_with_pool(db_pool: ThreadedConnectionPool,
+                  function: Callable[[cursor, Item], Result],
+                  items: Sequence[Item]) -> List[Result]:
+    """
+    Applies a function to all items on a thread pool bounded by the size of the connection
+    pool. Every call gets a cursor on its own pooled connection. The results are returned
+    in the order of the items, independent of the order in which the calls finish.
+    """
+    max_workers = max(1, min(db_pool.maxconn, len(items)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda item: call_with_pooled_cursor(db_pool, function, item),
+                                 items))
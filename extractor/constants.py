@@ -17,3 +17,39 @@ ADMISSION_EVENT_TYPE = "ADMISSION"
 TRANSFER_EVENT_TYPE = "TRANSFER"
 POE_EVENT_TYPE = "POE"
 OTHER_EVENT_TYPE = "OTHER"
+
+# Number of rows fetched per round trip by server-side cursors
+FETCH_BATCH_SIZE = 100000
+
+# Id sets larger than this are staged in a temporary table instead of an array parameter
+ID_ARRAY_LIMIT = 10000
+
+# Maximum number of ids per array parameter if temporary tables are not available
+ID_BATCH_SIZE = 10000
+
+# Size in bytes up to which COPY output is buffered in memory before spilling to disk
+COPY_SPOOL_SIZE = 256 * 1024 * 1024
+
+# Directory in which the static dictionary tables (d_items, d_labitems, ...) are cached
+DICTIONARY_CACHE_DIR = "cache/dictionary_tables"
+
+# Number of events converted to records at once when streaming an XES log
+XES_CHUNK_SIZE = 100000
+
+# Maximum ratio of distinct to all values for which string columns are stored as categorical
+CATEGORY_RATIO = 0.5
+
+# Factor by which an extracted data frame exceeds the database row widths of its source tables
+SHARD_MEMORY_FACTOR = 4
+
+# Number of shards per worker process, so that workers finishing early can take over shards
+SHARDS_PER_WORKER = 4
+
+# Directory in which extracted logs are stored per admission for incremental extractions
+RESULT_STORE_DIR = "cache/result_store"
+
+# Directory in which the results of extraction stages are checkpointed
+CHECKPOINT_DIR = "cache/checkpoints"
+
+# Number of admissions whose ids parameterize the queries explained by the index advisor
+INDEX_ADVISOR_SAMPLE_SIZE = 1000
@@ -0,0 +1,89 @@
+"""
+Provides a bulk transport of query results via COPY ... TO STDOUT
+"""
+import logging
+import tempfile
+from typing import Any, Optional
+import pandas as pd
+from psycopg2 import Error
+from psycopg2.extensions import cursor, string_types
+
+from extractor.constants import COPY_SPOOL_SIZE
+
+
+logger = logging.getLogger('cli')
+
+transport_options = {"bulk_copy": False}
+
+# PostgreSQL type oids which the vectorized csv reader parses like the cursor does
+numeric_type_oids = [20, 21, 23, 700, 701]
+text_type_oids = [18, 19, 25, 1042, 1043]
+timestamp_type_oids = [1114, 1184]
+boolean_type_oids = [16]
+
+# marker of NULL values in the COPY output, to tell them apart from empty strings
+COPY_NULL = "\\N"
+
+
+def configure_bulk_copy(enabled: bool) -> None:
+    """Selects whether query results are transferred with COPY instead of cursor fetches"""
+    transport_options["bulk_copy"] = enabled
+
+
+def copy_query_to_dataframe(db_cursor: cursor, sql_query: str,
+                            params: Optional[Any] = None) -> Optional[pd.DataFrame]:
+    """
+    Transfers the result of a query as csv via COPY ... TO STDOUT into a spooled buffer
+    and parses it with the vectorized csv reader. Returns None if COPY fails, so that the
+    caller can fall back to the cursor based transport.
+    """
+    bound_query = db_cursor.mogrify(sql_query, params).decode("utf-8")
+    db_cursor.execute("savepoint copy_query")
+    try:
+        db_cursor.execute("select * from (" + bound_query + ") as copy_query limit 0")
+        description = db_cursor.description
+        with tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_SIZE, mode="w+b") as buffer:
+            db_cursor.copy_expert("copy (" + bound_query + ") to stdout with (format csv, "
+                                  "header true, null '" + COPY_NULL + "')", buffer)
+            buffer.seek(0)
+            table = parse_copy_buffer(db_cursor, buffer, description)
+    except Error as error:
+        db_cursor.execute("rollback to savepoint copy_query")
+        logger.info("COPY transport failed, falling back to cursor: %s", error)
+        return None
+    db_cursor.execute("release savepoint copy_query")
+    return table
+
+
+def parse_copy_buffer(db_cursor: cursor, buffer: Any, description: Any) -> pd.DataFrame:
+    """
+    Parses csv COPY output into a data frame with the dtypes of the cursor based transport.
+    Columns of other types (arrays, numeric, date, ...) are converted with the typecasters
+    psycopg2 uses for cursor results, e.g. into lists, Decimals and dates.
+    """
+    cols = list(map(lambda x: x[0], description))
+    type_codes = list(map(lambda x: x[1], description))
+    # read by position, as COPY output may contain duplicate column names
+    positions = [str(position) for position in range(len(cols))]
+    dtypes = {position: "object" for position, type_code in zip(positions, type_codes)
+              if type_code not in numeric_type_oids}
+    table = pd.read_csv(buffer, header=0, names=positions, dtype=dtypes,
+                        keep_default_na=False, na_values=[COPY_NULL], skip_blank_lines=False)
+    for position, type_code in zip(positions, type_codes):
+        if type_code in numeric_type_oids:
+            continue
+        if type_code in timestamp_type_oids:
+            table[position] = pd.to_datetime(table[position])
+        elif type_code in boolean_type_oids:
+            table[position] = table[position].map({"t": True, "f": False})
+        else:
+            typecaster = db_cursor.connection.string_types.get(type_code) \
+                or string_types.get(type_code)
+            if type_code not in text_type_oids and typecaster is not None:
+                table[position] = table[position].map(
+                    lambda value, cast=typecaster: cast(value, db_cursor), na_action="ignore")
+            # the cursor transport has None for NULL values of object columns
+            table[position] = table[position].astype(object).where(
+                table[position].notna(), None)  # type: ignore
+    table.columns = pd.Index(cols)
+    return table
@@ -0,0 +1,99 @@
+"""
+Provides a persistent on-disk cache for the static dictionary tables of MIMIC (d_items, ...)
+"""
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+import pandas as pd
+from pyarrow import ArrowException, feather  # type: ignore
+from psycopg2.extensions import cursor
+
+from extractor.constants import DICTIONARY_CACHE_DIR
+from extractor.extraction_helper import extract_table
+
+
+logger = logging.getLogger('cli')
+
+# Dictionary tables already loaded during this run, by cache file
+loaded_dictionary_tables: Dict[str, pd.DataFrame] = {}
+
+# Serializes loading and writing of cache files when tables are extracted in parallel
+dictionary_cache_lock = threading.Lock()
+
+
+def get_database_identity(db_cursor: cursor) -> str:
+    """Provides a hash identifying the database the cursor is connected to"""
+    dsn_parameters = db_cursor.connection.get_dsn_parameters()
+    db_cursor.execute("select current_database(), inet_server_addr()::text, inet_server_port()")
+    identity = [dsn_parameters.get("host"), dsn_parameters.get("port")] + \
+        list(db_cursor.fetchone())  # type: ignore
+    return hashlib.sha1(repr(identity).encode("utf-8")).hexdigest()[:16]
+
+
+def get_table_fingerprint(db_cursor: cursor, mimic_module: str, table_name: str) -> str:
+    """
+    Provides a hash of the columns and column types of a table, as well as the table's oid,
+    which changes whenever the table is dropped and loaded again
+    """
+    db_cursor.execute("select to_regclass(%s)::oid, string_agg(column_name || ':' || data_type, \
+                      ',' order by ordinal_position) from information_schema.columns \
+                      where table_schema = %s and table_name = %s",
+                      (mimic_module + "." + table_name, mimic_module, table_name))
+    fingerprint = db_cursor.fetchone()
+    return hashlib.sha1(repr(fingerprint).encode("utf-8")).hexdigest()[:16]
+
+
+def get_cache_file(db_cursor: cursor, mimic_module: str, table_name: str) -> str:
+    """Provides the cache file of a dictionary table for the current database and schema"""
+    return os.path.join(DICTIONARY_CACHE_DIR, get_database_identity(db_cursor),
+                        mimic_module + "." + table_name + "." +
+                        get_table_fingerprint(db_cursor, mimic_module, table_name) + ".arrow")
+
+
+def write_cache_file(table: pd.DataFrame, cache_file: str) -> None:
+    """Writes a dictionary table to an uncompressed (memory-mappable) Arrow IPC file"""
+    stale_prefix = cache_file.rsplit(".", 2)[0] + "."
+    for stale_file in glob.glob(glob.escape(stale_prefix) + "*.arrow"):
+        os.remove(stale_file)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temporary_file = cache_file + ".tmp"
+    feather.write_feather(table, temporary_file, compression="uncompressed")
+    os.replace(temporary_file, cache_file)
+
+
+def extract_dictionary_table(db_cursor: cursor, mimic_module: str, table_name: str,
+                             columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Extract a dictionary table, reading it from the local cache if it was cached for the
+    same database and schema before
+    """
+    cache_file = get_cache_file(db_cursor, mimic_module, table_name)
+    with dictionary_cache_lock:
+        if cache_file in loaded_dictionary_tables:
+            table = loaded_dictionary_tables[cache_file]
+        elif os.path.exists(cache_file):
+            logger.info("Reading %s.%s from dictionary cache", mimic_module, table_name)
+            table = feather.read_table(cache_file, memory_map=True).to_pandas()
+        else:
+            table = extract_table(db_cursor, mimic_module, table_name)
+            try:
+                write_cache_file(table, cache_file)
+            except (ArrowException, OSError, TypeError, ValueError) as error:
+                logger.info("Could not cache %s.%s: %s", mimic_module, table_name, error)
+        loaded_dictionary_tables[cache_file] = table
+
+    if columns is not None:
+        return table[columns]
+    return table
+
+
+def clear_dictionary_cache() -> None:
+    """Removes all cached dictionary tables"""
+    logger.info("Clearing dictionary cache...")
+    with dictionary_cache_lock:
+        loaded_dictionary_tables.clear()
+        shutil.rmtree(DICTIONARY_CACHE_DIR, ignore_errors=True)
@@ -1,11 +1,16 @@
 """Provides functionality to enhance event logs with event attributes"""
+from functools import partial
 import logging
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import warnings
+import numpy as np
 import pandas as pd
 from psycopg2.extensions import cursor
+from extractor.checkpoints import get_checkpoint_key, get_id_digest, run_checkpointed
+from extractor.id_sets import get_cohort_ids
 from .extraction_helper import (join_event_attributes_with_log_events)
 from .tables import (extract_tables)
+from .interval_aggregation import (aggregate_intervals_in_database, stage_intervals)
 
 warnings.filterwarnings("ignore")
 
@@ -16,39 +21,242 @@ def extract_event_attributes(db_cursor: cursor, log: pd.DataFrame, start_column:
                              end_column: str, time_column: str,
                              table_to_aggregate: str, column_to_aggregate: List[str],
                              aggregation_method: str, filter_column: Optional[str],
-                             filter_values: Optional[List[str]]) -> pd.DataFrame:
+                             filter_values: Optional[List[str]],
+                             aggregate_in_database: bool = False) -> pd.DataFrame:
     """
     Extracts event attributes for a given event log
     """
+    attribute_spec = {"start_column": start_column, "end_column": end_column,
+                      "time_column": time_column, "table_to_aggregate": table_to_aggregate,
+                      "column_to_aggregate": column_to_aggregate,
+                      "aggregation_method": aggregation_method, "filter_column": filter_column,
+                      "filter_values": filter_values}
+    return extract_event_attribute_specs(db_cursor, log, [attribute_spec],
+                                         aggregate_in_database)
 
+
+def group_attribute_specs(attribute_specs: List[dict],
+                          keys: List[str]) -> Dict[Tuple, List[int]]:
+    """Groups the indices of event attribute specs by the values of the given keys"""
+    groups: Dict[Tuple, List[int]] = {}
+    for index, attribute_spec in enumerate(attribute_specs):
+        group_key = tuple(attribute_spec.get(key) for key in keys)
+        groups.setdefault(group_key, []).append(index)
+    return groups
+
+
+def extract_event_attribute_specs(db_cursor: cursor, log: pd.DataFrame,
+                                  attribute_specs: List[dict],
+                                  aggregate_in_database: bool = False,
+                                  prefetched_tables: Optional[
+                                      Dict[Tuple[str, str], pd.DataFrame]] = None
+                                  ) -> pd.DataFrame:
+    """
+    Extracts event attributes for a given event log for a list of event attribute specs.
+    Specs are grouped by source table and time column, so every table is fetched and joined
+    with the log once, and all aggregations of a group are computed in one grouped pass.
+    Tables fetched in advance (by table and time column) are used instead of fetching them.
+    If aggregate_in_database is set, the log intervals are aggregated inside the database
+    instead, falling back to pandas for tables which can not be aggregated there.
+    """
     case_notion = "hadm_id"
     logger.info("Begin extracting event attributes!")
-    hospital_admission_ids = list(log[case_notion].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
+    hospital_admission_ids = get_cohort_ids(log, case_notion)
+
+    aggregated_dfs: Dict[int, pd.DataFrame] = {}
+    log_key = [get_id_digest(hospital_admission_ids), len(log), list(log.columns)]
+    table_groups = group_attribute_specs(attribute_specs, ["table_to_aggregate", "time_column"])
+    for (table_to_aggregate, time_column), table_indices in table_groups.items():
+        table_specs = [attribute_specs[index] for index in table_indices]
+        table_aggregated_dfs = run_checkpointed(
+            "event_attributes-" + get_checkpoint_key([table_specs, log_key]),
+            partial(aggregate_table_specs, db_cursor, log, hospital_admission_ids,
+                    table_to_aggregate, time_column, table_specs, case_notion,
+                    aggregate_in_database,
+                    (prefetched_tables or {}).get((table_to_aggregate, time_column))))
+        for index, aggregated_df in zip(table_indices, table_aggregated_dfs):
+            aggregated_dfs[index] = aggregated_df
+
+    for index, attribute_spec in enumerate(attribute_specs):
+        log = merge_event_attributes(log, aggregated_dfs[index], case_notion,
+                                     attribute_spec["start_column"],
+                                     attribute_spec["end_column"],
+                                     attribute_spec["column_to_aggregate"],
+                                     attribute_spec.get("filter_column"),
+                                     attribute_spec.get("filter_values"))
+
+    logger.info("Done extracting event attributes!")
+
+    return log
 
+
+def aggregate_table_specs(db_cursor: cursor, log: pd.DataFrame,
+                          hospital_admission_ids: np.ndarray, table_to_aggregate: str,
+                          time_column: str, table_specs: List[dict], case_notion: str,
+                          aggregate_in_database: bool,
+                          prefetched_table: Optional[pd.DataFrame]) -> List[pd.DataFrame]:
+    """
+    Aggregates the specs of a table over the log intervals, inside the database if requested
+    and possible, in pandas otherwise
+    """
+    table_aggregated_dfs = None
+    if aggregate_in_database:
+        table_aggregated_dfs = aggregate_table_in_database(
+            db_cursor, log, table_to_aggregate, time_column, table_specs, case_notion)
+    if table_aggregated_dfs is None:
+        table_aggregated_dfs = aggregate_table(
+            db_cursor, log, hospital_admission_ids, table_to_aggregate, time_column,
+            table_specs, case_notion, prefetched_table)
+    return table_aggregated_dfs
+
+
+def fetch_event_attribute_table(db_cursor: cursor, hospital_admission_ids: np.ndarray,
+                                table_to_aggregate: str, time_column: str,
+                                attribute_specs: List[dict]) -> pd.DataFrame:
+    """
+    Fetches a table once for a list of specs sharing it, with the columns needed by all of
+    them, sorted by case and time
+    """
+    case_notion = "hadm_id"
+    required_columns = [case_notion, time_column]
+    for attribute_spec in attribute_specs:
+        required_columns += list(attribute_spec["column_to_aggregate"])
+        if attribute_spec.get("filter_column") is not None:
+            required_columns.append(attribute_spec["filter_column"])
     event_attributes = extract_tables(db_cursor, [table_to_aggregate],
-                                      hospital_admission_ids, None, pd.DataFrame())
+                                      hospital_admission_ids, None, pd.DataFrame(),
+                                      list(dict.fromkeys(required_columns)))
+    return event_attributes.sort_values([case_notion, time_column])
 
-    event_attributes = event_attributes.sort_values([case_notion, time_column])
 
-    joined_df = join_event_attributes_with_log_events(log, event_attributes, case_notion,
-                                                      time_column, start_column, end_column)
-    aggregation_dict = {}
-    for col in column_to_aggregate:
-        aggregation_dict[col] = aggregation_method
+def aggregate_table(db_cursor: cursor, log: pd.DataFrame, hospital_admission_ids: np.ndarray,
+                    table_to_aggregate: str, time_column: str, attribute_specs: List[dict],
+                    case_notion: str,
+                    event_attributes: Optional[pd.DataFrame] = None) -> List[pd.DataFrame]:
+    """
+    Aggregates a table over the distinct log intervals in pandas for a list of specs sharing
+    it. The table is fetched unless it was fetched in advance.
+    """
+    if event_attributes is None:
+        event_attributes = fetch_event_attribute_table(db_cursor, hospital_admission_ids,
+                                                       table_to_aggregate, time_column,
+                                                       attribute_specs)
 
-    if filter_column is not None:
-        aggregated_df = joined_df.groupby([case_notion, filter_column, start_column, end_column])\
-            .agg(aggregation_dict).reset_index()  # type: ignore
-    else:
-        aggregated_df = joined_df.groupby([case_notion, start_column, end_column])\
-            .agg(aggregation_dict).reset_index()  # type: ignore
+    aggregated_dfs: List[pd.DataFrame] = [pd.DataFrame()] * len(attribute_specs)
+    interval_groups = group_attribute_specs(attribute_specs, ["start_column", "end_column"])
+    for (start_column, end_column), interval_indices in interval_groups.items():
+        # every interval is joined once, so that log events sharing an interval do not count
+        # its event attributes several times, like aggregate_intervals_in_database
+        intervals = log[list(dict.fromkeys([case_notion, start_column, end_column]))]\
+            .drop_duplicates()
+        joined_df = join_event_attributes_with_log_events(intervals, event_attributes,
+                                                          case_notion, time_column,
+                                                          start_column, end_column)
+        interval_specs = [attribute_specs[index] for index in interval_indices]
+        interval_aggregated_dfs = aggregate_event_attributes(
+            joined_df, interval_specs, case_notion, start_column, end_column)
+        for index, aggregated_df in zip(interval_indices, interval_aggregated_dfs):
+            aggregated_dfs[index] = aggregated_df
+    return aggregated_dfs
+
+
+def aggregate_table_in_database(db_cursor: cursor, log: pd.DataFrame, table_to_aggregate: str,
+                                time_column: str, attribute_specs: List[dict],
+                                case_notion: str) -> Optional[List[pd.DataFrame]]:
+    """
+    Aggregates a table over the log intervals inside the database for a list of specs
+    sharing it. Returns None if the table can not be aggregated in the database.
+    """
+    logger.info("Aggregating %s in the database", table_to_aggregate)
+    aggregated_dfs: List[pd.DataFrame] = [pd.DataFrame()] * len(attribute_specs)
+    interval_groups = group_attribute_specs(attribute_specs, ["start_column", "end_column"])
+    for (start_column, end_column), interval_indices in interval_groups.items():
+        interval_table = stage_intervals(db_cursor, log, case_notion, start_column, end_column)
+        if interval_table is None:
+            return None
+        interval_specs = [attribute_specs[index] for index in interval_indices]
+        interval_aggregated_dfs: List[pd.DataFrame] = [pd.DataFrame()] * len(interval_specs)
+        filter_groups = group_attribute_specs(interval_specs, ["filter_column"])
+        for (filter_column,), filter_indices in filter_groups.items():
+            filter_values: Optional[List[str]] = []
+            for index in filter_indices:
+                spec_filter_values = interval_specs[index].get("filter_values")
+                if spec_filter_values is None or filter_values is None:
+                    filter_values = None
+                else:
+                    filter_values += list(spec_filter_values)
+            grouped_df = aggregate_intervals_in_database(
+                db_cursor, interval_table, table_to_aggregate, time_column, case_notion,
+                start_column, end_column, filter_column, filter_values,
+                get_aggregations(interval_specs, filter_indices))
+            if grouped_df is None:
+                logger.info("Falling back to aggregating %s in pandas", table_to_aggregate)
+                return None
+            split_aggregations(grouped_df, interval_specs, filter_indices,
+                               interval_aggregated_dfs)
+        for index, aggregated_df in zip(interval_indices, interval_aggregated_dfs):
+            aggregated_dfs[index] = aggregated_df
+    return aggregated_dfs
+
+
+def get_aggregations(attribute_specs: List[dict], indices: List[int]) -> List[Tuple[str, str]]:
+    """Provides the distinct (column, aggregation method) pairs of the given specs"""
+    aggregations: List[Tuple[str, str]] = []
+    for index in indices:
+        for col in attribute_specs[index]["column_to_aggregate"]:
+            aggregation = (col, attribute_specs[index]["aggregation_method"])
+            if aggregation not in aggregations:
+                aggregations.append(aggregation)
+    return aggregations
+
+
+def split_aggregations(grouped_df: pd.DataFrame, attribute_specs: List[dict],
+                       indices: List[int], aggregated_dfs: List[pd.DataFrame]) -> None:
+    """
+    Splits a grouped aggregation with (column, aggregation method) columns into the
+    aggregated data frames of the given specs
+    """
+    for index in indices:
+        column_to_aggregate = attribute_specs[index]["column_to_aggregate"]
+        aggregation_method = attribute_specs[index]["aggregation_method"]
+        aggregated_df = grouped_df[[(col, aggregation_method)  # type: ignore
+                                    for col in column_to_aggregate]]
+        aggregated_df.columns = pd.Index(column_to_aggregate)
+        aggregated_dfs[index] = aggregated_df.reset_index()
+
+
+def aggregate_event_attributes(joined_df: pd.DataFrame, attribute_specs: List[dict],
+                               case_notion: str, start_column: str,
+                               end_column: str) -> List[pd.DataFrame]:
+    """
+    Aggregates joined event attributes for a list of specs sharing the same log interval.
+    Specs with the same filter column are aggregated in a single groupby.
+    """
+    aggregated_dfs: List[pd.DataFrame] = [pd.DataFrame()] * len(attribute_specs)
+    filter_groups = group_attribute_specs(attribute_specs, ["filter_column"])
+    for (filter_column,), filter_indices in filter_groups.items():
+        if filter_column is not None:
+            group_columns = [case_notion, filter_column, start_column, end_column]
+        else:
+            group_columns = [case_notion, start_column, end_column]
 
-    aggregated_df[start_column] = aggregated_df[start_column].apply(
-        pd.to_datetime)
-    aggregated_df[end_column] = aggregated_df[end_column].apply(pd.to_datetime)
-    log[start_column] = log[start_column].apply(pd.to_datetime)
-    log[end_column] = log[end_column].apply(pd.to_datetime)
+        aggregation_dict: Dict[str, List[str]] = {}
+        for col, aggregation_method in get_aggregations(attribute_specs, filter_indices):
+            aggregation_dict.setdefault(col, []).append(aggregation_method)
+        grouped_df = joined_df.groupby(group_columns).agg(aggregation_dict)  # type: ignore
+        split_aggregations(grouped_df, attribute_specs, filter_indices, aggregated_dfs)
+    return aggregated_dfs
+
+
+def merge_event_attributes(log: pd.DataFrame, aggregated_df: pd.DataFrame, case_notion: str,
+                           start_column: str, end_column: str, column_to_aggregate: List[str],
+                           filter_column: Optional[str],
+                           filter_values: Optional[List[str]]) -> pd.DataFrame:
+    """Merges aggregated event attributes into the log events"""
+    aggregated_df[start_column] = pd.to_datetime(aggregated_df[start_column])
+    aggregated_df[end_column] = pd.to_datetime(aggregated_df[end_column])
+    log[start_column] = pd.to_datetime(log[start_column])
+    log[end_column] = pd.to_datetime(log[end_column])
 
     if filter_column is not None and filter_values is not None:
         for filter_val in filter_values:
@@ -62,7 +270,4 @@ def extract_event_attributes(db_cursor: cursor, log: pd.DataFrame, start_column:
     else:
         log = log.merge(aggregated_df, on=[
                         case_notion, start_column, end_column], how="left")
-
-    logger.info("Done extracting event attributes!")
-
     return log
@@ -2,57 +2,138 @@
 Provides helper methods for extraction of data frames from Mimic
 """
 import logging
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
 import re
+import uuid
+import numpy as np
 import pandas as pd
 import pandasql as ps
 from psycopg2.extensions import cursor
 
+from extractor.constants import FETCH_BATCH_SIZE
+from extractor.copy_transport import copy_query_to_dataframe, transport_options
+from extractor.id_sets import build_id_filter, get_cohort_ids, id_set_filters
+from extractor.interval_join import interval_join
+from extractor.profiling import profile_options, profile_query_frames
+
 
 logger = logging.getLogger('cli')
 
 
+def fetch_dataframe_batches(db_cursor: cursor, sql_query: str, params: Optional[Any] = None,
+                            batch_size: int = FETCH_BATCH_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Executes a query on a named (server-side) cursor and yields the result in data frames
+    of at most batch_size rows. An empty result yields a single empty data frame.
+    """
+    server_cursor = db_cursor.connection.cursor(name="extraction_" + uuid.uuid4().hex)
+    try:
+        server_cursor.itersize = batch_size
+        server_cursor.execute(sql_query, params)
+        yielded_batch = False
+        while True:
+            rows = server_cursor.fetchmany(batch_size)
+            cols = list(map(lambda x: x[0], server_cursor.description))
+            if len(rows) == 0:
+                if not yielded_batch:
+                    yield pd.DataFrame(columns=cols)
+                break
+            yield pd.DataFrame(rows, columns=cols)
+            yielded_batch = True
+            del rows
+    finally:
+        server_cursor.close()
+
+
+def concat_dataframe_batches(batches: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenates data frame batches of the same query. Columns that are completely empty in
+    a batch are cast to the dtype of the other batches, so that e.g. integer and timestamp
+    columns do not degrade to object columns.
+    """
+    frames = list(batches)
+    if len(frames) == 0:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+
+    for column in frames[0].columns:
+        empty_frames = []
+        target_dtype = None
+        for index, frame in enumerate(frames):
+            if frame[column].isna().all():
+                empty_frames.append(index)
+            elif target_dtype is None:
+                target_dtype = frame[column].dtype
+        if target_dtype is None or len(empty_frames) == 0 or target_dtype.kind not in "iufM":
+            continue
+        if target_dtype.kind in "iu":
+            target_dtype = "float64"
+        for index in empty_frames:
+            frames[index][column] = frames[index][column].astype(target_dtype)
+
+    table = pd.concat(frames, ignore_index=True)
+    del frames
+    return table
+
+
+def fetch_query_frames(db_cursor: cursor, sql_query: str,
+                       params: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yields the result of a query as data frames, either as a single frame transferred via
+    COPY (if bulk copy is enabled) or in batches from a server-side cursor
+    """
+    if profile_options["enabled"]:
+        yield from profile_query_frames(db_cursor, sql_query, params,
+                                        fetch_query_frames_unprofiled(db_cursor, sql_query,
+                                                                      params))
+    else:
+        yield from fetch_query_frames_unprofiled(db_cursor, sql_query, params)
+
+
+def fetch_query_frames_unprofiled(db_cursor: cursor, sql_query: str,
+                                  params: Optional[Any] = None) -> Iterator[pd.DataFrame]:
+    """Yields the result of a query as data frames via the configured transport"""
+    if transport_options["bulk_copy"]:
+        table = copy_query_to_dataframe(db_cursor, sql_query, params)
+        if table is not None:
+            yield table
+            return
+    yield from fetch_dataframe_batches(db_cursor, sql_query, params)
+
+
+def read_sql_dataframe(db_cursor: cursor, sql_query: str,
+                       params: Optional[Any] = None) -> pd.DataFrame:
+    """Reads the result of a query into a data frame batch by batch"""
+    return concat_dataframe_batches(fetch_query_frames(db_cursor, sql_query, params))
+
+
 def extract_icd_descriptions(db_cursor: cursor) -> pd.DataFrame:
     """Extract ICD Codes and descriptions"""
-    db_cursor.execute("SELECT * FROM mimic_hosp.d_icd_diagnoses")
-    desc_icd = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    desc_icd_df = pd.DataFrame(desc_icd, columns=cols)
+    desc_icd_df = read_sql_dataframe(db_cursor, "SELECT * FROM mimic_hosp.d_icd_diagnoses")
     desc_icd_df = desc_icd_df[["icd_code", "long_title"]]
     return desc_icd_df
 
 
 def extract_icds(db_cursor: cursor) -> pd.DataFrame:
     """Extract ICD Codes"""
-    db_cursor.execute('SELECT * FROM mimic_hosp.diagnoses_icd')
-    icds = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(icds, columns=cols)
+    return read_sql_dataframe(db_cursor, 'SELECT * FROM mimic_hosp.diagnoses_icd')
 
 
 def extract_drgs(db_cursor: cursor) -> pd.DataFrame:
     """Extract DRG Codes"""
-    db_cursor.execute("SELECT * from mimic_hosp.drgcodes")
-    drgs = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(drgs, columns=cols)
+    return read_sql_dataframe(db_cursor, "SELECT * from mimic_hosp.drgcodes")
 
 
 def extract_admissions(db_cursor: cursor) -> pd.DataFrame:
     """Extract admissions"""
-    db_cursor.execute('SELECT * FROM mimic_core.admissions')
-    adm = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(adm, columns=cols)
+    return read_sql_dataframe(db_cursor, 'SELECT * FROM mimic_core.admissions')
 
 
 def extract_patients(db_cursor: cursor) -> pd.DataFrame:
     """Extract patients"""
-    db_cursor.execute("SELECT * from mimic_core.patients")
-    patients = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(patients, columns=cols)
+    return read_sql_dataframe(db_cursor, "SELECT * from mimic_core.patients")
 
 
 def filter_age_ranges(cohort: pd.DataFrame, ages: List[str]) -> pd.DataFrame:
@@ -68,14 +149,8 @@ def filter_age_ranges(cohort: pd.DataFrame, ages: List[str]) -> pd.DataFrame:
     return cohort
 
 
-def filter_icd_df(icds: pd.DataFrame, icd_filter_list: List[str], icd_version: int) -> pd.DataFrame:
-    """Filter a dataframe for a list of supplied ICD codes"""
-    icds["icd_code"] = icds["icd_code"].str.replace(" ", "") # type: ignore
-    if icd_version != 0:
-        icd_filter = icds.loc[icds["icd_version"] == icd_version]
-    else:
-        icd_filter = icds
-
+def expand_icd_filter_list(icd_filter_list: List[str]) -> List[str]:
+    """Expands ICD code ranges (e.g. 410:414, I20:I25) into a list of ICD code prefixes"""
     cond_list = []
 
     for icd_filter_element in icd_filter_list:
@@ -109,7 +184,18 @@ def filter_icd_df(icds: pd.DataFrame, icd_filter_list: List[str], icd_version: i
         else:
             cond_list.append(icd_filter_element)
 
-    cond_list = tuple(cond_list) # type: ignore
+    return cond_list
+
+
+def filter_icd_df(icds: pd.DataFrame, icd_filter_list: List[str], icd_version: int) -> pd.DataFrame:
+    """Filter a dataframe for a list of supplied ICD codes"""
+    icds["icd_code"] = icds["icd_code"].str.replace(" ", "") # type: ignore
+    if icd_version != 0:
+        icd_filter = icds.loc[icds["icd_version"] == icd_version]
+    else:
+        icd_filter = icds
+
+    cond_list = tuple(expand_icd_filter_list(icd_filter_list))
 
     icd_filter = icd_filter.loc[icd_filter["icd_code"].str.startswith(cond_list, # type: ignore
                                 na=False)] # type: ignore
@@ -125,110 +211,226 @@ def filter_drg_df(hf_drg: pd.DataFrame, drg_filter_list: List[str]) -> pd.DataFr
     return hf_filter
 
 
-def build_sql_query(table_module: str, table_name: str, id_type: str) -> str:
+def build_column_list(table_reference: str, columns: Optional[List[str]]) -> str:
+    """Generates the select list of a query, selecting all columns if none are given"""
+    if columns is None:
+        return table_reference + '.*'
+    return ', '.join([table_reference + '.' + column for column in columns])
+
+
+def build_sql_query(table_module: str, table_name: str, id_type: str,
+                    id_table: Optional[str] = None, columns: Optional[List[str]] = None) -> str:
     """Generates sql query"""
-    sql_query = 'select ' + table_module + '.' + table_name + '.* \
-                       from ' + table_module + '.' + table_name + ' join (values {0}) \
-                       as to_join(' + id_type + ') \
-                       ON ' + table_module + '.' + table_name + '.' + id_type + ' \
-                       = to_join.' + id_type
+    sql_query = 'select ' + build_column_list(table_module + '.' + table_name, columns) + ' \
+                       from ' + table_module + '.' + table_name + ' \
+                       where ' + build_id_filter(table_module + '.' + table_name + '.' + id_type,
+                                                 id_type, id_table)
     return sql_query
 
 
-def extract_ed_table_for_ed_stays(db_cursor: cursor, ed_stays: List,
-                                  table_name: str) -> pd.DataFrame:
+def read_sql_dataframe_for_ids(db_cursor: cursor, ids: Iterable, id_type: str,
+                               query_builder: Callable[[Optional[str]], str]) -> pd.DataFrame:
+    """
+    Reads the result of an id restricted query into a data frame. The query_builder
+    receives the temporary id table (or None for an id array parameter) and returns the query.
+    """
+    batches = (batch for id_table, params in id_set_filters(db_cursor, id_type, ids)
+               for batch in fetch_query_frames(db_cursor, query_builder(id_table), params))
+    return concat_dataframe_batches(batches)
+
+
+def extract_table_for_ids(db_cursor: cursor, ids: Iterable, mimic_module: str,
+                          table_name: str, id_type: str,
+                          columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Extract any table in MIMIC for a list of ids of the given id type.
+    If columns are given, only these columns are fetched.
+    """
+    return read_sql_dataframe_for_ids(
+        db_cursor, ids, id_type,
+        lambda id_table: build_sql_query(mimic_module, table_name, id_type, id_table, columns))
+
+
+def extract_ed_table_for_ed_stays(db_cursor: cursor, ed_stays: Iterable, table_name: str,
+                                  columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Extract emergency department table for a list of ed stays"""
-    sql_id_list = prepare_id_list_for_sql(ed_stays)
-    sql_query = build_sql_query("mimic_ed", table_name, "stay_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    ed_table = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(ed_table, columns=cols)
+    return extract_table_for_ids(db_cursor, ed_stays, "mimic_ed", table_name, "stay_id",
+                                 columns)
 
 
 def extract_emergency_department_stays_for_admission_ids(db_cursor: cursor,
-                                                         hospital_admission_ids: List
+                                                         hospital_admission_ids: Iterable
                                                          ) -> pd.DataFrame:
     """Extract ed stays for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_admission_ids)
-    sql_query = build_sql_query("mimic_ed", "edstays", "hadm_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    ed_stays = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(ed_stays, columns=cols)
+    return extract_table_for_ids(db_cursor, hospital_admission_ids, "mimic_ed", "edstays",
+                                 "hadm_id")
 
 
 def extract_admissions_for_admission_ids(db_cursor: cursor,
-                                         hospital_admission_ids: List) -> pd.DataFrame:
+                                         hospital_admission_ids: Iterable,
+                                         columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Extract admissions for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_admission_ids)
-    sql_query = build_sql_query("mimic_core", "admissions", "hadm_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    adm = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(adm, columns=cols)
+    return extract_table_for_ids(db_cursor, hospital_admission_ids, "mimic_core", "admissions",
+                                 "hadm_id", columns)
 
 
 def extract_transfers_for_admission_ids(db_cursor: cursor,
-                                        hospital_admission_ids: List) -> pd.DataFrame:
+                                        hospital_admission_ids: Iterable) -> pd.DataFrame:
     """Extract transfers for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_admission_ids)
-    sql_query = build_sql_query("mimic_core", "transfers", "hadm_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    transfers = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(transfers, columns=cols)
+    return extract_table_for_ids(db_cursor, hospital_admission_ids, "mimic_core", "transfers",
+                                 "hadm_id")
+
+
+def build_poe_query(id_table: Optional[str] = None) -> str:
+    """
+    Generates sql query for provider order entries, joined with a single detail
+    (field_name, field_value) per poe_id which is selected in the database
+    """
+    sql_query = 'with cohort_poe as (' + build_sql_query("mimic_hosp", "poe", "hadm_id",
+                                                         id_table) + ') \
+                       select cohort_poe.*, poe_detail.field_name, poe_detail.field_value \
+                       from cohort_poe left join ( \
+                       select distinct on (mimic_hosp.poe_detail.poe_id) \
+                       mimic_hosp.poe_detail.poe_id, mimic_hosp.poe_detail.field_name, \
+                       mimic_hosp.poe_detail.field_value from mimic_hosp.poe_detail \
+                       where mimic_hosp.poe_detail.poe_id in (select poe_id from cohort_poe) \
+                       order by mimic_hosp.poe_detail.poe_id, mimic_hosp.poe_detail.field_name \
+                       ) as poe_detail on poe_detail.poe_id = cohort_poe.poe_id'
+    return sql_query
 
 
 def extract_poe_for_admission_ids(db_cursor: cursor,
-                                  hospital_admission_ids: List) -> pd.DataFrame:
+                                  hospital_admission_ids: Iterable) -> pd.DataFrame:
     """Extract provider order entries for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_admission_ids)
-    sql_query = build_sql_query("mimic_hosp", "poe", "hadm_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    poe = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    poe_df = pd.DataFrame(poe, columns=cols)
-    db_cursor.execute(
-        'SELECT * FROM mimic_hosp.poe_detail')
-    poe_d = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    poe_d_df = pd.DataFrame(poe_d, columns=cols)
-    poe_d_df = poe_d_df.drop_duplicates(
-        "poe_id")[["poe_id", "field_name", "field_value"]]
-    poe_df = poe_df.merge(poe_d_df, how="left", on="poe_id")
-    return poe_df
+    return read_sql_dataframe_for_ids(db_cursor, hospital_admission_ids, "hadm_id",
+                                      build_poe_query)
+
+
+def build_emar_detail_query(id_table: Optional[str] = None) -> str:
+    """
+    Generates sql query for the emar details of the emar entries of a set of hospital
+    admissions, so that emar does not need to be fetched first
+    """
+    sql_query = 'select mimic_hosp.emar_detail.* from mimic_hosp.emar_detail \
+                       where mimic_hosp.emar_detail.emar_id in ( \
+                       select mimic_hosp.emar.emar_id from mimic_hosp.emar \
+                       where ' + build_id_filter('mimic_hosp.emar.hadm_id', 'hadm_id',
+                                                 id_table) + ')'
+    return sql_query
+
+
+def extract_emar_detail_for_admission_ids(db_cursor: cursor,
+                                          hospital_admission_ids: Iterable) -> pd.DataFrame:
+    """Extract emar details of the emar entries for a list of hospital admission ids"""
+    return read_sql_dataframe_for_ids(db_cursor, hospital_admission_ids, "hadm_id",
+                                      build_emar_detail_query)
+
+
+def merge_column_references(left: List[Tuple[str, str]], right: List[Tuple[str, str]],
+                            keys: List[str]) -> List[Tuple[str, str]]:
+    """
+    Provides the (column reference, column name) pairs of merging two column lists on the
+    given keys, with the column names (and _x/_y suffixes) of a pandas merge
+    """
+    left_names = [name for _, name in left]
+    right_names = [name for _, name in right if name not in keys]
+    overlap = set(left_names) & set(right_names)
+    merged = [(reference, name + "_x" if name in overlap else name) for reference, name in left]
+    merged += [(reference, name + "_y" if name in overlap else name) for reference, name in right
+               if name not in keys]
+    return merged
+
+
+def table_column_references(db_cursor: cursor, table_alias: str, mimic_module: str,
+                            table_name: str,
+                            columns: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    """Provides the (column reference, column name) pairs of the columns of a table"""
+    if columns is None:
+        columns = extract_table_columns(db_cursor, mimic_module, table_name)
+    return [(table_alias + "." + column, column) for column in columns]
+
+
+def build_medication_select_list(db_cursor: cursor) -> str:
+    """
+    Generates the select list of pharmacy orders merged with their prescriptions and
+    emar administrations (with emar details), named like the merged data frames
+    """
+    medications = merge_column_references(
+        table_column_references(db_cursor, "pharmacy", "mimic_hosp", "pharmacy"),
+        table_column_references(db_cursor, "prescriptions", "mimic_hosp", "prescriptions",
+                                prescription_detail_columns),
+        ["pharmacy_id"])
+    emar = merge_column_references(
+        table_column_references(db_cursor, "emar", "mimic_hosp", "emar"),
+        table_column_references(db_cursor, "emar_detail", "mimic_hosp", "emar_detail"),
+        ["emar_id", "subject_id", "emar_seq", "pharmacy_id"])
+    emar_renames = {"medication": "emar_medication", "route": "emar_route"}
+    emar = [(reference, emar_renames.get(name, name)) for reference, name in emar]
+    medications = merge_column_references(medications, emar,
+                                          ["poe_id", "hadm_id", "subject_id", "pharmacy_id"])
+    return ', '.join([reference + ' as "' + name + '"' for reference, name in medications])
+
+
+def build_medication_query(select_list: str, id_table: Optional[str] = None) -> str:
+    """
+    Generates sql query for pharmacy orders of a set of hospital admissions, enriched with
+    prescriptions and emar administrations, with a single row per poe_id selected in the
+    database. Like the merge in pandas, the first prescription and emar detail in table
+    order (ctid) are kept.
+    """
+    sql_query = 'select distinct on (pharmacy.poe_id) ' + select_list + ' \
+                       from mimic_hosp.pharmacy \
+                       left join mimic_hosp.prescriptions \
+                       on prescriptions.pharmacy_id = pharmacy.pharmacy_id \
+                       left join (mimic_hosp.emar left join mimic_hosp.emar_detail \
+                       on emar_detail.emar_id = emar.emar_id \
+                       and emar_detail.subject_id = emar.subject_id \
+                       and emar_detail.emar_seq = emar.emar_seq \
+                       and emar_detail.pharmacy_id = emar.pharmacy_id) \
+                       on emar.poe_id = pharmacy.poe_id and emar.hadm_id = pharmacy.hadm_id \
+                       and emar.subject_id = pharmacy.subject_id \
+                       and emar.pharmacy_id = pharmacy.pharmacy_id \
+                       where pharmacy.poe_id is not null \
+                       and ' + build_id_filter('pharmacy.hadm_id', 'hadm_id', id_table) + ' \
+                       order by pharmacy.poe_id, pharmacy.pharmacy_id, prescriptions.ctid, \
+                       emar.emar_seq, emar_detail.ctid'
+    return sql_query
+
+
+def extract_medications_for_admission_ids(db_cursor: cursor,
+                                          hospital_admission_ids: Iterable) -> pd.DataFrame:
+    """
+    Extract pharmacy orders enriched with prescriptions and emar administrations for a
+    list of hospital admission ids, with one row per poe_id
+    """
+    select_list = build_medication_select_list(db_cursor)
+    return read_sql_dataframe_for_ids(
+        db_cursor, hospital_admission_ids, "hadm_id",
+        lambda id_table: build_medication_query(select_list, id_table))
 
 
-def extract_table_for_admission_ids(db_cursor: cursor, hospital_admission_ids: List,
-                                    mimic_module: str, table_name: str) -> pd.DataFrame:
+def extract_table_for_admission_ids(db_cursor: cursor, hospital_admission_ids: Iterable,
+                                    mimic_module: str, table_name: str,
+                                    columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Extract any table in MIMIC for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_admission_ids)
-    sql_query = build_sql_query(mimic_module, table_name, "hadm_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    table = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(table, columns=cols)
+    return extract_table_for_ids(db_cursor, hospital_admission_ids, mimic_module, table_name,
+                                 "hadm_id", columns)
 
 
-def extract_table_for_subject_ids(db_cursor: cursor, hospital_subject_ids: List,
-                                  mimic_module: str, table_name: str) -> pd.DataFrame:
+def extract_table_for_subject_ids(db_cursor: cursor, hospital_subject_ids: Iterable,
+                                  mimic_module: str, table_name: str,
+                                  columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Extract any table in MIMIC for a list of hospital admission ids"""
-    sql_id_list = prepare_id_list_for_sql(hospital_subject_ids)
-    sql_query = build_sql_query(mimic_module, table_name, "subject_id")
-    db_cursor.execute(sql_query.format(sql_id_list))
-    table = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(table, columns=cols)
+    return extract_table_for_ids(db_cursor, hospital_subject_ids, mimic_module, table_name,
+                                 "subject_id", columns)
 
 
-def extract_table(db_cursor: cursor, mimic_module: str, table_name: str) -> pd.DataFrame:
+def extract_table(db_cursor: cursor, mimic_module: str, table_name: str,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
     """Extract any table in MIMIC for a list of hospital admission ids"""
-    db_cursor.execute(
-        'SELECT * FROM ' + mimic_module + '.' + table_name)
-    table = db_cursor.fetchall()
-    cols = list(map(lambda x: x[0], db_cursor.description))
-    return pd.DataFrame(table, columns=cols)
+    return read_sql_dataframe(db_cursor, 'SELECT ' +
+                              build_column_list(mimic_module + '.' + table_name, columns) +
+                              ' FROM ' + mimic_module + '.' + table_name)
 
 
 def extract_table_columns(db_cursor: cursor, mimic_module: str, table_name: str) -> List[str]:
@@ -238,42 +440,65 @@ def extract_table_columns(db_cursor: cursor, mimic_module: str, table_name: str)
     cols = list(map(lambda x: x[0], db_cursor.description))
     return cols
 
+
+def project_table_columns(db_cursor: cursor, mimic_module: str, table_name: str,
+                          required_columns: Iterable[str]) -> List[str]:
+    """Provides the columns of a table which are required, in the order of the table"""
+    required = set(required_columns)
+    return [col for col in extract_table_columns(db_cursor, mimic_module, table_name)
+            if col in required]
+
+
 def extract_icustay_events(db_cursor: cursor, cohort: pd.DataFrame) -> pd.DataFrame:
     """
     Extracts icustay events for a given cohort
     """
 
-    hospital_admission_ids = list(cohort["hadm_id"].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
+    hospital_admission_ids = get_cohort_ids(cohort, "hadm_id")
 
     icu_stays = extract_table_for_admission_ids(db_cursor, hospital_admission_ids,\
-                                                "mimic_icu", "icustays")
-
-    event_dict = {}
-    i = 0
-    for _, row in icu_stays.iterrows():
-        column_labels = ["intime", "outtime"]
-        for col in icu_stays.columns:
-            if col in column_labels:
-                if pd.isna(row[col]):
-                    continue
-                if col == "intime":
-                    activity = "ICU in"
-                elif col == "outtime":
-                    activity = "ICU out"
-                new_row = {"hadm_id": row["hadm_id"], "subject_id": row["subject_id"],
-                           "activity": activity, "timestamp": row[col]}
-                event_dict[i] = new_row
-                i = i + 1
-
-    log = pd.DataFrame.from_dict(event_dict, "index")  # type: ignore
-    log = log.sort_values("timestamp")
-    log = log.reset_index().drop("index", axis=1)
-    log = log.rename({"activity": "concept:name",
-                     "timestamp": "time:timestamp"}, axis=1)
+                                                "mimic_icu", "icustays",
+                                                ["subject_id", "hadm_id", "intime", "outtime"])
+
+    log = expand_lifecycle_events(icu_stays, {"intime": "ICU in", "outtime": "ICU out"},
+                                  ["hadm_id", "subject_id"])
 
     return log
 
+
+def expand_lifecycle_events(table: pd.DataFrame, timestamp_activities: Dict[str, str],
+                            id_columns: List[str],
+                            suppressed_by: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+    """
+    Turns the timestamp columns of a table into events: every row yields one event per set
+    timestamp column, named by timestamp_activities. suppressed_by maps a timestamp column to
+    a column which replaces it if set (e.g. dischtime is dropped if deathtime is set).
+    Events are sorted by timestamp, ties keep the row and column order of the table.
+    """
+    timestamp_columns = [col for col in table.columns if col in timestamp_activities]
+    timestamps = []
+    for col in timestamp_columns:
+        column_values = pd.to_datetime(table[col]).to_numpy(dtype="datetime64[ns]")
+        if suppressed_by is not None and col in suppressed_by:
+            column_values = column_values.copy()
+            column_values[~table[suppressed_by[col]].isna().to_numpy()] = np.datetime64("NaT")
+        timestamps.append(column_values)
+
+    # flatten row by row and drop missing timestamps
+    flat_timestamps = np.column_stack(timestamps).ravel()
+    is_set = ~np.isnat(flat_timestamps)
+    row_positions = np.repeat(np.arange(len(table)), len(timestamp_columns))[is_set]
+    column_positions = np.tile(np.arange(len(timestamp_columns)), len(table))[is_set]
+    flat_timestamps = flat_timestamps[is_set]
+
+    order = np.lexsort((column_positions, row_positions, flat_timestamps))
+    activities = np.array([timestamp_activities[col] for col in timestamp_columns], dtype=object)
+    log = table[id_columns].iloc[row_positions[order]].reset_index(drop=True)
+    log["concept:name"] = activities[column_positions[order]]
+    log["time:timestamp"] = flat_timestamps[order]
+    return log
+
+
 def get_table_module(table_name: str) -> str:
     """Provides module for a given table name"""
     if table_name in core_tables:
@@ -288,25 +513,33 @@ def get_table_module(table_name: str) -> str:
     return module
 
 
-def prepare_id_list_for_sql(id_list: List) -> str:
-    """Prepares a list of ids for the sql statement"""
-    id_list = [str(i) for i in id_list]
-    sql_list = '), ('.join(['', *id_list, ''])
-    sql_list = sql_list[3:]
-    sql_list = sql_list[:len(sql_list)-3]
-    return sql_list
-
-
 def get_filename_string(file_name: str, file_ending: str) -> str:
     """Creates a filename string containing the creation date"""
     date = datetime.now().strftime("%d-%m-%Y-%H_%M_%S")
     return file_name + "_" + date + file_ending
 
 
-def join_event_attributes_with_log_events(log: pd.DataFrame, event_attributes: pd.DataFrame,  # pylint: disable=unused-argument, line-too-long  \
-                                          case_notion: str, time_column: str, start_column: str,\
+def join_event_attributes_with_log_events(log: pd.DataFrame, event_attributes: pd.DataFrame,
+                                          case_notion: str, time_column: str, start_column: str,
                                           end_column: str) -> pd.DataFrame:
     """Joins event attribute events with events in an event log"""
+    joined_df = interval_join(event_attributes, log, case_notion, time_column, start_column,
+                              end_column)
+    joined_df = joined_df.sort_values([case_notion, time_column],
+                                      kind="stable")  # type: ignore
+    joined_df = joined_df.reset_index(drop=True)
+
+    return joined_df
+
+
+def join_event_attributes_with_log_events_sqlite(log: pd.DataFrame, event_attributes: pd.DataFrame,  # pylint: disable=unused-argument, line-too-long  \
+                                                 case_notion: str, time_column: str,
+                                                 start_column: str,
+                                                 end_column: str) -> pd.DataFrame:
+    """
+    Joins event attribute events with events in an event log using an in-memory SQLite
+    database. Reference implementation of join_event_attributes_with_log_events.
+    """
 
     sqlcode = '''
     select *
@@ -358,5 +591,15 @@ detail_foreign_keys = {"d_hcpcs": ["code", "short_description"],
                        "poe_detail": ["poe_id", "poe_seq", "subject_id"],
                        "prescriptions": "pharmacy_id", "emar_detail": "emar_id"}
 
+# Static dictionary tables, which are cached locally
+dictionary_tables = ["d_hcpcs", "d_icd_diagnoses", "d_icd_procedures", "d_labitems", "d_items"]
+
+# Detail tables which are restricted to the subjects of the extracted table
+subject_detail_tables = ["poe_detail", "emar_detail"]
+
+prescription_detail_columns = ['pharmacy_id', 'drug_type', 'drug', 'gsn', 'ndc',
+                               'prod_strength', 'form_rx', 'dose_val_rx', 'dose_unit_rx',
+                               'form_val_disp', 'form_unit_disp']
+
 illicit_tables = ["d_hcpcs", "d_icd_diagnoses", "d_icd_procedures",
                   "d_labitems", "d_items", "emar_detail", "poe_detail", "edstays"]
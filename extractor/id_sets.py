@@ -0,0 +1,87 @@
+"""
+Provides id sets for restricting extraction queries to the ids of a cohort
+"""
+import hashlib
+import io
+import logging
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from psycopg2 import Error
+from psycopg2.extensions import cursor
+
+from extractor.constants import ID_ARRAY_LIMIT, ID_BATCH_SIZE
+
+
+logger = logging.getLogger('cli')
+
+
+def to_id_array(ids: Iterable) -> np.ndarray:
+    """Converts ids to a sorted int64 array of unique ids, dropping missing values"""
+    if isinstance(ids, np.ndarray) and ids.dtype == np.int64:
+        return np.unique(ids)
+    if not isinstance(ids, (np.ndarray, list)):
+        ids = list(ids)
+    id_series = pd.to_numeric(pd.Series(ids), errors="coerce").dropna()
+    return np.unique(id_series.to_numpy(dtype=np.int64))
+
+
+def get_cohort_ids(frame: pd.DataFrame, id_type: str) -> np.ndarray:
+    """Provides the unique ids of an id column (hadm_id, subject_id, ...) as int64 array"""
+    return to_id_array(frame[id_type].to_numpy())
+
+
+def normalize_ids(ids: Iterable) -> List[int]:
+    """Converts ids to a sorted list of unique integers, dropping missing values"""
+    return to_id_array(ids).tolist()
+
+
+def stage_id_set(db_cursor: cursor, id_type: str, ids: List[int]) -> Optional[str]:
+    """
+    Loads ids into an indexed temporary table via COPY and returns the name of the table.
+    The table name is derived from the ids, so every id set is only loaded once per
+    connection. Returns None if the database does not allow temporary tables.
+    """
+    digest = hashlib.sha1(",".join(map(str, ids)).encode("utf-8")).hexdigest()[:16]
+    table_name = "ids_" + id_type + "_" + digest
+    db_cursor.execute("select to_regclass(%s)", ("pg_temp." + table_name,))
+    if db_cursor.fetchone()[0] is not None:  # type: ignore
+        return table_name
+
+    db_cursor.execute("savepoint stage_id_set")
+    try:
+        db_cursor.execute("create temporary table " + table_name +
+                          " (" + id_type + " bigint primary key)")
+        id_buffer = io.StringIO("\n".join(map(str, ids)) + "\n")
+        db_cursor.copy_expert("copy " + table_name + " from stdin", id_buffer)
+        db_cursor.execute("analyze " + table_name)
+    except Error as error:
+        db_cursor.execute("rollback to savepoint stage_id_set")
+        logger.info("Could not stage %s ids in a temporary table: %s", id_type, error)
+        return None
+    db_cursor.execute("release savepoint stage_id_set")
+    return table_name
+
+
+def id_set_filters(db_cursor: cursor, id_type: str,
+                   ids: Iterable) -> Iterator[Tuple[Optional[str], Optional[dict]]]:
+    """
+    Yields (temporary table, query parameters) pairs which together cover the given ids.
+    Small id sets are sent as a single array parameter, large id sets are staged in a
+    temporary table. If staging is not possible, the ids are sent in batches of arrays.
+    """
+    id_list = normalize_ids(ids)
+    if len(id_list) > ID_ARRAY_LIMIT:
+        id_table = stage_id_set(db_cursor, id_type, id_list)
+        if id_table is not None:
+            yield id_table, None
+            return
+    for batch_start in range(0, max(len(id_list), 1), ID_BATCH_SIZE):
+        yield None, {"ids": id_list[batch_start:batch_start + ID_BATCH_SIZE]}
+
+
+def build_id_filter(column_reference: str, id_type: str, id_table: Optional[str]) -> str:
+    """Generates the sql condition restricting a column to an id set"""
+    if id_table is None:
+        return column_reference + ' = any(%(ids)s::bigint[])'
+    return column_reference + ' in (select ' + id_type + ' from ' + id_table + ')'
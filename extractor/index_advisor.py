@@ -0,0 +1,276 @@
+"""
+Provides an index advisor, which derives the indexes the extraction queries of a configuration
+can use, explains representative queries and reports (and optionally creates) missing indexes
+"""
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from psycopg2 import Error
+from psycopg2.extensions import cursor
+
+from extractor.constants import ADMISSION_CASE_KEY, ADMISSION_EVENT_TYPE, \
+    INDEX_ADVISOR_SAMPLE_SIZE, OTHER_EVENT_TYPE, POE_EVENT_TYPE, SUBJECT_CASE_KEY, \
+    SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.extraction_helper import build_sql_query, detail_foreign_keys, detail_tables, \
+    dictionary_tables, get_table_module, subject_detail_tables
+from extractor.id_sets import build_id_filter
+from extractor.pipeline import ExtractionSettings
+
+
+logger = logging.getLogger('cli')
+
+# Parent tables of foreign keys, whose rows are looked up for the admissions of a cohort
+foreign_key_parents = {("prescriptions", "pharmacy_id"): "pharmacy",
+                       ("poe_detail", "poe_id"): "poe",
+                       ("emar", "poe_id"): "pharmacy",
+                       ("emar_detail", "emar_id"): "emar"}
+
+INDEX_COLUMNS_QUERY = "select c.relname, array(select a.attname \
+from unnest(i.indkey::int2[]) with ordinality as k(attnum, position) \
+join pg_attribute as a on a.attrelid = i.indrelid and a.attnum = k.attnum \
+order by k.position) from pg_index as i join pg_class as c on c.oid = i.indexrelid \
+where i.indrelid = to_regclass(%s)"
+
+
+class IndexCandidate(NamedTuple):
+    """
+    An index of a table which extraction queries can use, either to look up the rows of a set
+    of ids (hadm_id, subject_id, stay_id, optionally followed by a time column) or to join a
+    foreign key of a parent table (poe_id, pharmacy_id, emar_id)
+    """
+    module: str
+    table: str
+    columns: Tuple[str, ...]
+    parent_table: Optional[str] = None
+
+
+def add_table_candidates(candidates: List[IndexCandidate], table: str,
+                         time_column: Optional[str] = None) -> None:
+    """Adds the candidates of extracting a (low level) table and joining its detail table"""
+    module = get_table_module(table)
+    if module == "mimic_ed":
+        candidates.append(IndexCandidate(module, "edstays", (ADMISSION_CASE_KEY,)))
+        candidates.append(IndexCandidate(module, table, ("stay_id",)))
+        return
+    columns: Tuple[str, ...] = (ADMISSION_CASE_KEY,)
+    if time_column is not None and table.upper() not in ("ADMISSIONS", "ICUSTAYS"):
+        # event attributes are aggregated over time intervals of every admission
+        columns += (time_column,)
+    candidates.append(IndexCandidate(module, table, columns))
+
+    detail_table = detail_tables.get(table)
+    if detail_table is None or detail_table in dictionary_tables:
+        return
+    if detail_table in subject_detail_tables:
+        candidates.append(IndexCandidate(module, detail_table, (SUBJECT_CASE_KEY,)))
+    elif detail_table == "prescriptions":
+        candidates.append(IndexCandidate(module, detail_table, (ADMISSION_CASE_KEY,)))
+    foreign_key = detail_foreign_keys[detail_table]
+    foreign_key = foreign_key if isinstance(foreign_key, str) else foreign_key[0]
+    candidates.append(IndexCandidate(module, detail_table, (foreign_key,),
+                                     foreign_key_parents.get((detail_table, foreign_key))))
+
+
+def get_index_candidates(settings: ExtractionSettings) -> List[IndexCandidate]:
+    """
+    Provides the indexes the queries of an extraction can use, for its case attributes,
+    event type, low level tables and event attribute specs. Indexes whose columns are a
+    prefix of another candidate of the same table are covered by it and left out.
+    """
+    candidates = [IndexCandidate("mimic_core", "admissions", (ADMISSION_CASE_KEY,))]
+    if settings.case_attribute_list is not None:
+        if settings.case_notion == SUBJECT_CASE_NOTION:
+            candidates.append(IndexCandidate("mimic_core", "patients", (SUBJECT_CASE_KEY,)))
+        else:
+            candidates.append(IndexCandidate("mimic_hosp", "diagnoses_icd",
+                                             (ADMISSION_CASE_KEY,)))
+            candidates.append(IndexCandidate("mimic_hosp", "drgcodes", (ADMISSION_CASE_KEY,)))
+
+    if settings.event_type == TRANSFER_EVENT_TYPE:
+        candidates.append(IndexCandidate("mimic_core", "transfers", (ADMISSION_CASE_KEY,)))
+    elif settings.event_type == POE_EVENT_TYPE:
+        candidates.append(IndexCandidate("mimic_hosp", "poe", (ADMISSION_CASE_KEY,)))
+        candidates.append(IndexCandidate("mimic_hosp", "poe_detail", ("poe_id",), "poe"))
+        if settings.include_medications:
+            add_table_candidates(candidates, "pharmacy")
+            add_table_candidates(candidates, "emar")
+            candidates.append(IndexCandidate("mimic_hosp", "emar", ("poe_id",), "pharmacy"))
+    elif settings.event_type == OTHER_EVENT_TYPE:
+        for table in settings.tables_to_extract or []:
+            add_table_candidates(candidates, table)
+    elif settings.event_type != ADMISSION_EVENT_TYPE:
+        logger.warning("Unknown event type %s", settings.event_type)
+
+    for attribute_spec in settings.additional_attributes or []:
+        add_table_candidates(candidates, attribute_spec["table_to_aggregate"],
+                             attribute_spec["time_column"])
+
+    unique_candidates = list(dict.fromkeys(candidates))
+    return [candidate for candidate in unique_candidates
+            if not any(other.module == candidate.module and other.table == candidate.table
+                       and len(other.columns) > len(candidate.columns)
+                       and other.columns[:len(candidate.columns)] == candidate.columns
+                       for other in unique_candidates)]
+
+
+def get_sample_ids(db_cursor: cursor) -> Dict[str, List[int]]:
+    """Provides the ids of a sample of admissions, which parameterize the explained queries"""
+    db_cursor.execute("select hadm_id, subject_id from mimic_core.admissions limit %s",
+                      (INDEX_ADVISOR_SAMPLE_SIZE,))
+    rows = db_cursor.fetchall()
+    sample_ids = {ADMISSION_CASE_KEY: [row[0] for row in rows],
+                  SUBJECT_CASE_KEY: list(dict.fromkeys(row[1] for row in rows)),
+                  "stay_id": []}
+    db_cursor.execute("select to_regclass('mimic_ed.edstays')")
+    if db_cursor.fetchone()[0] is not None:  # type: ignore
+        db_cursor.execute("select stay_id from mimic_ed.edstays where " +
+                          build_id_filter("hadm_id", ADMISSION_CASE_KEY, None),
+                          {"ids": sample_ids[ADMISSION_CASE_KEY]})
+        sample_ids["stay_id"] = [row[0] for row in db_cursor.fetchall()]
+    return sample_ids
+
+
+def build_candidate_query(candidate: IndexCandidate,
+                          sample_ids: Dict[str, List[int]]) -> Tuple[str, dict]:
+    """
+    Generates a query like the extraction queries using a candidate: an id restricted
+    query of the table, or the lookup of a foreign key for the admissions of a parent table
+    """
+    if candidate.parent_table is None:
+        sql_query = build_sql_query(candidate.module, candidate.table, candidate.columns[0])
+        if len(candidate.columns) > 1:
+            sql_query += " order by " + ", ".join(candidate.columns)
+        return sql_query, {"ids": sample_ids[candidate.columns[0]]}
+    foreign_key = candidate.columns[0]
+    sql_query = "select d.* from " + candidate.module + "." + candidate.table + " as d \
+where d." + foreign_key + " in (select p." + foreign_key + " from " + candidate.module + \
+        "." + candidate.parent_table + " as p where " + \
+        build_id_filter("p." + ADMISSION_CASE_KEY, ADMISSION_CASE_KEY, None) + ")"
+    return sql_query, {"ids": sample_ids[ADMISSION_CASE_KEY]}
+
+
+def get_table_indexes(db_cursor: cursor, table_name: str) -> Dict[str, List[str]]:
+    """Provides the columns of every index of a table, by index name"""
+    db_cursor.execute(INDEX_COLUMNS_QUERY, (table_name,))
+    return {row[0]: list(row[1]) for row in db_cursor.fetchall()}
+
+
+def find_covering_index(indexes: Dict[str, List[str]],
+                        columns: Tuple[str, ...]) -> Optional[str]:
+    """Provides an index whose leading columns are the given columns"""
+    for index_name, index_columns in indexes.items():
+        if tuple(index_columns[:len(columns)]) == columns:
+            return index_name
+    return None
+
+
+def get_relation_scans(plan: Dict[str, Any], table: str) -> List[str]:
+    """Provides the scan nodes of a table in a json plan (e.g. Seq Scan, Index Scan)"""
+    scans = []
+    if plan.get("Relation Name") == table:
+        scans.append(plan["Node Type"] + (" using " + plan["Index Name"]
+                                          if "Index Name" in plan else ""))
+    for child_plan in plan.get("Plans", []):
+        scans += get_relation_scans(child_plan, table)
+    return scans
+
+
+def explain_candidate_query(db_cursor: cursor, candidate: IndexCandidate, sql_query: str,
+                            params: dict) -> Optional[Dict[str, Any]]:
+    """
+    Explains a query (without running it) and provides its estimated cost, the scans of the
+    candidate's table and the plan as text. Returns None if the query can not be explained.
+    """
+    db_cursor.execute("savepoint explain_candidate")
+    try:
+        db_cursor.execute("explain (format json) " + sql_query, params)
+        plan = db_cursor.fetchone()[0][0]["Plan"]  # type: ignore
+        db_cursor.execute("explain " + sql_query, params)
+        plan_text = "\n".join(row[0] for row in db_cursor.fetchall())
+    except Error as error:
+        db_cursor.execute("rollback to savepoint explain_candidate")
+        logger.warning("Could not explain query on %s: %s", candidate.table, error)
+        return None
+    db_cursor.execute("release savepoint explain_candidate")
+    return {"cost": plan["Total Cost"], "scans": get_relation_scans(plan, candidate.table),
+            "plan": plan_text}
+
+
+def create_candidate_index(db_cursor: cursor, candidate: IndexCandidate) -> Optional[str]:
+    """Creates the index of a candidate and returns its name, or None if that fails"""
+    index_name = ("idx_" + candidate.table + "_" + "_".join(candidate.columns))[:63]
+    table_name = candidate.module + "." + candidate.table
+    logger.info("Creating index %s on %s, which takes a while for large tables...",
+                index_name, table_name)
+    db_cursor.execute("savepoint create_index")
+    try:
+        db_cursor.execute("create index if not exists " + index_name + " on " + table_name +
+                          " (" + ", ".join(candidate.columns) + ")")
+    except Error as error:
+        db_cursor.execute("rollback to savepoint create_index")
+        logger.error("Could not create index %s: %s", index_name, error)
+        return None
+    db_cursor.execute("release savepoint create_index")
+    return index_name
+
+
+def advise_indexes(db_cursor: cursor, settings: ExtractionSettings,
+                   create_indexes: bool = False) -> List[Dict[str, Any]]:
+    """
+    Checks the index candidates of an extraction for existing indexes, explains a query
+    using every candidate and creates missing indexes if create_indexes is set, explaining
+    the query again afterwards. Returns a report entry per candidate.
+    """
+    logger.info("Advising indexes for the configured extraction...")
+    sample_ids = get_sample_ids(db_cursor)
+    report = []
+    for candidate in get_index_candidates(settings):
+        table_name = candidate.module + "." + candidate.table
+        entry: Dict[str, Any] = {"table": table_name, "columns": list(candidate.columns),
+                                 "parent_table": candidate.parent_table}
+        report.append(entry)
+        db_cursor.execute("select to_regclass(%s)", (table_name,))
+        if db_cursor.fetchone()[0] is None:  # type: ignore
+            entry["status"] = "table missing"
+            continue
+        index_name = find_covering_index(get_table_indexes(db_cursor, table_name),
+                                         candidate.columns)
+        sql_query, params = build_candidate_query(candidate, sample_ids)
+        entry.update({"status": "present" if index_name is not None else "missing",
+                      "index": index_name,
+                      "before": explain_candidate_query(db_cursor, candidate, sql_query,
+                                                        params)})
+        if index_name is None and create_indexes:
+            index_name = create_candidate_index(db_cursor, candidate)
+            if index_name is not None:
+                entry.update({"status": "created", "index": index_name,
+                              "after": explain_candidate_query(db_cursor, candidate,
+                                                               sql_query, params)})
+    log_index_report(report)
+    return report
+
+
+def log_index_report(report: List[Dict[str, Any]]) -> None:
+    """Logs the status, cost and scans of every candidate and the plans of missing ones"""
+    for entry in report:
+        description = entry["table"] + " (" + ", ".join(entry["columns"]) + ")"
+        if entry.get("before") is None:
+            logger.info("%s: %s", description, entry["status"])
+            continue
+        logger.info("%s: %s%s, cost %.0f, %s", description, entry["status"],
+                    " as " + entry["index"] if entry.get("index") else "",
+                    entry["before"]["cost"], ", ".join(entry["before"]["scans"]))
+        if entry["status"] == "missing":
+            logger.info("Plan without index:\n%s", entry["before"]["plan"])
+        elif entry["status"] == "created" and entry.get("after") is not None:
+            logger.info("Cost after creating %s: %.0f, %s", entry["index"],
+                        entry["after"]["cost"], ", ".join(entry["after"]["scans"]))
+            logger.info("Plan before:\n%s\nPlan after:\n%s", entry["before"]["plan"],
+                        entry["after"]["plan"])
+
+
+def write_index_report(file_path: str, report: List[Dict[str, Any]]) -> None:
+    """Writes the index report as json"""
+    with open(file_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2)
+    logger.info("Wrote index report to %s", file_path)
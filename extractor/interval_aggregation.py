@@ -0,0 +1,191 @@
+"""
+Provides the aggregation of event attributes over the intervals of log events inside the
+database, so that only the aggregated values are transferred
+"""
+import hashlib
+import io
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from psycopg2 import Error
+from psycopg2.extensions import cursor
+
+from extractor.extraction_helper import (detail_foreign_keys, detail_tables,
+                                         extract_table_columns, get_table_module,
+                                         prescription_detail_columns, read_sql_dataframe)
+
+
+logger = logging.getLogger('cli')
+
+# SQL equivalents of the pandas aggregation methods, applied to the events of an interval
+# in the order of their timestamps. avg is cast, as it is numeric (Decimal) for integer
+# columns, where pandas provides a float mean.
+aggregation_expressions = {
+    "mean": "avg({column})::double precision",
+    "median": "percentile_cont(0.5) within group (order by {column})",
+    "sum": "coalesce(sum({column}), 0)",
+    "count": "count({column})",
+    "first": "(array_agg({column} order by {time_column}) "
+             "filter (where {column} is not null))[1]",
+    "min": "min({column})",
+    "max": "max({column})",
+}
+
+
+def stage_intervals(db_cursor: cursor, log: pd.DataFrame, case_notion: str, start_column: str,
+                    end_column: str) -> Optional[str]:
+    """
+    Loads the distinct (case, start, end) intervals of the log events into an indexed
+    temporary table via COPY and returns the name of the table. Intervals with a missing
+    case or timestamp are skipped, as they never contain an event. Returns None if the
+    database does not allow temporary tables.
+    """
+    intervals = pd.DataFrame({
+        case_notion: pd.to_numeric(log[case_notion], errors="coerce"),
+        "interval_start": pd.to_datetime(log[start_column]),
+        "interval_end": pd.to_datetime(log[end_column])}).dropna().drop_duplicates()
+    intervals[case_notion] = intervals[case_notion].astype(np.int64)
+    interval_buffer = io.StringIO()
+    intervals.to_csv(interval_buffer, index=False, header=False,  # type: ignore
+                     date_format="%Y-%m-%d %H:%M:%S.%f")
+
+    digest = hashlib.sha1(interval_buffer.getvalue().encode("utf-8")).hexdigest()[:16]
+    table_name = "intervals_" + case_notion + "_" + digest
+    db_cursor.execute("select to_regclass(%s)", ("pg_temp." + table_name,))
+    if db_cursor.fetchone()[0] is not None:  # type: ignore
+        return table_name
+
+    db_cursor.execute("savepoint stage_intervals")
+    try:
+        db_cursor.execute("create temporary table " + table_name + " (" + case_notion +
+                          " bigint, interval_start timestamp, interval_end timestamp)")
+        interval_buffer.seek(0)
+        db_cursor.copy_expert("copy " + table_name + " from stdin with (format csv)",
+                              interval_buffer)
+        db_cursor.execute("create index on " + table_name + " (" + case_notion + ")")
+        db_cursor.execute("analyze " + table_name)
+    except Error as error:
+        db_cursor.execute("rollback to savepoint stage_intervals")
+        logger.info("Could not stage log intervals in a temporary table: %s", error)
+        return None
+    db_cursor.execute("release savepoint stage_intervals")
+    return table_name
+
+
+def get_column_references(db_cursor: cursor, table: str, columns: List[str])\
+        -> Optional[Tuple[str, str, Dict[str, str]]]:
+    """
+    Provides the qualified table name, the join of its detail table (as it is merged during
+    the extraction of tables) and the qualified reference of each given column.
+    Returns None if the table can not be joined in the database or a column is unknown.
+    """
+    module = get_table_module(table)
+    if module == "mimic_ed" or table.upper() in ("ADMISSIONS", "ICUSTAYS"):
+        return None
+
+    table_columns = extract_table_columns(db_cursor, module, table)
+    detail_join = ""
+    detail_columns: List[str] = []
+    detail_table = detail_tables.get(table)
+    if detail_table is not None:
+        foreign_key = detail_foreign_keys[detail_table]
+        if not isinstance(foreign_key, str):
+            return None
+        if detail_table == "prescriptions":
+            detail_columns = prescription_detail_columns
+        else:
+            detail_columns = extract_table_columns(db_cursor, module, detail_table)
+        detail_join = " left join " + module + "." + detail_table + " as d on d." + \
+            foreign_key + " = t." + foreign_key
+
+    references = {}
+    for column in columns:
+        if column in table_columns:
+            references[column] = "t." + column
+        elif column in detail_columns:
+            references[column] = "d." + column
+        else:
+            return None
+    return module + "." + table, detail_join, references
+
+
+def build_interval_aggregation_query(table_name: str, detail_join: str,
+                                     references: Dict[str, str], interval_table: str,
+                                     case_notion: str, time_column: str,
+                                     filter_column: Optional[str],
+                                     filter_values: Optional[List[str]],
+                                     aggregations: List[Tuple[str, str]]) -> Optional[str]:
+    """
+    Generates the query joining the events of a table with the log intervals containing
+    them and aggregating the events per interval (and filter value). Returns None if an
+    aggregation method has no SQL equivalent.
+    """
+    time_reference = references[time_column]
+    select_list = ["i." + case_notion, "i.interval_start", "i.interval_end"]
+    conditions = [time_reference + " between i.interval_start and i.interval_end"]
+    if filter_column is not None:
+        select_list.append(references[filter_column] + " as filter_value")
+        conditions.append(references[filter_column] + " is not null")
+        if filter_values is not None:
+            conditions.append(references[filter_column] + "::text = any(%(filter_values)s)")
+    for position, (column, method) in enumerate(aggregations):
+        expression = aggregation_expressions.get(method.lower())
+        if expression is None:
+            return None
+        select_list.append(expression.format(column=references[column],
+                                             time_column=time_reference) +
+                           " as aggregate_" + str(position))
+
+    group_positions = range(1, len(select_list) - len(aggregations) + 1)
+    return "select " + ", ".join(select_list) + " from " + interval_table + " as i join " + \
+        table_name + " as t on t." + case_notion + " = i." + case_notion + detail_join + \
+        " where " + " and ".join(conditions) + \
+        " group by " + ", ".join(map(str, group_positions))
+
+
+def aggregate_intervals_in_database(db_cursor: cursor, interval_table: str, table: str,
+                                    time_column: str, case_notion: str, start_column: str,
+                                    end_column: str, filter_column: Optional[str],
+                                    filter_values: Optional[List[str]],
+                                    aggregations: List[Tuple[str, str]])\
+                                        -> Optional[pd.DataFrame]:
+    """
+    Aggregates the columns of a table over staged log intervals in the database.
+    The result is indexed by case, (filter column,) start and end column and has a
+    (column, aggregation method) column per aggregation, like a grouped pandas aggregation.
+    Returns None if the aggregation can not be done in the database.
+    """
+    columns = [time_column] + [column for column, _ in aggregations]
+    if filter_column is not None:
+        columns.append(filter_column)
+    column_references = get_column_references(db_cursor, table, columns)
+    if column_references is None:
+        return None
+    table_name, detail_join, references = column_references
+    sql_query = build_interval_aggregation_query(table_name, detail_join, references,
+                                                 interval_table,
+                                                 case_notion, time_column, filter_column,
+                                                 filter_values, aggregations)
+    if sql_query is None:
+        return None
+
+    db_cursor.execute("savepoint aggregate_intervals")
+    try:
+        aggregated_df = read_sql_dataframe(db_cursor, sql_query,
+                                           {"filter_values": filter_values})
+    except Error as error:
+        db_cursor.execute("rollback to savepoint aggregate_intervals")
+        logger.info("Could not aggregate %s in the database: %s", table, error)
+        return None
+    db_cursor.execute("release savepoint aggregate_intervals")
+
+    group_columns = [case_notion, start_column, end_column]
+    if filter_column is not None:
+        group_columns = [case_notion, filter_column, start_column, end_column]
+    aggregated_df = aggregated_df.rename(columns={"interval_start": start_column,
+                                                  "interval_end": end_column,
+                                                  "filter_value": filter_column})
+    aggregated_df = aggregated_df.set_index(group_columns)
+    aggregated_df.columns = pd.MultiIndex.from_tuples(aggregations)
+    return aggregated_df
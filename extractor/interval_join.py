@@ -0,0 +1,75 @@
+"""
+Provides a vectorized join of timestamped events with the time intervals of log events
+"""
+from typing import Tuple
+import numpy as np
+import pandas as pd
+
+
+def to_nanoseconds(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts a timestamp column to int64 nanoseconds and a mask of the set timestamps"""
+    timestamps = pd.to_datetime(column).to_numpy(dtype="datetime64[ns]")
+    return timestamps.view("int64"), ~np.isnat(timestamps)
+
+
+def interval_join_positions(event_cases: pd.Series, event_times: pd.Series,
+                            interval_cases: pd.Series, interval_starts: pd.Series,
+                            interval_ends: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Determines all pairs of events and intervals of the same case with
+    start <= time <= end. Returns the row positions of the events and intervals of each pair,
+    grouped by interval. Rows with a missing case or timestamp never match.
+    """
+    case_codes, _ = pd.factorize(pd.concat([event_cases, interval_cases], ignore_index=True))
+    event_codes = case_codes[:len(event_cases)]
+    interval_codes = case_codes[len(event_cases):]
+
+    times, times_set = to_nanoseconds(event_times)
+    starts, starts_set = to_nanoseconds(interval_starts)
+    ends, ends_set = to_nanoseconds(interval_ends)
+
+    # dense ranks of all timestamps, so that case and time fit into a single sortable key
+    _, ranks = np.unique(np.concatenate([times, starts, ends]), return_inverse=True)
+    ranks = ranks.reshape(-1)
+    rank_count = int(ranks.max()) + 1 if len(ranks) > 0 else 1
+    time_ranks = ranks[:len(times)]
+    start_ranks = ranks[len(times):len(times) + len(starts)]
+    end_ranks = ranks[len(times) + len(starts):]
+
+    valid_events = np.flatnonzero((event_codes >= 0) & times_set)
+    event_keys = event_codes[valid_events].astype("int64") * rank_count + time_ranks[valid_events]
+    event_order = np.argsort(event_keys, kind="stable")
+    sorted_event_keys = event_keys[event_order]
+
+    valid_intervals = np.flatnonzero((interval_codes >= 0) & starts_set & ends_set)
+    interval_case_keys = interval_codes[valid_intervals].astype("int64") * rank_count
+    lower = np.searchsorted(sorted_event_keys,
+                            interval_case_keys + start_ranks[valid_intervals], side="left")
+    upper = np.searchsorted(sorted_event_keys,
+                            interval_case_keys + end_ranks[valid_intervals], side="right")
+    counts = np.maximum(upper - lower, 0)
+
+    total = int(counts.sum())
+    pair_offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    sorted_positions = np.repeat(lower, counts) + pair_offsets
+    event_positions = valid_events[event_order[sorted_positions]]
+    interval_positions = np.repeat(valid_intervals, counts)
+    return event_positions, interval_positions
+
+
+def interval_join(event_attributes: pd.DataFrame, log: pd.DataFrame, case_notion: str,
+                  time_column: str, start_column: str, end_column: str) -> pd.DataFrame:
+    """
+    Inner joins event attributes with the log events of the same case whose interval
+    [start_column, end_column] contains the time_column. Columns present in both frames are
+    taken from the event attributes.
+    """
+    event_positions, interval_positions = interval_join_positions(
+        event_attributes[case_notion], event_attributes[time_column], log[case_notion],
+        log[start_column], log[end_column])
+
+    joined_df = event_attributes.iloc[event_positions].reset_index(drop=True)
+    log_columns = [col for col in log.columns if col not in joined_df.columns]
+    log_part = log[log_columns].iloc[interval_positions].reset_index(drop=True)
+    joined_df = pd.concat([joined_df, log_part], axis=1)
+    return joined_df
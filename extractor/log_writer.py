@@ -0,0 +1,197 @@
+"""
+Provides the export of an event log in the chosen output format, either at once or in parts
+of disjoint cases, which are appended to the same output
+"""
+import csv
+import logging
+import os
+from typing import List, Optional
+import pandas as pd
+from pm4py.objects.conversion.log import converter as log_converter  # type: ignore
+from pm4py.objects.log.exporter.xes import exporter as xes_exporter  # type: ignore
+
+from extractor.columnar_writer import columnar_formats, write_columnar_log
+from extractor.extraction_helper import get_filename_string
+from extractor.xes_writer import XesWriter, compress_file
+
+
+logger = logging.getLogger('cli')
+
+OUTPUT_DIR = "output/"
+
+
+class EventLogWriter:
+    """
+    Writes an event log to the output directory. With sharded set, the log is written in
+    parts of disjoint cases: csv parts are appended to one file, xes parts are streamed into
+    one log and columnar parts are written as files of one directory.
+    """
+
+    def __init__(self, log_format: str, compress: bool = False,
+                 cases_per_partition: Optional[int] = None, sharded: bool = False):
+        self.log_format = log_format
+        self.compress = compress
+        self.cases_per_partition = cases_per_partition
+        self.sharded = sharded
+        self.file_path: Optional[str] = None
+        self.columns: List[str] = []
+        self.row_count = 0
+        self.xes_writer: Optional[XesWriter] = None
+        self.part_count = 0
+        if log_format == "pm4py_xes" and sharded:
+            logger.warning("The pm4py xes export needs the whole log at once, "
+                           "streaming the xes log instead")
+            self.log_format = "xes"
+
+    def write(self, events: pd.DataFrame, case_id_key: str) -> None:
+        """Writes the events of a part of the log, whose cases are not part of other parts"""
+        if self.log_format == "csv":
+            self.write_csv(events)
+        elif self.log_format in columnar_formats:
+            self.write_columnar(events, case_id_key)
+        elif self.log_format == "pm4py_xes":
+            self.write_pm4py_xes(events, case_id_key)
+        else:
+            self.write_xes(events, case_id_key)
+        self.part_count += 1
+
+    def write_csv(self, events: pd.DataFrame) -> None:
+        """
+        Writes events to the csv log, numbering the rows across parts. Columns which are not
+        part of earlier parts are added to the log, where earlier rows have no value for them.
+        """
+        events = events.copy(deep=False)
+        events.index = pd.RangeIndex(self.row_count, self.row_count + len(events))
+        self.row_count += len(events)
+        if self.file_path is None:
+            self.file_path = OUTPUT_DIR + get_filename_string("event_log", ".csv")
+            logger.info("Writing event log to %s", self.file_path)
+            self.columns = list(events.columns)
+            events.to_csv(self.file_path)
+            return
+        new_columns = [column for column in events.columns if column not in self.columns]
+        if new_columns:
+            self.add_csv_columns(new_columns)
+        events.reindex(columns=self.columns).to_csv(self.file_path, mode="a", header=False)
+
+    def add_csv_columns(self, new_columns: List[str]) -> None:
+        """Appends empty columns to the rows already written to the csv log"""
+        assert self.file_path is not None, "The csv log has to be written before adding columns"
+        logger.info("Adding columns %s to the csv log", new_columns)
+        padding = [""] * len(new_columns)
+        extended_path = self.file_path + ".extended"
+        with open(self.file_path, "r", newline="", encoding="utf-8") as log_file, \
+                open(extended_path, "w", newline="", encoding="utf-8") as extended_file:
+            reader = csv.reader(log_file)
+            writer = csv.writer(extended_file, lineterminator="\n")
+            writer.writerow(next(reader) + new_columns)
+            for row in reader:
+                writer.writerow(row + padding)
+        os.replace(extended_path, self.file_path)
+        self.columns = self.columns + new_columns
+
+    def write_columnar(self, events: pd.DataFrame, case_id_key: str) -> None:
+        """Writes events to a columnar file, or to files in a directory if sharded"""
+        if not self.sharded:
+            extension = "" if self.cases_per_partition is not None else "." + self.log_format
+            self.file_path = OUTPUT_DIR + get_filename_string("event_log", extension)
+            write_columnar_log(events, case_id_key, self.file_path, self.log_format,
+                               self.cases_per_partition)
+            return
+        if self.file_path is None:
+            self.file_path = OUTPUT_DIR + get_filename_string("event_log", "")
+            os.makedirs(self.file_path, exist_ok=True)
+        part_name = "shard-" + str(self.part_count + 1).zfill(5)
+        if self.cases_per_partition is not None:
+            write_columnar_log(events, case_id_key, self.file_path, self.log_format,
+                               self.cases_per_partition, "cases-missing-" + part_name)
+        else:
+            write_columnar_log(events, case_id_key,
+                               os.path.join(self.file_path, part_name + "." + self.log_format),
+                               self.log_format)
+
+    def write_pm4py_xes(self, events: pd.DataFrame, case_id_key: str) -> None:
+        """Writes events to an xes log via a pm4py EventLog"""
+        parameters = {log_converter.Variants.TO_EVENT_LOG.value
+                      .Parameters.CASE_ID_KEY: case_id_key,
+                      log_converter.Variants.TO_EVENT_LOG.value
+                      .Parameters.CASE_ATTRIBUTE_PREFIX: 'case:'}
+        event_log_object = log_converter.apply(
+            events, parameters=parameters, variant=log_converter.Variants.TO_EVENT_LOG)
+        self.file_path = OUTPUT_DIR + get_filename_string("event_log", ".xes")
+        xes_exporter.apply(event_log_object, self.file_path)
+        if self.compress:
+            compress_file(self.file_path)
+            self.file_path += ".gz"
+
+    def write_xes(self, events: pd.DataFrame, case_id_key: str) -> None:
+        """Streams events to the xes log, which is opened with the first part"""
+        if self.xes_writer is None:
+            self.file_path = OUTPUT_DIR + get_filename_string(
+                "event_log", ".xes.gz" if self.compress else ".xes")
+            logger.info("Writing event log to %s", self.file_path)
+            self.xes_writer = XesWriter(self.file_path, self.compress).open()
+        self.xes_writer.write_events(events, case_id_key)
+
+    def append_part(self, part_path: str) -> None:
+        """
+        Merges a part of the log written by write_log_part (for the log format of this writer)
+        into the log and removes the part
+        """
+        if self.log_format == "csv":
+            self.append_csv_part(part_path)
+        elif self.log_format in columnar_formats:
+            if self.file_path is None:
+                self.file_path = OUTPUT_DIR + get_filename_string("event_log", "")
+                os.makedirs(self.file_path, exist_ok=True)
+            part_files = [part_path]
+            if os.path.isdir(part_path):
+                part_files = [os.path.join(part_path, name) for name in os.listdir(part_path)]
+            for part_file in part_files:
+                os.replace(part_file, os.path.join(self.file_path, os.path.basename(part_file)))
+            if os.path.isdir(part_path):
+                os.rmdir(part_path)
+        else:
+            if self.xes_writer is None:
+                self.file_path = OUTPUT_DIR + get_filename_string(
+                    "event_log", ".xes.gz" if self.compress else ".xes")
+                logger.info("Writing event log to %s", self.file_path)
+                self.xes_writer = XesWriter(self.file_path, self.compress).open()
+            self.xes_writer.write_fragment(part_path)
+            os.remove(part_path)
+        self.part_count += 1
+
+    def append_csv_part(self, part_path: str) -> None:
+        """Appends a csv part to the csv log, keeping the values as they were written"""
+        self.write_csv(pd.read_csv(part_path, dtype=str, keep_default_na=False))
+        os.remove(part_path)
+
+    def close(self) -> None:
+        """Completes the log"""
+        if self.xes_writer is not None:
+            self.xes_writer.close()
+            self.xes_writer = None
+
+
+def write_log_part(events: pd.DataFrame, case_id_key: str, log_format: str, part_path: str,
+                   cases_per_partition: Optional[int] = None) -> str:
+    """
+    Writes the events of a part of the log to a file (or a directory of case partitions),
+    which EventLogWriter.append_part merges into the log. Returns the path of the part.
+    """
+    part_name = os.path.basename(part_path)
+    if log_format == "csv":
+        part_path += ".csv"
+        events.to_csv(part_path, index=False)
+    elif log_format in columnar_formats:
+        if cases_per_partition is not None:
+            write_columnar_log(events, case_id_key, part_path, log_format,
+                               cases_per_partition, "cases-missing-" + part_name)
+        else:
+            part_path += "." + log_format
+            write_columnar_log(events, case_id_key, part_path, log_format)
+    else:
+        part_path += ".xes"
+        with XesWriter(part_path, fragment=True) as writer:
+            writer.write_events(events, case_id_key)
+    return part_path
@@ -0,0 +1,303 @@
+"""
+Provides the extraction of an event log for a (part of a) cohort, from events over event
+attributes to the join of case attributes
+"""
+from functools import partial
+import logging
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from extractor.admission import extract_admission_events
+from extractor.async_backend import run_stages_concurrently, run_stages_serially
+from extractor.case_attributes import extract_case_attributes
+from extractor.checkpoints import get_checkpoint_key, get_id_digest, run_checkpointed
+from extractor.cli_helper import ask_additional_event_attributes, create_db_pool
+from extractor.constants import ADMISSION_CASE_KEY, ADMISSION_EVENT_TYPE, OTHER_EVENT_TYPE,\
+    POE_EVENT_TYPE, SUBJECT_CASE_KEY, SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.event_attributes import extract_event_attribute_specs,\
+    fetch_event_attribute_table, group_attribute_specs
+from extractor.extraction_helper import get_filename_string
+from extractor.id_sets import get_cohort_ids
+from extractor.poe import extract_poe_events
+from extractor.profiling import run_profiled
+from extractor.result_store import get_admission_column, get_store_dir, get_stored_partitions,\
+    load_stored_events, write_store_partition
+from extractor.tables import extract_table_events
+from extractor.transfer import extract_transfer_events
+
+
+logger = logging.getLogger('cli')
+
+# columns the events of an event type are sorted by during their extraction. Events of other
+# event types keep the order of the database, which is approximated by the cohort order.
+event_sort_columns = {ADMISSION_EVENT_TYPE: ["time:timestamp"],
+                      TRANSFER_EVENT_TYPE: [ADMISSION_CASE_KEY, "time:timestamp"],
+                      OTHER_EVENT_TYPE: [ADMISSION_CASE_KEY, "time:timestamp"]}
+
+
+class ExtractionSettings(NamedTuple):
+    """
+    Settings of an extraction, which are the same for every part of the cohort. If
+    additional_attributes is None, the event attributes are asked for interactively.
+    Incremental extractions use the result store once the event attributes are known.
+    """
+    db_settings: Tuple[str, str, str, str]
+    case_notion: str
+    case_attribute_list: Optional[List[str]]
+    event_type: str
+    include_medications: bool = False
+    tables_to_extract: Optional[List[str]] = None
+    tables_activities: Optional[List[str]] = None
+    tables_timestamps: Optional[List[str]] = None
+    required_columns: Optional[List[str]] = None
+    additional_attributes: Optional[List[dict]] = None
+    aggregate_in_database: bool = False
+    use_async_backend: bool = False
+    save_intermediate: bool = False
+    incremental: bool = False
+
+
+def get_case_id_key(case_notion: str) -> str:
+    """Provides the id column of a case notion"""
+    if case_notion == SUBJECT_CASE_NOTION:
+        return SUBJECT_CASE_KEY
+    return ADMISSION_CASE_KEY
+
+
+def get_extraction_tables(settings: ExtractionSettings) -> List[str]:
+    """Provides the tables an extraction reads per case, for estimating its memory usage"""
+    tables = ["admissions"]
+    if settings.event_type == TRANSFER_EVENT_TYPE:
+        tables += ["transfers"]
+    elif settings.event_type == POE_EVENT_TYPE:
+        tables += ["poe", "poe_detail"]
+        if settings.include_medications:
+            tables += ["pharmacy", "prescriptions", "emar", "emar_detail"]
+    elif settings.event_type == OTHER_EVENT_TYPE and settings.tables_to_extract is not None:
+        tables += settings.tables_to_extract
+    if not settings.aggregate_in_database and settings.additional_attributes:
+        tables += [attribute_spec["table_to_aggregate"]
+                   for attribute_spec in settings.additional_attributes]
+    return list(dict.fromkeys(tables))
+
+
+def get_attribute_prefetch_groups(settings: ExtractionSettings) -> Dict[Tuple, List[int]]:
+    """
+    Provides the (table, time column) groups of event attribute specs, whose source tables
+    the async backend prefetches as stages
+    """
+    if not settings.use_async_backend or settings.aggregate_in_database \
+            or not settings.additional_attributes:
+        return {}
+    return group_attribute_specs(settings.additional_attributes,
+                                 ["table_to_aggregate", "time_column"])
+
+
+def create_stage_pool(settings: ExtractionSettings) -> Optional[ThreadedConnectionPool]:
+    """
+    Creates the connection pool of the async backend with a connection per extraction stage,
+    which is shared by all parts of the cohort. Returns None without the async backend.
+    """
+    if not settings.use_async_backend:
+        return None
+    stage_count = 1 + int(settings.case_attribute_list is not None) + \
+        len(get_attribute_prefetch_groups(settings))
+    return create_db_pool(*settings.db_settings, stage_count)
+
+
+def build_extraction_stages(cohort: pd.DataFrame, settings: ExtractionSettings,
+                            db_pool: Optional[ThreadedConnectionPool] = None
+                            ) -> Dict[Hashable, Callable[[cursor], Any]]:
+    """
+    Provides the extraction stages, which only depend on the cohort: case attributes,
+    events and (for the async backend) the source tables of configured event attributes
+    """
+    stages: Dict[Hashable, Callable[[cursor], Any]] = {}
+    save_intermediate = settings.save_intermediate
+
+    # extract case attributes
+    if settings.case_attribute_list is not None:
+        # extract_case_attributes extends the given list by the case id key
+        stages["case_attributes"] = lambda stage_cursor: extract_case_attributes(
+            stage_cursor, cohort, settings.case_notion,
+            list(settings.case_attribute_list), save_intermediate)  # type: ignore
+
+    if settings.event_type == ADMISSION_EVENT_TYPE:
+        stages["events"] = lambda stage_cursor: extract_admission_events(
+            stage_cursor, cohort, save_intermediate)
+    elif settings.event_type == TRANSFER_EVENT_TYPE:
+        stages["events"] = lambda stage_cursor: extract_transfer_events(
+            stage_cursor, cohort, save_intermediate)
+    elif settings.event_type == POE_EVENT_TYPE:
+        stages["events"] = lambda stage_cursor: extract_poe_events(
+            stage_cursor, cohort, settings.include_medications, save_intermediate, db_pool)
+    elif settings.event_type == OTHER_EVENT_TYPE:
+        stages["events"] = lambda stage_cursor: extract_table_events(
+            stage_cursor, cohort, settings.tables_to_extract,  # type: ignore
+            settings.tables_activities, settings.tables_timestamps,
+            save_intermediate, settings.required_columns, db_pool)
+
+    # prefetch the source tables of configured event attributes
+    cohort_admission_ids = get_cohort_ids(cohort, ADMISSION_CASE_KEY)
+    attribute_groups = get_attribute_prefetch_groups(settings)
+    for (table_to_aggregate, time_column), attribute_indices in attribute_groups.items():
+        stages[(table_to_aggregate, time_column)] = partial(
+            fetch_event_attribute_table, hospital_admission_ids=cohort_admission_ids,
+            table_to_aggregate=table_to_aggregate, time_column=time_column,
+            attribute_specs=[settings.additional_attributes[index]  # type: ignore
+                             for index in attribute_indices])
+
+    # checkpoint every stage, keyed by the settings and the admissions of the cohort
+    stage_key = get_checkpoint_key(get_store_configuration(settings)) + "-" + \
+        get_id_digest(cohort_admission_ids)
+    return {stage_name: checkpoint_stage(
+        "-".join(stage_name) if isinstance(stage_name, tuple) else str(stage_name),
+        stage_key, stage) for stage_name, stage in stages.items()}
+
+
+def checkpoint_stage(stage_name: str, stage_key: str,
+                     stage: Callable[[cursor], Any]) -> Callable[[cursor], Any]:
+    """Provides a stage, which is profiled and read from its checkpoint when resuming"""
+    return lambda stage_cursor: run_profiled(
+        stage_name, partial(run_checkpointed, stage_name + "-" + stage_key,
+                            lambda: stage(stage_cursor)))
+
+
+def extract_cohort_log(db_cursor: cursor, cohort: pd.DataFrame, settings: ExtractionSettings,
+                       db_pool: Optional[ThreadedConnectionPool] = None,
+                       stage_pool: Optional[ThreadedConnectionPool] = None
+                       ) -> Tuple[pd.DataFrame, str, List[dict]]:
+    """
+    Extracts the event log of a cohort: the events, their additional event attributes and
+    the case attributes prefixed with case:. Returns the log, its case id key and the
+    event attribute specifications, which include interactively provided ones.
+    For incremental extractions, only admissions missing in the result store are extracted.
+    The async backend runs the extraction stages on the connections of stage_pool.
+    """
+    if settings.incremental and settings.additional_attributes is not None:
+        return extract_cohort_log_incrementally(db_cursor, cohort, settings, db_pool,
+                                                stage_pool)
+    return extract_cohort_log_from_database(db_cursor, cohort, settings, db_pool, stage_pool)
+
+
+def get_store_configuration(settings: ExtractionSettings) -> dict:
+    """Provides the settings which determine the extracted log of an admission"""
+    return {"case_notion": settings.case_notion,
+            "case_attribute_list": settings.case_attribute_list,
+            "event_type": settings.event_type,
+            "include_medications": settings.include_medications,
+            "tables_to_extract": settings.tables_to_extract,
+            "tables_activities": settings.tables_activities,
+            "tables_timestamps": settings.tables_timestamps,
+            "required_columns": settings.required_columns,
+            "additional_attributes": settings.additional_attributes}
+
+
+def extract_cohort_log_incrementally(db_cursor: cursor, cohort: pd.DataFrame,
+                                     settings: ExtractionSettings,
+                                     db_pool: Optional[ThreadedConnectionPool] = None,
+                                     stage_pool: Optional[ThreadedConnectionPool] = None
+                                     ) -> Tuple[pd.DataFrame, str, List[dict]]:
+    """
+    Extracts the event log of a cohort from the result store, querying the database only
+    for admissions which are not stored yet. Freshly extracted admissions are stored.
+    """
+    store_dir = get_store_dir(db_cursor, get_store_configuration(settings))
+    partitions = get_stored_partitions(store_dir)
+    admission_ids = get_cohort_ids(cohort, ADMISSION_CASE_KEY)
+    stored_ids = np.unique(np.concatenate([np.empty(0, dtype=np.int64)] +
+                                          list(partitions.values())))
+    missing_ids = np.setdiff1d(admission_ids, stored_ids, assume_unique=True)
+    logger.info("Reading %d admissions from the result store, extracting %d admissions",
+                len(admission_ids) - len(missing_ids), len(missing_ids))
+
+    case_id_key = get_case_id_key(settings.case_notion)
+    if settings.case_attribute_list is not None:
+        case_id_key = 'case:' + case_id_key
+    logs = load_stored_events(partitions, np.intersect1d(admission_ids, stored_ids,
+                                                         assume_unique=True))
+    if len(missing_ids) > 0 or not logs:
+        missing_cohort = cohort[cohort[ADMISSION_CASE_KEY].isin(missing_ids)]  # type: ignore
+        events, case_id_key, _ = extract_cohort_log_from_database(db_cursor, missing_cohort,
+                                                                  settings, db_pool,
+                                                                  stage_pool)
+        if len(missing_ids) > 0:
+            write_store_partition(store_dir, missing_ids, events)
+        logs.append(events)
+
+    events = pd.concat(logs, ignore_index=True)
+    if len(logs) > 1:
+        events = sort_like_extraction(events, cohort, settings.event_type)
+    return events, case_id_key, settings.additional_attributes  # type: ignore
+
+
+def sort_like_extraction(events: pd.DataFrame, cohort: pd.DataFrame,
+                         event_type: str) -> pd.DataFrame:
+    """
+    Sorts the events of several extractions like a single extraction of all their admissions
+    does: by the sort columns of the event type, or else by admission in cohort order.
+    Ties keep the order of the given events.
+    """
+    admission_column = get_admission_column(events)
+    sort_columns = [admission_column if column == ADMISSION_CASE_KEY else column
+                    for column in event_sort_columns.get(event_type, [])]
+    if sort_columns:
+        return events.sort_values(sort_columns, kind="stable",  # type: ignore
+                                  ignore_index=True)
+    admission_ids = pd.to_numeric(cohort[ADMISSION_CASE_KEY], errors="coerce").drop_duplicates()
+    cohort_positions = pd.Series(np.arange(len(admission_ids)), index=pd.Index(admission_ids))
+    event_positions = pd.to_numeric(events[admission_column], errors="coerce")\
+        .map(cohort_positions).to_numpy()
+    return events.iloc[np.argsort(event_positions, kind="stable")].reset_index(drop=True)
+
+
+def extract_cohort_log_from_database(db_cursor: cursor, cohort: pd.DataFrame,
+                                     settings: ExtractionSettings,
+                                     db_pool: Optional[ThreadedConnectionPool] = None,
+                                     stage_pool: Optional[ThreadedConnectionPool] = None
+                                     ) -> Tuple[pd.DataFrame, str, List[dict]]:
+    """
+    Extracts the event log of a cohort from the database. Without a stage pool, the stages
+    run one after another on the given cursor.
+    """
+    stages = build_extraction_stages(cohort, settings, db_pool)
+    if settings.use_async_backend and stage_pool is not None:
+        stage_results = run_stages_concurrently(stage_pool, stages)
+    else:
+        stage_results = run_stages_serially(db_cursor, stages)
+    events = stage_results["events"]
+    case_attributes = stage_results.get("case_attributes")
+    prefetched_tables = {stage_name: stage_result
+                         for stage_name, stage_result in stage_results.items()
+                         if isinstance(stage_name, tuple)}
+
+    additional_attributes = settings.additional_attributes
+    if additional_attributes is None:
+        additional_attributes = ask_additional_event_attributes(db_cursor, events)
+    events = run_profiled("event_attributes", partial(
+        extract_event_attribute_specs, db_cursor, events, additional_attributes,
+        settings.aggregate_in_database, prefetched_tables))
+
+    if settings.save_intermediate:
+        csv_filename = get_filename_string(
+            "event_attribute_enhanced_log", ".csv")
+        events.to_csv("output/" + csv_filename)
+
+    # set case id key based on determined case notion
+    case_id_key = get_case_id_key(settings.case_notion)
+
+    # rename every case attribute to have case prefix
+    if settings.case_attribute_list is not None and case_attributes is not None:
+        # join case attr to events
+        events = events.merge(case_attributes, on=case_id_key, how='left')
+
+        # rename case id key, as this will be affected too
+        for case_attr in settings.case_attribute_list + [case_id_key]:
+            events.rename(
+                columns={case_attr: "case:" + case_attr}, inplace=True)
+        case_id_key = 'case:' + case_id_key
+
+    return events, case_id_key, additional_attributes
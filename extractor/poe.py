@@ -1,49 +1,43 @@
 """Provides functionality to generate POE event logs for a given cohort"""
 import logging
+from typing import Optional
+import numpy as np
 import pandas as pd
 from psycopg2.extensions import cursor
-from .extraction_helper import (extract_table_for_subject_ids, get_filename_string,
+from psycopg2.pool import ThreadedConnectionPool
+from extractor.connection_pool import pooled_executor
+from extractor.id_sets import get_cohort_ids
+from .extraction_helper import (extract_emar_detail_for_admission_ids, get_filename_string,
+                                extract_medications_for_admission_ids,
                                 extract_poe_for_admission_ids,
-                                extract_table_for_admission_ids)
+                                extract_table_for_admission_ids,
+                                prescription_detail_columns)
 
 
 logger = logging.getLogger('cli')
 
 
 def extract_poe_events(db_cursor: cursor, cohort: pd.DataFrame, include_medications: bool,
-                       save_intermediate: bool) -> pd.DataFrame:
+                       save_intermediate: bool,
+                       db_pool: Optional[ThreadedConnectionPool] = None) -> pd.DataFrame:
     """
-    Extracts poe events for a given cohort
+    Extracts poe events for a given cohort. Medications are joined with their prescriptions
+    and emar administrations in the database. If a connection pool is given, the poe and
+    medication queries run concurrently, each on its own pooled connection.
     """
 
     logger.info("Begin extracting POE events!")
 
-    hospital_admission_ids = list(cohort["hadm_id"].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
-    poe = extract_poe_for_admission_ids(db_cursor, hospital_admission_ids)
+    hospital_admission_ids = get_cohort_ids(cohort, "hadm_id")
+    with pooled_executor(db_cursor, db_pool) as submit:
+        poe_future = submit(extract_poe_for_admission_ids, hospital_admission_ids)
+        if include_medications is True:
+            medications_future = submit(extract_medications_for_admission_ids,
+                                        hospital_admission_ids)
+            medications = medications_future.result()
+        poe = poe_future.result()
 
     if include_medications is True:
-        pharmacy = extract_table_for_admission_ids(db_cursor, hospital_admission_ids,
-                                                   'mimic_hosp', 'pharmacy')
-        prescriptions = extract_table_for_admission_ids(db_cursor, hospital_admission_ids,
-                                                        'mimic_hosp', 'prescriptions')
-        prescriptions = prescriptions[['pharmacy_id', 'drug_type', 'drug', 'gsn', 'ndc',
-                                       'prod_strength', 'form_rx', 'dose_val_rx',
-                                       'dose_unit_rx', 'form_val_disp', 'form_unit_disp']]
-        emar = extract_table_for_admission_ids(db_cursor, hospital_admission_ids,
-                                               'mimic_hosp', "emar")
-        emar_subject_ids = list(emar["subject_id"].unique())
-        emar_detail = extract_table_for_subject_ids(db_cursor, emar_subject_ids, 'mimic_hosp',
-                                                    "emar_detail")
-        emar = emar.merge(emar_detail, on=["emar_id", "subject_id", "emar_seq", "pharmacy_id"],
-                          how="left")
-        emar.rename(columns={"medication": "emar_medication",
-                    "route": "emar_route"}, inplace=True)
-        medications = pharmacy.merge(
-            prescriptions, on=["pharmacy_id"], how="left")
-        medications = medications.merge(
-            emar, on=["poe_id", "hadm_id", "subject_id", "pharmacy_id"], how="left")
-        medications.drop_duplicates("poe_id", inplace=True)  # type: ignore
         poe_with_medications = poe.merge(medications, on=["poe_id", "subject_id", "hadm_id"],
                                          how="left")
         poe_with_medications.loc[poe_with_medications["order_type"] == "Medications",
@@ -65,3 +59,34 @@ def extract_poe_events(db_cursor: cursor, cohort: pd.DataFrame, include_medicati
 
     logger.info("Done extracting POE events!")
     return poe
+
+
+def extract_medications_in_memory(db_cursor: cursor, hospital_admission_ids: np.ndarray,
+                                  db_pool: Optional[ThreadedConnectionPool] = None
+                                  ) -> pd.DataFrame:
+    """
+    Extracts pharmacy orders enriched with prescriptions and emar administrations for a list
+    of hospital admission ids by merging the tables in pandas, with one row per poe_id
+    """
+    with pooled_executor(db_cursor, db_pool) as submit:
+        pharmacy_future = submit(extract_table_for_admission_ids, hospital_admission_ids,
+                                 'mimic_hosp', 'pharmacy')
+        prescriptions_future = submit(extract_table_for_admission_ids,
+                                      hospital_admission_ids, 'mimic_hosp', 'prescriptions',
+                                      prescription_detail_columns)
+        emar_future = submit(extract_table_for_admission_ids, hospital_admission_ids,
+                             'mimic_hosp', "emar")
+        emar_detail_future = submit(extract_emar_detail_for_admission_ids,
+                                    hospital_admission_ids)
+
+        medications = pharmacy_future.result().merge(
+            prescriptions_future.result(), on=["pharmacy_id"], how="left")
+        emar = emar_future.result().merge(emar_detail_future.result(),
+                                          on=["emar_id", "subject_id", "emar_seq",
+                                              "pharmacy_id"], how="left")
+    emar.rename(columns={"medication": "emar_medication",
+                "route": "emar_route"}, inplace=True)
+    medications = medications.merge(
+        emar, on=["poe_id", "hadm_id", "subject_id", "pharmacy_id"], how="left")
+    medications.drop_duplicates("poe_id", inplace=True)  # type: ignore
+    return medications
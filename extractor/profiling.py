@@ -0,0 +1,257 @@
+"""
+Provides an optional profiling of extraction stages and queries, which records wall time,
+(optionally) server execution time, rows, bytes and data frame memory of every query as well
+as wall time, data frame memory and peak resident memory of every stage, and writes them as
+json report
+"""
+import cProfile
+from contextlib import contextmanager
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+import pandas as pd
+from psycopg2 import Error
+from psycopg2.extensions import cursor
+
+
+logger = logging.getLogger('cli')
+
+Result = TypeVar("Result")
+
+profile_capture_tools = ["cprofile", "pyinstrument"]
+
+profile_options: Dict[str, Any] = {"enabled": False, "capture": None, "analyze": False}
+
+# records of the current run and the capture of the slowest stage so far
+profile_state: Dict[str, Any] = {"stages": [], "queries": [], "capture_stage": None,
+                                 "capture_output": "", "capture_seconds": 0.0}
+
+# stack of the stages running in the current thread, for attributing queries to stages
+stage_stack = threading.local()
+
+# only one profiler can be active at a time, so concurrent and nested stages are not captured
+capture_lock = threading.Lock()
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def configure_profiling(enabled: bool, capture: Optional[str] = None,
+                        analyze: bool = False) -> None:
+    """
+    Enables recording stage and query metrics. With capture set to cprofile or pyinstrument,
+    stages are profiled (one at a time) and the profile of the slowest stage is kept.
+    With analyze set, every query is run a second time with EXPLAIN ANALYZE to record its
+    server execution time.
+    """
+    profile_options["enabled"] = enabled
+    profile_options["capture"] = capture if enabled else None
+    profile_options["analyze"] = analyze and enabled
+    profile_state.update({"stages": [], "queries": [], "capture_stage": None,
+                          "capture_output": "", "capture_seconds": 0.0})
+
+
+def get_rss_bytes() -> int:
+    """Provides the current resident memory of the process"""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return get_peak_rss_bytes()
+
+
+def get_peak_rss_bytes() -> int:
+    """Provides the peak resident memory of the process so far"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_frame_bytes(value: Any) -> Optional[int]:
+    """Provides the memory of a data frame result (including its python objects)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())  # type: ignore
+    return None
+
+
+class PeakMemorySampler:
+    """Samples the resident memory in a background thread, to determine the peak of a stage"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self) -> None:
+        """Samples until stopped"""
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, get_rss_bytes())
+
+    def __enter__(self) -> "PeakMemorySampler":
+        self.peak = get_rss_bytes()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.peak = max(self.peak, get_rss_bytes())
+
+
+def get_current_stage() -> Optional[Dict[str, Any]]:
+    """Provides the record of the innermost stage running in the current thread"""
+    stages = getattr(stage_stack, "stages", [])
+    return stages[-1] if stages else None
+
+
+def start_capture() -> Any:
+    """Starts profiling the current thread with the configured capture tool"""
+    if profile_options["capture"] == "pyinstrument":
+        # pyinstrument is installed with the profile extra
+        # pylint: disable=import-outside-toplevel,import-error
+        from pyinstrument import Profiler  # type: ignore
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_capture(profiler: Any, stage_name: str, seconds: float) -> None:
+    """Stops profiling and keeps the profile if the stage is the slowest so far"""
+    if profile_options["capture"] == "pyinstrument":
+        profiler.stop()
+        if seconds >= profile_state["capture_seconds"]:
+            profile_state["capture_stage"] = stage_name
+            profile_state["capture_output"] = profiler.output_text(unicode=True)
+    else:
+        profiler.disable()
+        if seconds >= profile_state["capture_seconds"]:
+            stats_output = io.StringIO()
+            pstats.Stats(profiler, stream=stats_output).sort_stats("cumulative")\
+                .print_stats(50)
+            profile_state["capture_stage"] = stage_name
+            profile_state["capture_output"] = stats_output.getvalue()
+    profile_state["capture_seconds"] = max(profile_state["capture_seconds"], seconds)
+
+
+@contextmanager
+def profiled_stage(stage_name: str) -> Iterator[Dict[str, Any]]:
+    """
+    Records wall time (without the EXPLAIN runs of its queries) and peak resident
+    memory of a stage. The yielded record takes the result of the stage (key "result"), whose
+    data frame memory is recorded.
+    """
+    if not profile_options["enabled"]:
+        yield {}
+        return
+    stages = getattr(stage_stack, "stages", [])
+    stage_record: Dict[str, Any] = {"stage": stage_name,
+                                    "parent": stages[-1]["stage"] if stages else None,
+                                    "queries": 0, "query_seconds": 0.0, "explain_seconds": 0.0}
+    stage_stack.stages = stages + [stage_record]
+    profiler = start_capture() if profile_options["capture"] is not None \
+        and capture_lock.acquire(blocking=False) else None
+    record: Dict[str, Any] = {}
+    start = time.perf_counter()
+    try:
+        with PeakMemorySampler() as sampler:
+            yield record
+    finally:
+        seconds = time.perf_counter() - start
+        stage_stack.stages = stages
+        if profiler is not None:
+            stop_capture(profiler, stage_name, seconds)
+            capture_lock.release()
+    stage_record.update({"seconds": seconds - stage_record.pop("explain_seconds"),
+                         "frame_bytes": get_frame_bytes(record.get("result")),
+                         "peak_rss_bytes": sampler.peak})
+    profile_state["stages"].append(stage_record)
+
+
+def run_profiled(stage_name: str, stage: Callable[[], Result]) -> Result:
+    """Runs a stage as profiled stage and returns its result"""
+    with profiled_stage(stage_name) as record:
+        record["result"] = stage()
+        return record["result"]
+
+
+def explain_query(db_cursor: cursor, sql_query: str, params: Optional[Any],
+                  analyze: bool = False) -> dict:
+    """
+    Explains a query to determine the width of its result rows, without running it. With
+    analyze, the query is run with EXPLAIN ANALYZE to determine its server execution time as
+    well. Returns an empty plan if the query can not be explained.
+    """
+    explain_options = "analyze, format json" if analyze else "format json"
+    db_cursor.execute("savepoint explain_query")
+    try:
+        db_cursor.execute("explain (" + explain_options + ") " + sql_query, params)
+        plan = db_cursor.fetchone()[0][0]  # type: ignore
+    except Error as error:
+        db_cursor.execute("rollback to savepoint explain_query")
+        logger.debug("Could not explain query: %s", error)
+        return {}
+    db_cursor.execute("release savepoint explain_query")
+    return plan
+
+
+def profile_query_frames(db_cursor: cursor, sql_query: str, params: Optional[Any],
+                         frames: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    Passes on the data frames of a query, recording the time spent fetching them (without the
+    time of the consumer), their rows and memory, as well as the server execution time if
+    queries are analyzed
+    """
+    seconds = 0.0
+    rows = 0
+    frame_bytes = 0
+    while True:
+        start = time.perf_counter()
+        frame = next(frames, None)
+        seconds += time.perf_counter() - start
+        if frame is None:
+            break
+        rows += len(frame)
+        frame_bytes += get_frame_bytes(frame) or 0
+        yield frame
+
+    # the plan is determined after fetching, and is excluded from the stage times
+    explain_start = time.perf_counter()
+    plan = explain_query(db_cursor, sql_query, params, profile_options["analyze"])
+    plan_width = plan.get("Plan", {}).get("Plan Width")
+    for running_stage in getattr(stage_stack, "stages", []):
+        running_stage["explain_seconds"] += time.perf_counter() - explain_start
+    stage_record = get_current_stage()
+    if stage_record is not None:
+        stage_record["queries"] += 1
+        stage_record["query_seconds"] += seconds
+    profile_state["queries"].append({
+        "stage": stage_record["stage"] if stage_record is not None else None,
+        "query": " ".join(sql_query.split()),
+        "seconds": seconds, "server_seconds": plan["Execution Time"] / 1000
+        if "Execution Time" in plan else None,
+        "rows": rows, "bytes": rows * plan_width if plan_width is not None else None,
+        "frame_bytes": frame_bytes})
+
+
+def write_profile_report(file_path: str) -> None:
+    """Writes the recorded stages and queries as json report (and the captured profile)"""
+    report: Dict[str, Any] = {"peak_rss_bytes": get_peak_rss_bytes(),
+                              "stages": profile_state["stages"],
+                              "queries": profile_state["queries"]}
+    if profile_state["capture_stage"] is not None:
+        tool = profile_options["capture"]
+        capture_path = os.path.splitext(file_path)[0] + "_" + tool + ".txt"
+        with open(capture_path, "w", encoding="utf-8") as capture_file:
+            capture_file.write(profile_state["capture_output"])
+        report["capture"] = {"stage": profile_state["capture_stage"], "tool": tool,
+                             "path": capture_path}
+    with open(file_path, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+    logger.info("Wrote profile report to %s", file_path)
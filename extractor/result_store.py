@@ -0,0 +1,86 @@
+"""
+Provides a local store of extracted event logs per hospital admission, so that repeated
+extractions only query the database for admissions which were not extracted before
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import cursor
+
+from extractor.constants import ADMISSION_CASE_KEY, RESULT_STORE_DIR
+from extractor.dictionary_cache import get_database_identity
+
+
+logger = logging.getLogger('cli')
+
+ID_FILE_SUFFIX = ".ids.npy"
+EVENT_FILE_SUFFIX = ".pkl"
+
+
+def get_store_dir(db_cursor: cursor, configuration: dict) -> str:
+    """
+    Provides the store directory of an extraction configuration (event type, tables, activity
+    and timestamp columns, attribute specs, ...) for the current database
+    """
+    configuration_key = hashlib.sha1(json.dumps(configuration, sort_keys=True, default=str)
+                                     .encode("utf-8")).hexdigest()[:16]
+    return os.path.join(RESULT_STORE_DIR, get_database_identity(db_cursor), configuration_key)
+
+
+def get_stored_partitions(store_dir: str) -> Dict[str, np.ndarray]:
+    """Provides the admission ids of every complete partition of a store, by partition path"""
+    return {id_file[:-len(ID_FILE_SUFFIX)]: np.load(id_file)
+            for id_file in glob.glob(os.path.join(glob.escape(store_dir), "*" + ID_FILE_SUFFIX))}
+
+
+def get_admission_column(events: pd.DataFrame) -> str:
+    """Provides the hadm_id column of a log, which is prefixed with case: for admission cases"""
+    if ADMISSION_CASE_KEY in events.columns:
+        return ADMISSION_CASE_KEY
+    return "case:" + ADMISSION_CASE_KEY
+
+
+def write_store_partition(store_dir: str, admission_ids: np.ndarray,
+                          events: pd.DataFrame) -> None:
+    """
+    Stores the log of a set of admissions (including admissions without events) as a
+    partition. The id file is written last, so that only complete partitions are read.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    partition = os.path.join(store_dir, hashlib.sha1(
+        ",".join(map(str, admission_ids)).encode("utf-8")).hexdigest()[:16])
+    events.to_pickle(partition + EVENT_FILE_SUFFIX)
+    with open(partition + ID_FILE_SUFFIX + ".tmp", "wb") as id_file:
+        np.save(id_file, admission_ids)
+    os.replace(partition + ID_FILE_SUFFIX + ".tmp", partition + ID_FILE_SUFFIX)
+
+
+def load_stored_events(partitions: Dict[str, np.ndarray],
+                       admission_ids: np.ndarray) -> List[pd.DataFrame]:
+    """
+    Reads the stored logs of the given admissions from the partitions which include them.
+    Admissions stored in several partitions are only read from the first of them.
+    """
+    stored_logs = []
+    for partition, partition_ids in partitions.items():
+        partition_ids = np.intersect1d(partition_ids, admission_ids, assume_unique=True)
+        if len(partition_ids) == 0:
+            continue
+        admission_ids = np.setdiff1d(admission_ids, partition_ids, assume_unique=True)
+        events = pd.read_pickle(partition + EVENT_FILE_SUFFIX)
+        admission_column = get_admission_column(events)
+        stored_logs.append(events[pd.to_numeric(events[admission_column], errors="coerce")
+                                  .isin(partition_ids)])
+    return stored_logs
+
+
+def clear_result_store() -> None:
+    """Removes all stored extraction results"""
+    logger.info("Clearing result store...")
+    shutil.rmtree(RESULT_STORE_DIR, ignore_errors=True)
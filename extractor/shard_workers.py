@@ -0,0 +1,89 @@
+"""
+Provides the extraction of cohort shards in a pool of worker processes, each with its own
+database connection, so that the pandas transformations of several shards run in parallel
+"""
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import math
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional
+import pandas as pd
+from psycopg2.extensions import connection
+
+from extractor.checkpoints import checkpoint_options, configure_checkpoints
+from extractor.cli_helper import create_db_connection
+from extractor.constants import SHARDS_PER_WORKER
+from extractor.copy_transport import configure_bulk_copy
+from extractor.log_writer import OUTPUT_DIR, EventLogWriter, write_log_part
+from extractor.pipeline import ExtractionSettings, create_stage_pool, extract_cohort_log
+
+
+logger = logging.getLogger('cli')
+
+# connection and async backend pool of the current worker process, set by initialize_worker
+worker_state: Dict[str, Any] = {"connection": None, "stage_pool": None}
+
+
+def get_worker_shard_size(cohort: pd.DataFrame, workers: int) -> int:
+    """Provides a shard size, which splits the cohort into SHARDS_PER_WORKER shards per worker"""
+    return max(math.ceil(len(cohort) / (workers * SHARDS_PER_WORKER)), 1)
+
+
+def initialize_worker(settings: ExtractionSettings, use_bulk_copy: bool,
+                      log_level: int, checkpoint_directory: Optional[str],
+                      resume: bool) -> None:
+    """Connects a worker process to the database and applies the settings of the main process"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+            fmt='%(asctime)s - %(levelname)s - %(process)d - %(module)s - %(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(log_level)
+    configure_bulk_copy(use_bulk_copy)
+    configure_checkpoints(checkpoint_directory, resume)
+    worker_state["connection"] = create_db_connection(*settings.db_settings)
+    worker_state["stage_pool"] = create_stage_pool(settings)
+
+
+def extract_shard_part(cohort: pd.DataFrame, settings: ExtractionSettings, log_format: str,
+                       part_path: str, cases_per_partition: Optional[int]) -> str:
+    """Extracts the event log of a shard in a worker process and writes it as part file"""
+    worker_connection: Optional[connection] = worker_state["connection"]
+    assert worker_connection is not None, "Worker has to be initialized before extracting"
+    with worker_connection.cursor() as db_cursor:
+        events, case_id_key, _ = extract_cohort_log(db_cursor, cohort, settings,
+                                                    stage_pool=worker_state["stage_pool"])
+    part_path = write_log_part(events, case_id_key, log_format, part_path, cases_per_partition)
+    worker_connection.commit()
+    return part_path
+
+
+def extract_shards_in_processes(shards: List[pd.DataFrame], settings: ExtractionSettings,
+                                workers: int, log_writer: EventLogWriter,
+                                use_bulk_copy: bool) -> None:
+    """
+    Extracts shards in a pool of worker processes, which write the log of every shard to a
+    part file. The parts are merged into the log in shard order as soon as they are done.
+    Event attributes have to be given in the settings, as workers can not ask for them.
+    """
+    logger.info("Extracting %d shards in %d worker processes...", len(shards), workers)
+    part_dir = tempfile.mkdtemp(prefix="parts-", dir=OUTPUT_DIR)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initialize_worker,
+                                 initargs=(settings, use_bulk_copy,
+                                           logger.getEffectiveLevel(),
+                                           checkpoint_options["directory"],
+                                           checkpoint_options["resume"])) as executor:
+            futures = [executor.submit(extract_shard_part, shard, settings,
+                                       log_writer.log_format,
+                                       os.path.join(part_dir,
+                                                    "shard-" + str(shard_number + 1).zfill(5)),
+                                       log_writer.cases_per_partition)
+                       for shard_number, shard in enumerate(shards)]
+            for shard_number, future in enumerate(futures):
+                log_writer.append_part(future.result())
+                logger.info("Merged shard %d of %d", shard_number + 1, len(shards))
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
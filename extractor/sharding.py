@@ -0,0 +1,117 @@
+"""
+Provides the split of a cohort into shards of cases, which are small enough to be extracted
+within a memory budget
+"""
+import logging
+from typing import List
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import cursor
+
+from extractor.constants import ADMISSION_CASE_KEY, SHARD_MEMORY_FACTOR, SUBJECT_CASE_KEY
+
+
+logger = logging.getLogger('cli')
+
+# Row width in bytes assumed for tables without statistics
+DEFAULT_ROW_WIDTH = 100
+
+TABLE_STATISTICS_QUERY = """
+    select c.reltuples,
+        (select sum(s.avg_width) from pg_stats s
+         where s.schemaname = n.nspname and s.tablename = c.relname),
+        (select s.n_distinct from pg_stats s
+         where s.schemaname = n.nspname and s.tablename = c.relname
+         and s.attname = %(admission_key)s),
+        (select s.n_distinct from pg_stats s
+         where s.schemaname = n.nspname and s.tablename = c.relname
+         and s.attname = %(subject_key)s)
+    from pg_class c join pg_namespace n on n.oid = c.relnamespace
+    where c.relkind = 'r' and n.nspname like 'mimic%%' and c.relname = %(table)s
+    limit 1"""
+
+
+def get_table_statistics(db_cursor: cursor, table: str) -> tuple:
+    """
+    Provides the planner statistics of a MIMIC table: estimated rows, summed average column
+    width and the distinct counts of hadm_id and subject_id (None if unknown)
+    """
+    db_cursor.execute(TABLE_STATISTICS_QUERY, {"admission_key": ADMISSION_CASE_KEY,
+                                               "subject_key": SUBJECT_CASE_KEY,
+                                               "table": table.lower()})
+    statistics = db_cursor.fetchone()
+    if statistics is None:
+        return None, None, None, None
+    return statistics
+
+
+def to_distinct_count(n_distinct: float, rows: float) -> float:
+    """Converts pg_stats.n_distinct (negative values are fractions of the rows) to a count"""
+    if n_distinct < 0:
+        return -n_distinct * rows
+    return n_distinct
+
+
+def estimate_admission_bytes(db_cursor: cursor, tables: List[str]) -> float:
+    """
+    Estimates the memory an extraction needs per hospital admission from the planner
+    statistics of the tables it reads: the rows per admission (or per patient, spread over
+    the admissions of a patient) times the average row width, scaled by SHARD_MEMORY_FACTOR
+    for the overhead of data frames and intermediate copies
+    """
+    admission_rows = get_table_statistics(db_cursor, "admissions")[0] or 1
+    patient_rows = get_table_statistics(db_cursor, "patients")[0] or admission_rows
+    admissions_per_patient = max(admission_rows / patient_rows, 1)
+
+    admission_bytes = 0.0
+    for table in tables:
+        rows, width, admission_distinct, subject_distinct = get_table_statistics(db_cursor,
+                                                                                 table)
+        if rows is None or rows <= 0:
+            continue
+        width = width or DEFAULT_ROW_WIDTH
+        if admission_distinct:
+            rows_per_admission = rows / to_distinct_count(admission_distinct, rows)
+        elif subject_distinct:
+            rows_per_admission = rows / to_distinct_count(subject_distinct, rows) / \
+                admissions_per_patient
+        else:
+            rows_per_admission = rows / admission_rows
+        admission_bytes += rows_per_admission * width
+    return admission_bytes * SHARD_MEMORY_FACTOR
+
+
+def get_shard_size(db_cursor: cursor, tables: List[str], memory_budget: int) -> int:
+    """Provides the number of admissions which fit into a memory budget in megabytes"""
+    admission_bytes = estimate_admission_bytes(db_cursor, tables)
+    if admission_bytes <= 0:
+        logger.info("No table statistics available, extracting the cohort at once")
+        return np.iinfo(np.int64).max
+    shard_size = max(int(memory_budget * 1024 * 1024 / admission_bytes), 1)
+    logger.info("Estimated %.0f bytes per admission, using shards of %d admissions",
+                admission_bytes, shard_size)
+    return shard_size
+
+
+def split_cohort(cohort: pd.DataFrame, case_id_key: str, shard_size: int) -> List[pd.DataFrame]:
+    """
+    Splits a cohort into shards of at most shard_size admissions (or more, if a single case
+    has more admissions), so that all admissions of a case belong to the same shard
+    """
+    if len(cohort) <= shard_size:
+        return [cohort]
+    cohort = cohort.sort_values([case_id_key, ADMISSION_CASE_KEY], kind="stable")  # type: ignore
+    case_codes = pd.factorize(cohort[case_id_key])[0]
+    case_sizes = np.bincount(case_codes[case_codes >= 0])
+    shard_starts = [0]
+    shard_admissions = 0
+    for case_code, case_size in enumerate(case_sizes):
+        if shard_admissions > 0 and shard_admissions + case_size > shard_size:
+            shard_starts.append(case_code)
+            shard_admissions = 0
+        shard_admissions += case_size
+    case_shards = np.searchsorted(shard_starts, case_codes, side="right") - 1
+    case_shards[case_codes < 0] = len(shard_starts) - 1
+    shards = [cohort[case_shards == shard] for shard in range(len(shard_starts))]
+    logger.info("Split the cohort of %d admissions into %d shards", len(cohort), len(shards))
+    return shards
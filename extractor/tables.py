@@ -1,14 +1,22 @@
 """Provides functionality to retrieve events from a list of tables"""
 import logging
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import numpy as np
 import pandas as pd
 from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
 from extractor.admission import extract_admission_events
+from extractor.connection_pool import map_with_pool
+from extractor.id_sets import get_cohort_ids
 from .extraction_helper import (extract_table_columns, get_filename_string,
                                 extract_table_for_admission_ids, extract_table,
                                 extract_emergency_department_stays_for_admission_ids,
                                 extract_ed_table_for_ed_stays, get_table_module,
-                                extract_icustay_events, detail_tables, detail_foreign_keys)
+                                extract_icustay_events, detail_tables, detail_foreign_keys,
+                                prescription_detail_columns, project_table_columns,
+                                extract_table_for_subject_ids, subject_detail_tables,
+                                dictionary_tables)
+from .dictionary_cache import extract_dictionary_table
 
 
 
@@ -18,15 +26,19 @@ logger = logging.getLogger('cli')
 def extract_table_events(db_cursor: cursor, cohort: pd.DataFrame, table_list: List[str],
                          tables_activities: Optional[List[str]],
                          tables_timestamps: Optional[List[str]],
-                         save_intermediate: bool) -> pd.DataFrame:
+                         save_intermediate: bool,
+                         required_columns: Optional[List[str]] = None,
+                         db_pool: Optional[ThreadedConnectionPool] = None) -> pd.DataFrame:
     """
-    Extracts events from a given list of tables for a given cohort
+    Extracts events from a given list of tables for a given cohort.
+    If required columns are given, only these and the activity and timestamp columns are
+    extracted as event attributes. If a connection pool is given, the tables are extracted
+    in parallel.
     """
 
     logger.info("Begin extracting events from provided tables!")
 
-    hospital_admission_ids = list(cohort["hadm_id"].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
+    hospital_admission_ids = get_cohort_ids(cohort, "hadm_id")
 
     chosen_activity_time = ask_activity_and_time(db_cursor, table_list, tables_activities,
                                                  tables_timestamps)
@@ -34,8 +46,8 @@ def extract_table_events(db_cursor: cursor, cohort: pd.DataFrame, table_list: Li
     logger.info(
         "Extracting events from provided tables. This may take a while...")
 
-    final_log = extract_tables(
-        db_cursor, table_list, hospital_admission_ids, chosen_activity_time, cohort)
+    final_log = extract_tables(db_cursor, table_list, hospital_admission_ids,
+                               chosen_activity_time, cohort, required_columns, db_pool)
     final_log = final_log.sort_values(["hadm_id", "time:timestamp"])
     if save_intermediate:
         filename = get_filename_string("table_log", ".csv")
@@ -101,62 +113,123 @@ def ask_activity_and_time(db_cursor: cursor, table_list: List[str],
     return chosen_activity_time
 
 
-def extract_tables(db_cursor: cursor, table_list: List[str], hospital_admission_ids: List[float],
-                   chosen_activity_time: Optional[dict], cohort: pd.DataFrame)\
-                    -> pd.DataFrame:
+def get_table_projection(db_cursor: cursor, module: str, table: str,
+                         detail_table: Optional[str], required_columns: List[str])\
+                          -> Tuple[List[str], List[str]]:
     """
-    Extracts given tables from the database and generates an event log
+    Determines the columns to fetch from a table and its detail table, such that the
+    required columns and all columns needed for joining them are included
     """
+    join_columns = ["subject_id", "hadm_id", "stay_id"]
+    detail_columns = []
+    if detail_table is not None:
+        foreign_key = detail_foreign_keys[detail_table]
+        foreign_keys = foreign_key if isinstance(foreign_key, list) else [foreign_key]
+        join_columns = join_columns + foreign_keys
+        if table.lower() == "hcpcsevents":
+            join_columns.append("hcpcs_cd")
+        if detail_table == "prescriptions":
+            detail_columns = [col for col in prescription_detail_columns
+                              if col in required_columns + foreign_keys]
+        else:
+            detail_columns = project_table_columns(db_cursor, module, detail_table,
+                                                   required_columns + foreign_keys)
+    table_columns = project_table_columns(db_cursor, module, table,
+                                          required_columns + join_columns)
+    return table_columns, detail_columns
 
-    final_log = pd.DataFrame()
 
-    for table in table_list:
+def extract_tables(db_cursor: cursor, table_list: List[str], hospital_admission_ids: np.ndarray,
+                   chosen_activity_time: Optional[dict], cohort: pd.DataFrame,
+                   required_columns: Optional[List[str]] = None,
+                   db_pool: Optional[ThreadedConnectionPool] = None) -> pd.DataFrame:
+    """
+    Extracts given tables from the database and generates an event log.
+    If required columns are given, only these columns (together with the chosen activity
+    and timestamp columns and the columns needed for joins) are fetched.
+    If a connection pool is given, the tables are extracted in parallel, each on its own
+    pooled connection, and combined in the order of the table list.
+    """
 
-        module = get_table_module(table)
-
-        if module == "mimic_ed":
-            ed_stays = extract_emergency_department_stays_for_admission_ids(
-                db_cursor, hospital_admission_ids)
-            ed_stays = ed_stays[["subject_id", "hadm_id", "stay_id"]]
-            ed_stay_list = list(ed_stays["stay_id"])
-            table_content = extract_ed_table_for_ed_stays(
-                db_cursor, ed_stay_list, table)
-            table_content = table_content.merge(
-                ed_stays, on=["stay_id", "subject_id"], how="inner")
-        elif table.upper() == "ADMISSIONS":
-            table_content = extract_admission_events(db_cursor, cohort, False)
-        elif table.upper() == "ICUSTAYS":
-            table_content = extract_icustay_events(db_cursor, cohort)
-        else:
-            table_content = extract_table_for_admission_ids(
-                db_cursor, hospital_admission_ids, module, table)
-
-        try:
-            detail_table = detail_tables[table]
-        except KeyError:
-            detail_table = None
-
-        if detail_table is not None:
-            if detail_table == "prescriptions":
-                detail_content = extract_table_for_admission_ids(db_cursor, hospital_admission_ids,
-                                                                 module, detail_table)
-                detail_content = detail_content[['pharmacy_id', 'drug_type', 'drug', 'gsn',
-                                                 'ndc', 'prod_strength', 'form_rx',
-                                                 'dose_val_rx', 'dose_unit_rx',
-                                                 'form_val_disp', 'form_unit_disp']]
-            else:
-                detail_content = extract_table(db_cursor, module, detail_table)
-            detail_foreign_key = detail_foreign_keys[detail_table]
-            if table.lower() == "hcpcsevents":
-                table_content.rename(columns={"hcpcs_cd":"code"}, inplace=True)
-            table_content = table_content.merge(detail_content,                    # type: ignore
-                                                on=detail_foreign_key, how="left")  # type: ignore
+    def extract_single_table(table_cursor: cursor, table: str) -> pd.DataFrame:
+        return extract_table_content(table_cursor, table, hospital_admission_ids,
+                                     chosen_activity_time, cohort, required_columns)
 
-        if chosen_activity_time is not None:
-            table_content = table_content.rename(columns={
-                chosen_activity_time[table][1]: "time:timestamp",
-                chosen_activity_time[table][0]: "concept:name"})
+    if db_pool is not None and len(table_list) > 1:
+        table_contents = map_with_pool(db_pool, extract_single_table, table_list)
+    else:
+        table_contents = [extract_single_table(db_cursor, table) for table in table_list]
 
+    final_log = pd.DataFrame()
+    for table_content in table_contents:
         final_log = pd.concat([final_log, table_content])
 
     return final_log
+
+
+def extract_table_content(db_cursor: cursor, table: str, hospital_admission_ids: np.ndarray,
+                          chosen_activity_time: Optional[dict], cohort: pd.DataFrame,
+                          required_columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Extracts a single table, merged with its detail table, with the chosen activity and
+    timestamp columns renamed
+    """
+    module = get_table_module(table)
+
+    try:
+        detail_table = detail_tables[table]
+    except KeyError:
+        detail_table = None
+
+    table_columns = None
+    detail_columns = None
+    if required_columns is not None and table.upper() not in ("ADMISSIONS", "ICUSTAYS"):
+        table_required_columns = list(required_columns)
+        if chosen_activity_time is not None:
+            table_required_columns += chosen_activity_time[table]
+        table_columns, detail_columns = get_table_projection(
+            db_cursor, module, table, detail_table, table_required_columns)
+
+    if module == "mimic_ed":
+        ed_stays = extract_emergency_department_stays_for_admission_ids(
+            db_cursor, hospital_admission_ids)
+        ed_stays = ed_stays[["subject_id", "hadm_id", "stay_id"]]
+        ed_stay_list = list(ed_stays["stay_id"])
+        table_content = extract_ed_table_for_ed_stays(
+            db_cursor, ed_stay_list, table, table_columns)
+        table_content = table_content.merge(
+            ed_stays, on=["stay_id", "subject_id"], how="inner")
+    elif table.upper() == "ADMISSIONS":
+        table_content = extract_admission_events(db_cursor, cohort, False)
+    elif table.upper() == "ICUSTAYS":
+        table_content = extract_icustay_events(db_cursor, cohort)
+    else:
+        table_content = extract_table_for_admission_ids(
+            db_cursor, hospital_admission_ids, module, table, table_columns)
+
+    if detail_table is not None:
+        if detail_table == "prescriptions":
+            detail_content = extract_table_for_admission_ids(
+                db_cursor, hospital_admission_ids, module, detail_table,
+                detail_columns if detail_columns is not None else prescription_detail_columns)
+        elif detail_table in subject_detail_tables:
+            detail_content = extract_table_for_subject_ids(
+                db_cursor, get_cohort_ids(table_content, "subject_id"), module,
+                detail_table, detail_columns)
+        elif detail_table in dictionary_tables:
+            detail_content = extract_dictionary_table(db_cursor, module, detail_table,
+                                                      detail_columns)
+        else:
+            detail_content = extract_table(db_cursor, module, detail_table, detail_columns)
+        detail_foreign_key = detail_foreign_keys[detail_table]
+        if table.lower() == "hcpcsevents":
+            table_content.rename(columns={"hcpcs_cd":"code"}, inplace=True)
+        table_content = table_content.merge(detail_content,                    # type: ignore
+                                            on=detail_foreign_key, how="left")  # type: ignore
+
+    if chosen_activity_time is not None:
+        table_content = table_content.rename(columns={
+            chosen_activity_time[table][1]: "time:timestamp",
+            chosen_activity_time[table][0]: "concept:name"})
+
+    return table_content
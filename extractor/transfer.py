@@ -2,6 +2,7 @@
 import logging
 import pandas as pd
 from psycopg2.extensions import cursor
+from extractor.id_sets import get_cohort_ids
 from .extraction_helper import (
     get_filename_string, extract_transfers_for_admission_ids)
 
@@ -17,9 +18,7 @@ def extract_transfer_events(db_cursor: cursor, cohort: pd.DataFrame,
 
     logger.info("Begin extracting transfer events!")
 
-    hospital_admission_ids = list(cohort["hadm_id"].unique())
-    hospital_admission_ids = [float(i) for i in hospital_admission_ids]
-    admission_ids = hospital_admission_ids
+    admission_ids = get_cohort_ids(cohort, "hadm_id")
 
     transfers = extract_transfers_for_admission_ids(db_cursor, admission_ids)
 
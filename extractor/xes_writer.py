@@ -0,0 +1,188 @@
+"""
+Provides a streaming XES exporter, which writes an event log data frame case by case without
+building a pm4py EventLog
+"""
+from datetime import datetime
+import gzip
+import logging
+import os
+import shutil
+from typing import IO, Any, Dict, Iterable, Optional, Tuple
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+
+from extractor.constants import XES_CHUNK_SIZE
+
+
+logger = logging.getLogger('cli')
+
+CASE_ATTRIBUTE_PREFIX = "case:"
+TRACE_ID_KEY = "concept:name"
+# extensions declared in the log header, like pm4py does for the concept: and time: columns
+XES_EXTENSIONS = [("Concept", "concept", "http://www.xes-standard.org/concept.xesext"),
+                  ("Time", "time", "http://www.xes-standard.org/time.xesext")]
+
+
+def to_xes_attribute(value: Any) -> Optional[Tuple[str, str]]:
+    """
+    Provides the XES type and serialized value of an attribute value, or None if the value is
+    missing. Values without XES type (like lists, dates and decimals) are serialized as
+    strings, like pm4py does.
+    """
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return "boolean", str(bool(value)).lower()
+    if isinstance(value, (int, np.integer)):
+        return "int", str(int(value))
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        return "float", str(float(value))
+    if isinstance(value, (datetime, np.datetime64)):
+        return "date", pd.Timestamp(value).isoformat()
+    if isinstance(value, str):
+        return "string", value
+    return "string", str(value)
+
+
+def format_attributes(attributes: Dict[str, Any], indent: str) -> str:
+    """
+    Serializes attributes to XES attribute elements, skipping missing values. Names
+    (concept:name) are always strings, as required by the concept extension.
+    """
+    lines = []
+    for key, value in attributes.items():
+        xes_attribute = to_xes_attribute(value)
+        if xes_attribute is None:
+            continue
+        xes_type, xes_value = xes_attribute
+        if key == TRACE_ID_KEY:
+            xes_type = "string"
+        lines.append(indent + "<" + xes_type + " key=" + quote(key) + " value=" +
+                     quote(xes_value) + " />\n")
+    return "".join(lines)
+
+
+def quote(value: str) -> str:
+    """Quotes and escapes an XML attribute value"""
+    return '"' + escape(value, {'"': "&quot;", "\n": "&#10;", "\r": "&#13;",
+                                "\t": "&#9;"}) + '"'
+
+
+class XesWriter:
+    """
+    Writes traces to an (optionally gzip compressed) XES file as they are provided, so that
+    only the current trace has to be held in memory. A fragment only contains the traces,
+    without log header and footer, and can be copied into a log with write_fragment.
+    """
+
+    def __init__(self, file_path: str, compress: bool = False, fragment: bool = False):
+        self.file_path = file_path
+        self.compress = compress
+        self.fragment = fragment
+        self.file: Optional[IO[str]] = None
+
+    def open(self) -> "XesWriter":
+        """Opens the file and writes the log header"""
+        if self.compress:
+            self.file = gzip.open(self.file_path, "wt", encoding="utf-8")
+        else:
+            self.file = open(self.file_path, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        if not self.fragment:
+            self.file.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+            self.file.write('<log xes.version="1849-2016" xes.features="nested-attributes" '
+                            'xmlns="http://www.xes-standard.org/">\n')
+            for name, prefix, uri in XES_EXTENSIONS:
+                self.file.write('\t<extension name="' + name + '" prefix="' + prefix +
+                                '" uri="' + uri + '" />\n')
+        return self
+
+    def write_fragment(self, fragment_path: str) -> None:
+        """Copies the traces of an uncompressed fragment into the log"""
+        assert self.file is not None, "XesWriter has to be opened before writing"
+        with open(fragment_path, "r", encoding="utf-8") as fragment:
+            shutil.copyfileobj(fragment, self.file)
+
+    def write_trace(self, trace_attributes: Dict[str, Any],
+                    events: Iterable[Dict[str, Any]]) -> None:
+        """Writes a trace with its attributes and events"""
+        assert self.file is not None, "XesWriter has to be opened before writing"
+        parts = ["\t<trace>\n", format_attributes(trace_attributes, "\t\t")]
+        for event in events:
+            parts.append("\t\t<event>\n")
+            parts.append(format_attributes(event, "\t\t\t"))
+            parts.append("\t\t</event>\n")
+        parts.append("\t</trace>\n")
+        self.file.write("".join(parts))
+
+    def write_events(self, events: pd.DataFrame, case_id_key: str) -> None:
+        """
+        Writes the events of a data frame as traces, grouped by the case id key in order of
+        the first occurrence of each case, like the pm4py event log conversion. Attributes
+        with the case: prefix become trace attributes (with the prefix removed), missing values
+        are omitted. Events without case id are skipped.
+        """
+        case_codes, case_ids = pd.factorize(events[case_id_key])
+        event_order = np.argsort(case_codes, kind="stable")
+        event_order = event_order[case_codes[event_order] >= 0]
+        if len(event_order) == 0:
+            return
+        case_boundaries = np.flatnonzero(np.diff(case_codes[event_order])) + 1
+        case_starts = np.insert(case_boundaries, 0, 0)
+        case_ends = np.append(case_boundaries, len(event_order))
+        columns = list(events.columns)
+        case_columns = [col for col in columns if col.startswith(CASE_ATTRIBUTE_PREFIX)]
+        event_columns = [col for col in columns if not col.startswith(CASE_ATTRIBUTE_PREFIX)]
+
+        chunk_start = 0
+        while chunk_start < len(case_starts):
+            chunk_end = chunk_start + 1
+            while chunk_end < len(case_starts) and \
+                    case_ends[chunk_end] - case_starts[chunk_start] <= XES_CHUNK_SIZE:
+                chunk_end += 1
+            offset = case_starts[chunk_start]
+            first_events = event_order[case_starts[chunk_start:chunk_end]]
+            case_records = events.iloc[first_events][case_columns].to_dict("records")
+            event_records = events.iloc[event_order[offset:case_ends[chunk_end - 1]]][
+                event_columns].to_dict("records")
+            for case_index in range(chunk_start, chunk_end):
+                trace_attributes = {key.replace(CASE_ATTRIBUTE_PREFIX, ""): value for key, value
+                                    in case_records[case_index - chunk_start].items()}
+                if to_xes_attribute(trace_attributes.get(TRACE_ID_KEY)) is None:
+                    trace_attributes[TRACE_ID_KEY] = case_ids[
+                        case_codes[first_events[case_index - chunk_start]]]
+                self.write_trace(trace_attributes,
+                                 event_records[case_starts[case_index] - offset:
+                                               case_ends[case_index] - offset])
+            chunk_start = chunk_end
+
+    def close(self) -> None:
+        """Writes the log footer and closes the file"""
+        if self.file is not None:
+            if not self.fragment:
+                self.file.write("</log>\n")
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> "XesWriter":
+        return self.open()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+def write_xes(events: pd.DataFrame, case_id_key: str, file_path: str,
+              compress: bool = False) -> None:
+    """Writes an event log data frame to an XES file, streaming it case by case"""
+    logger.info("Writing event log to %s", file_path)
+    with XesWriter(file_path, compress) as writer:
+        writer.write_events(events, case_id_key)
+
+
+def compress_file(file_path: str) -> None:
+    """Replaces a file with its gzip compressed version (with .gz appended to its name)"""
+    with open(file_path, "rb") as source, gzip.open(file_path + ".gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.remove(file_path)
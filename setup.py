@@ -10,6 +10,7 @@ requirements = [
     'pm4py==2.2.19.1',
     'psycopg2==2.9.3',
     'psycopg2-binary==2.9.3',
+    'pyarrow==7.0.0',
     'scikit-learn==1.0.2',
     'scipy==1.8.0',
     'SQLAlchemy==1.4.31',
@@ -26,7 +27,7 @@ setup(
     author='Finn Klessascheck, Jonas Cremerius',
     author_email='klessascheck@tu-berlin.de, jonas.cremerius@hpi.de',
     keywords='xes mimic event',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=requirements,
     extras_require={
         'dev': [
@@ -36,8 +37,12 @@ setup(
             'pandas-stubs==1.2.0.50',
             'data-science-types==0.2.23',
             'pylint==2.12.2',
+            'pytest==7.1.1',
             'types-psycopg2==2.9.8',
             'types-PyYAML==6.0.5'
+        ],
+        'profile': [
+            'pyinstrument==4.1.1'
         ]
     },
     include_package_data=True,
@@ -0,0 +1,71 @@
+"""
+Provides fixtures for tests against a local stand-in of the MIMIC-IV database. The stand-in is
+filled with synthetic data (see benchmarks.synthetic_mimic) at the start of the tests, and its
+schemas are dropped afterwards. Its database is given as libpq connection string in the
+MIMIC_TEST_DSN environment variable, tests using it are skipped without.
+
+    MIMIC_TEST_DSN="dbname=scratch user=postgres" python3 -m pytest tests
+"""
+import os
+from typing import Iterator
+import psycopg2
+import pytest
+from psycopg2.extensions import connection, cursor
+
+from benchmarks.synthetic_mimic import TableGenerator, create_tables, load_table, schemas
+
+
+STAND_IN_PATIENTS = 600
+
+# columns of the stand-in tables, which are indexed like the id columns of a MIMIC database
+indexed_columns = ["hadm_id", "subject_id", "stay_id", "poe_id", "pharmacy_id", "emar_id"]
+
+
+@pytest.fixture(name="stand_in_dsn", scope="session")
+def fixture_stand_in_dsn() -> str:
+    """Connection string of the stand-in database"""
+    dsn = os.environ.get("MIMIC_TEST_DSN")
+    if not dsn:
+        pytest.skip("MIMIC_TEST_DSN is not set")
+    return dsn
+
+
+@pytest.fixture(name="stand_in_connection", scope="session")
+def fixture_stand_in_connection(stand_in_dsn: str) -> Iterator[connection]:
+    """
+    Connection to the stand-in. Its tables are committed, so that they can be read on other
+    connections (e.g. of a connection pool), and dropped after the tests.
+    """
+    db_connection = psycopg2.connect(stand_in_dsn)
+    with db_connection.cursor() as db_cursor:
+        try:
+            create_tables(db_cursor, False)
+        except SystemExit as error:
+            db_connection.close()
+            pytest.skip("stand-in needs a database without MIMIC schemas: " + str(error))
+        tables = TableGenerator(STAND_IN_PATIENTS, 1.0, 0).generate()
+        for table, content in tables.items():
+            load_table(db_cursor, table, content)
+            for column in indexed_columns:
+                if column in content.columns:
+                    db_cursor.execute("create index on " + table + " (" + column + ")")
+            db_cursor.execute("analyze " + table)
+    db_connection.commit()
+    try:
+        yield db_connection
+    finally:
+        db_connection.rollback()
+        with db_connection.cursor() as db_cursor:
+            for schema in schemas:
+                db_cursor.execute("drop schema " + schema + " cascade")
+        db_connection.commit()
+        db_connection.close()
+
+
+@pytest.fixture(name="stand_in_cursor")
+def fixture_stand_in_cursor(stand_in_connection: connection) -> Iterator[cursor]:
+    """Cursor on the stand-in, whose changes are rolled back after every test"""
+    with stand_in_connection.cursor() as db_cursor:
+        db_cursor.execute("savepoint stand_in_test")
+        yield db_cursor
+        db_cursor.execute("rollback to savepoint stand_in_test")
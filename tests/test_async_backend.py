@@ -0,0 +1,49 @@
+"""
+Tests that the async backend extracts the same log as the serial extraction
+"""
+import pandas as pd
+from psycopg2.extensions import cursor
+from psycopg2.pool import ThreadedConnectionPool
+
+from extractor.cohort import extract_cohort_for_ids
+from extractor.constants import ADMISSION_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.pipeline import ExtractionSettings, extract_cohort_log
+
+
+furosemide_spec = {"start_column": "time:timestamp", "end_column": "outtime",
+                   "time_column": "starttime", "table_to_aggregate": "pharmacy",
+                   "column_to_aggregate": ["pharmacy_id"], "aggregation_method": "count",
+                   "filter_column": "medication", "filter_values": ["Furosemide"]}
+
+glucose_spec = {"start_column": "time:timestamp", "end_column": "outtime",
+                "time_column": "charttime", "table_to_aggregate": "labevents",
+                "column_to_aggregate": ["valuenum"], "aggregation_method": "mean",
+                "filter_column": "itemid", "filter_values": None}
+
+
+def test_async_backend_matches_serial(stand_in_cursor: cursor, stand_in_dsn: str):
+    """Case attributes, events and prefetched attribute tables run on a pool shared by runs"""
+    stand_in_cursor.execute("select hadm_id from mimic_core.admissions order by hadm_id "
+                            "limit 40")
+    hadm_ids = ",".join(str(row[0]) for row in stand_in_cursor.fetchall())
+    cohort = extract_cohort_for_ids(stand_in_cursor, None, hadm_ids, False)
+    settings = ExtractionSettings(
+        db_settings=("", "", "", ""), case_notion=ADMISSION_CASE_NOTION,
+        case_attribute_list=["admission_type", "insurance", "age", "gender"],
+        event_type=TRANSFER_EVENT_TYPE, additional_attributes=[furosemide_spec, glucose_spec])
+    serial_log, serial_key, _ = extract_cohort_log(stand_in_cursor, cohort, settings)
+
+    stage_pool = ThreadedConnectionPool(1, 4, stand_in_dsn)
+    try:
+        async_settings = settings._replace(use_async_backend=True)
+        for shard in [cohort.iloc[:20], cohort.iloc[20:]]:
+            shard_log, async_key, _ = extract_cohort_log(stand_in_cursor, shard,
+                                                         async_settings,
+                                                         stage_pool=stage_pool)
+            assert async_key == serial_key
+            expected_log = serial_log[serial_log[serial_key].isin(shard["hadm_id"])]
+            pd.testing.assert_frame_equal(shard_log.reset_index(drop=True),
+                                          expected_log.reset_index(drop=True))
+        assert not stage_pool.closed
+    finally:
+        stage_pool.closeall()
@@ -0,0 +1,40 @@
+"""
+Tests that the compiled cohort query selects the same cohort as the in-memory reference
+"""
+from typing import List, Optional
+import pandas as pd
+import pytest
+from psycopg2.extensions import cursor
+
+from extractor.cohort import extract_cohort, extract_cohort_in_memory
+
+
+def sort_cohort(cohort: pd.DataFrame) -> pd.DataFrame:
+    """Sorts the rows of a cohort, which the cohort extractions return in any order"""
+    sort_columns = [col for col in ["hadm_id", "drg_type", "drg_code"] if col in cohort.columns]
+    return cohort.sort_values(sort_columns).reset_index(drop=True)
+
+
+@pytest.mark.parametrize(
+    "icd_codes, icd_version, icd_seq_num, drg_codes, drg_type, ages, icd_codes_intersection",
+    [(["I50", "4282"], 0, 3, None, None, None, None),
+     (["I50:I58", "428:429"], 10, 2, None, None, None, None),
+     (["410:414", "E11"], 9, 10, None, None, None, None),
+     (["I50", "428"], 0, 10, None, None, None, ["E11", "250"]),
+     (None, None, None, ["194", "190", "720"], "APR", None, None),
+     (None, None, None, ["194", "140"], "HCFA", ["18:40", "70:90"], None),
+     (["I50:I52"], 0, 5, ["194", "190", "720", "140"], "HCFA", ["40:80"], ["E11"])])
+def test_cohort_query_matches_in_memory(stand_in_cursor: cursor,
+                                        icd_codes: Optional[List[str]],
+                                        icd_version: Optional[int],
+                                        icd_seq_num: Optional[int],
+                                        drg_codes: Optional[List[str]],
+                                        drg_type: Optional[str], ages: Optional[List[str]],
+                                        icd_codes_intersection: Optional[List[str]]):
+    """ICD prefixes and ranges, their intersection, DRG codes and ages select the same rows"""
+    filters = (icd_codes, icd_version, icd_seq_num, drg_codes, drg_type, ages,
+               icd_codes_intersection, False)
+    in_database = sort_cohort(extract_cohort(stand_in_cursor, *filters))
+    in_memory = sort_cohort(extract_cohort_in_memory(stand_in_cursor, *filters))
+    assert len(in_database) > 0
+    pd.testing.assert_frame_equal(in_database, in_memory, check_dtype=False)
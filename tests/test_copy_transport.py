@@ -0,0 +1,39 @@
+"""
+Tests that the COPY transport provides the same data frames as the cursor transport
+"""
+from datetime import date
+from decimal import Decimal
+import pandas as pd
+from psycopg2.extensions import cursor
+
+from extractor.copy_transport import copy_query_to_dataframe
+from extractor.extraction_helper import concat_dataframe_batches, fetch_dataframe_batches
+
+
+def assert_same_transport(db_cursor: cursor, sql_query: str) -> pd.DataFrame:
+    """Asserts that a query gives the same result via COPY and via cursor fetches"""
+    copied = copy_query_to_dataframe(db_cursor, sql_query)
+    fetched = concat_dataframe_batches(fetch_dataframe_batches(db_cursor, sql_query))
+    assert copied is not None
+    pd.testing.assert_frame_equal(copied, fetched)
+    return copied
+
+
+def test_copy_matches_cursor_types(stand_in_cursor: cursor):
+    """Arrays, numeric, dates, empty strings and NULLs are parsed like cursor results"""
+    table = assert_same_transport(stand_in_cursor, """select * from (values
+        (1, 1.5::numeric, date '2150-02-01', '', array['I21', 'I22'], array[1, null]),
+        (2, null, null, null, null, array[]::int[])) as t(id, amount, dod, note, codes, ids)""")
+    assert table["amount"].tolist() == [Decimal("1.5"), None]
+    assert table["dod"].tolist() == [date(2150, 2, 1), None]
+    assert table["note"].tolist() == ["", None]
+    assert table["codes"].tolist() == [["I21", "I22"], None]
+    assert table["ids"].tolist() == [[1, None], []]
+
+
+def test_copy_matches_cursor_cohort_codes(stand_in_cursor: cursor):
+    """The icd codes the cohort aggregates per admission arrive as lists"""
+    table = assert_same_transport(stand_in_cursor, """select hadm_id,
+        array_agg(icd_code order by seq_num) as icd_code from mimic_hosp.diagnoses_icd
+        group by hadm_id order by hadm_id""")
+    assert all(isinstance(codes, list) for codes in table["icd_code"])
@@ -0,0 +1,65 @@
+"""
+Tests that the id restricted extraction queries can use the id indexes of the database
+"""
+from typing import Any, Dict, List, Set
+import pandas as pd
+import pytest
+from psycopg2.extensions import cursor
+
+from extractor.extraction_helper import build_sql_query
+from extractor.id_sets import get_cohort_ids, id_set_filters, stage_id_set
+
+
+admission_tables = ["mimic_core.admissions", "mimic_core.transfers",
+                    "mimic_hosp.diagnoses_icd", "mimic_hosp.labevents", "mimic_hosp.poe",
+                    "mimic_icu.chartevents"]
+
+
+def get_plan_nodes(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Provides a node of a query plan and all of its descendants"""
+    return [plan] + [node for child in plan.get("Plans", []) for node in get_plan_nodes(child)]
+
+
+def get_scans(db_cursor: cursor, sql_query: str, params: Any, table_name: str) -> Set[str]:
+    """Provides the scan types the plan of a query uses for a table"""
+    db_cursor.execute("explain (format json) " + sql_query, params)
+    plan = db_cursor.fetchone()[0][0]["Plan"]  # type: ignore
+    nodes = get_plan_nodes(plan)
+    scans = {node["Node Type"] for node in nodes if node.get("Relation Name") == table_name}
+    if "Bitmap Heap Scan" in scans:
+        scans |= {node["Node Type"] for node in nodes
+                  if node.get("Index Name", "").startswith(table_name + "_")}
+    return scans
+
+
+def get_cohort(db_cursor: cursor, size: int) -> pd.DataFrame:
+    """Provides a cohort of the first admissions of the stand-in"""
+    db_cursor.execute("select hadm_id from mimic_core.admissions order by hadm_id limit %s",
+                      (size,))
+    return pd.DataFrame(db_cursor.fetchall(), columns=["hadm_id"])
+
+
+@pytest.mark.parametrize("table", admission_tables)
+def test_id_array_uses_index(stand_in_cursor: cursor, table: str):
+    """The ids of a cohort are bound as bigint array, which uses the hadm_id index"""
+    module, table_name = table.split(".")
+    hadm_ids = get_cohort_ids(get_cohort(stand_in_cursor, 5), "hadm_id")
+    filters = list(id_set_filters(stand_in_cursor, "hadm_id", hadm_ids))
+    assert len(filters) == 1 and filters[0][0] is None
+    scans = get_scans(stand_in_cursor, build_sql_query(module, table_name, "hadm_id"),
+                      filters[0][1], table_name)
+    assert "Seq Scan" not in scans
+    assert scans & {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
+
+
+@pytest.mark.parametrize("table", admission_tables)
+def test_staged_id_set_uses_index(stand_in_cursor: cursor, table: str):
+    """Ids staged in a temporary table are joined using the hadm_id index"""
+    module, table_name = table.split(".")
+    hadm_ids = get_cohort_ids(get_cohort(stand_in_cursor, 5), "hadm_id")
+    id_table = stage_id_set(stand_in_cursor, "hadm_id", hadm_ids.tolist())
+    assert id_table is not None
+    scans = get_scans(stand_in_cursor, build_sql_query(module, table_name, "hadm_id", id_table),
+                      None, table_name)
+    assert "Seq Scan" not in scans
+    assert scans & {"Index Scan", "Index Only Scan", "Bitmap Index Scan"}
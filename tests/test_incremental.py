@@ -0,0 +1,38 @@
+"""
+Tests that an incremental extraction provides the same log as a non-incremental extraction
+"""
+from typing import List
+import pandas as pd
+import pytest
+from psycopg2.extensions import cursor
+
+from extractor import result_store
+from extractor.cohort import extract_cohort_for_ids
+from extractor.constants import ADMISSION_CASE_NOTION, ADMISSION_EVENT_TYPE, \
+    POE_EVENT_TYPE, SUBJECT_CASE_NOTION, TRANSFER_EVENT_TYPE
+from extractor.pipeline import ExtractionSettings, extract_cohort_log
+
+
+@pytest.mark.parametrize("case_notion, case_attributes, event_type", [
+    (ADMISSION_CASE_NOTION, ["admission_type", "insurance"], TRANSFER_EVENT_TYPE),
+    (SUBJECT_CASE_NOTION, ["gender", "anchor_age"], ADMISSION_EVENT_TYPE),
+    (ADMISSION_CASE_NOTION, ["admission_type", "insurance"], POE_EVENT_TYPE)])
+def test_incremental_log_matches_extraction(stand_in_cursor: cursor, tmp_path, monkeypatch,
+                                            case_notion: str, case_attributes: List[str],
+                                            event_type: str):
+    """Stored and freshly extracted admissions are assembled in the order of the extraction"""
+    monkeypatch.setattr(result_store, "RESULT_STORE_DIR", str(tmp_path))
+    stand_in_cursor.execute("select hadm_id from mimic_core.admissions order by hadm_id "
+                            "limit 30")
+    hadm_ids = ",".join(str(row[0]) for row in stand_in_cursor.fetchall())
+    cohort = extract_cohort_for_ids(stand_in_cursor, None, hadm_ids, False)
+    settings = ExtractionSettings(
+        db_settings=("", "", "", ""), case_notion=case_notion,
+        case_attribute_list=case_attributes, event_type=event_type,
+        additional_attributes=[])
+    extracted_log, _, _ = extract_cohort_log(stand_in_cursor, cohort, settings)
+
+    incremental_settings = settings._replace(incremental=True)
+    extract_cohort_log(stand_in_cursor, cohort.iloc[::2], incremental_settings)
+    incremental_log, _, _ = extract_cohort_log(stand_in_cursor, cohort, incremental_settings)
+    pd.testing.assert_frame_equal(incremental_log, extracted_log.reset_index(drop=True))
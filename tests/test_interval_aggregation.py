@@ -0,0 +1,47 @@
+"""
+Tests that event attributes aggregated in the database match the attributes aggregated in pandas
+"""
+from typing import List, Optional
+import pandas as pd
+import pytest
+from psycopg2.extensions import cursor
+
+from extractor import event_attributes
+from extractor.cohort import extract_cohort_for_ids
+from extractor.event_attributes import extract_event_attribute_specs
+from extractor.transfer import extract_transfer_events
+
+
+@pytest.mark.parametrize("filter_column, filter_values", [
+    (None, None), ("priority", ["ROUTINE", "STAT"]), ("priority", None)])
+@pytest.mark.parametrize("aggregation_method", ["mean", "median", "sum", "count", "first"])
+def test_database_aggregation_matches_pandas(stand_in_cursor: cursor, monkeypatch,
+                                             aggregation_method: str,
+                                             filter_column: Optional[str],
+                                             filter_values: Optional[List[str]]):
+    """Log events sharing an interval count the events of the interval once in both modes"""
+    # first is only defined up to events of an admission at the same time
+    stand_in_cursor.execute("""delete from mimic_hosp.labevents as later
+        using mimic_hosp.labevents as earlier where later.hadm_id = earlier.hadm_id
+        and later.charttime = earlier.charttime and later.labevent_id > earlier.labevent_id""")
+    stand_in_cursor.execute("select hadm_id from mimic_core.admissions order by hadm_id "
+                            "limit 40")
+    hadm_ids = ",".join(str(row[0]) for row in stand_in_cursor.fetchall())
+    cohort = extract_cohort_for_ids(stand_in_cursor, None, hadm_ids, False)
+    log = extract_transfer_events(stand_in_cursor, cohort, False)
+    log = pd.concat([log, log.iloc[::3]], ignore_index=True)
+    attribute_spec = {"start_column": "time:timestamp", "end_column": "outtime",
+                      "time_column": "charttime", "table_to_aggregate": "labevents",
+                      "column_to_aggregate": ["valuenum"],
+                      "aggregation_method": aggregation_method,
+                      "filter_column": filter_column, "filter_values": filter_values}
+
+    pandas_log = extract_event_attribute_specs(stand_in_cursor, log.copy(), [attribute_spec])
+    assert pandas_log.filter(like="valuenum").count().sum() > 0
+
+    def fail_fallback(*_args, **_kwargs):
+        raise AssertionError("labevents was not aggregated in the database")
+    monkeypatch.setattr(event_attributes, "aggregate_table", fail_fallback)
+    database_log = extract_event_attribute_specs(stand_in_cursor, log.copy(), [attribute_spec],
+                                                 aggregate_in_database=True)
+    pd.testing.assert_frame_equal(database_log, pandas_log, check_dtype=False)
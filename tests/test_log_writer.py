@@ -0,0 +1,30 @@
+"""
+Tests that a csv log written in parts reads back like the log written at once
+"""
+import os
+import pandas as pd
+
+from extractor import log_writer
+from extractor.log_writer import EventLogWriter, write_log_part
+
+
+def test_csv_parts_match_whole_log(tmp_path, monkeypatch):
+    """Rows are numbered across parts and columns of later parts are added to the log"""
+    monkeypatch.setattr(log_writer, "OUTPUT_DIR", str(tmp_path) + os.sep)
+    first_part = pd.DataFrame({"case:hadm_id": [1, 1], "concept:name": ["a", "b, c"]})
+    second_part = pd.DataFrame({"case:hadm_id": [2], "concept:name": ["d\ne"],
+                                "valuenum": [1.5]})
+    third_part = pd.DataFrame({"case:hadm_id": [3], "valuenum": [2.5],
+                               "concept:name": ["f"]})
+
+    writer = EventLogWriter("csv", sharded=True)
+    writer.write(first_part, "case:hadm_id")
+    writer.append_part(write_log_part(second_part, "case:hadm_id", "csv",
+                                      os.path.join(str(tmp_path), "shard-00002")))
+    writer.write(third_part, "case:hadm_id")
+    writer.close()
+
+    assert writer.file_path is not None
+    written_log = pd.read_csv(writer.file_path, index_col=0)
+    whole_log = pd.concat([first_part, second_part, third_part], ignore_index=True)
+    pd.testing.assert_frame_equal(written_log, whole_log)
@@ -0,0 +1,33 @@
+"""
+Tests that the medications joined in the database match the medications merged in pandas
+"""
+import numpy as np
+import pandas as pd
+from psycopg2.extensions import cursor
+
+from extractor.extraction_helper import extract_medications_for_admission_ids
+from extractor.poe import extract_medications_in_memory
+
+
+def test_medications_keep_first_prescription(stand_in_cursor: cursor):
+    """Pharmacy orders with several prescriptions keep the same prescription in both paths"""
+    stand_in_cursor.execute("""select pharmacy_id, hadm_id from mimic_hosp.pharmacy
+        where poe_id is not null order by pharmacy_id limit 20""")
+    rows = stand_in_cursor.fetchall()
+    duplicated_ids = [row[0] for row in rows]
+    for suffix in ["B", "C"]:
+        stand_in_cursor.execute("""insert into mimic_hosp.prescriptions
+            select subject_id, hadm_id, pharmacy_id, starttime, stoptime, drug_type,
+            drug || ' ' || %s, gsn, ndc, prod_strength, form_rx, dose_val_rx, dose_unit_rx,
+            form_val_disp, form_unit_disp, doses_per_24_hrs, route
+            from mimic_hosp.prescriptions where pharmacy_id = any(%s)""",
+                                (suffix, duplicated_ids))
+    hadm_ids = np.unique([row[1] for row in rows])
+
+    columns = ["poe_id", "pharmacy_id", "drug", "emar_seq"]
+    in_database = extract_medications_for_admission_ids(stand_in_cursor, hadm_ids)
+    in_memory = extract_medications_in_memory(stand_in_cursor, hadm_ids)
+    in_database = in_database[columns].sort_values("poe_id").reset_index(drop=True)
+    in_memory = in_memory[columns].sort_values("poe_id").reset_index(drop=True)
+    pd.testing.assert_frame_equal(in_database, in_memory, check_dtype=False)
+    assert not in_database["drug"].str.contains(" [BC]$").any()
@@ -0,0 +1,25 @@
+"""
+Tests that profiled queries are only run a second time if they are analyzed
+"""
+import pytest
+from psycopg2.extensions import cursor
+
+from extractor.extraction_helper import read_sql_dataframe
+from extractor.profiling import configure_profiling, profile_state
+
+
+@pytest.mark.parametrize("analyze, runs", [(False, 1), (True, 2)])
+def test_profiled_query_runs(stand_in_cursor: cursor, analyze: bool, runs: int):
+    """Without analyze, the row width is explained without running the query again"""
+    stand_in_cursor.execute("create temporary sequence profiled_runs")
+    configure_profiling(True, analyze=analyze)
+    try:
+        table = read_sql_dataframe(stand_in_cursor, "select nextval('profiled_runs') as run")
+        query_record = profile_state["queries"][-1]
+    finally:
+        configure_profiling(False)
+    stand_in_cursor.execute("select last_value from profiled_runs")
+    assert stand_in_cursor.fetchone()[0] == runs  # type: ignore
+    assert table["run"].tolist() == [1]
+    assert query_record["bytes"] is not None
+    assert (query_record["server_seconds"] is not None) == analyze
@@ -0,0 +1,57 @@
+"""
+Tests that the streaming XES writer provides the same log as the pm4py XES export
+"""
+from datetime import date
+from decimal import Decimal
+import os
+from typing import Any, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+from pm4py.objects.conversion.log import converter as log_converter  # type: ignore
+from pm4py.objects.log.exporter.xes import exporter as xes_exporter  # type: ignore
+from pm4py.objects.log.importer.xes import importer as xes_importer  # type: ignore
+
+from extractor.xes_writer import write_xes
+
+
+def read_xes(file_path: str) -> Tuple[Dict[str, Any], List[Tuple[Dict[str, Any],
+                                                                  List[Dict[str, Any]]]]]:
+    """Reads an XES file with pm4py and provides its extensions and traces"""
+    log = xes_importer.apply(file_path, parameters={"show_progress_bar": False})
+    traces = [(dict(trace.attributes), [dict(event) for event in trace]) for trace in log]
+    return dict(log.extensions), traces
+
+
+def test_xes_matches_pm4py_export(tmp_path):
+    """Lists, dates, decimals and integer names are read back like the pm4py export"""
+    events = pd.DataFrame({
+        "case:hadm_id": [20000001, 20000001, 20000002],
+        "case:icd_code": [["I21", "I22"], ["I21", "I22"], ["I50"]],
+        "case:dod": [date(2150, 2, 1), date(2150, 2, 1), None],
+        "case:amount": [Decimal("1.50"), Decimal("1.50"), None],
+        "case:flag": [True, True, False],
+        "concept:name": ["Admission", 'Transfer "ICU"', 7],
+        "time:timestamp": pd.to_datetime(["2150-01-01 10:00", "2150-01-02", "2150-01-03"]),
+        "valuenum": [1.5, 2.0, 3.0],
+        "itemid": np.array([1, 2, 3], dtype=np.int64),
+        "note": ["x<y", "", None]})
+    streamed_path = os.path.join(str(tmp_path), "streamed.xes")
+    exported_path = os.path.join(str(tmp_path), "exported.xes")
+
+    write_xes(events, "case:hadm_id", streamed_path)
+    parameters = {log_converter.Variants.TO_EVENT_LOG.value.Parameters.CASE_ID_KEY:
+                  "case:hadm_id",
+                  log_converter.Variants.TO_EVENT_LOG.value.Parameters.CASE_ATTRIBUTE_PREFIX:
+                  "case:"}
+    event_log = log_converter.apply(events, parameters=parameters,
+                                    variant=log_converter.Variants.TO_EVENT_LOG)
+    xes_exporter.apply(event_log, exported_path, parameters={"show_progress_bar": False})
+
+    streamed_extensions, streamed_traces = read_xes(streamed_path)
+    exported_extensions, exported_traces = read_xes(exported_path)
+    assert streamed_extensions == exported_extensions
+    assert streamed_traces == exported_traces
+    assert streamed_traces[0][0]["icd_code"] == "['I21', 'I22']"
+    assert streamed_traces[0][0]["dod"] == "2150-02-01"
+    assert streamed_traces[1][0]["concept:name"] == "20000002"
+    assert streamed_traces[1][1][0]["concept:name"] == "7"